@@ -8,24 +8,339 @@ import json        # Per serializzare/deserializzare dati
 import time        # Per timestamp e timeout
 import sys         # Funzioni di sistema
 import hashlib     # Per hash SHA-256
+import hmac        # Per l'autenticazione dei messaggi cifrati con la chiave di sessione
+import zlib        # Compressione dei messaggi prima della cifratura RSA a blocchi
+import base64      # Per trasportare i dati binari nei messaggi JSON
 import pickle      # Per serializzare oggetti Python
+import sqlite3     # Archivio degli utenti registrati (SQLite in modalità WAL)
 import os          # Per operazioni sui file
+import re          # Validazione dei campi delle offerte di file
+import multiprocessing  # Per la ricerca parallela dei numeri primi
+import contextlib  # Per i context manager dei lock su file
+import struct      # Per il formato binario del file della chiave del server
+import queue       # Code tra thread
+import collections # deque per le code di uscita dei client
+import heapq       # Min-heap delle scadenze delle sessioni
+import bisect      # Bucket degli istogrammi di latenza
+import http.server # Endpoint HTTP delle metriche
+import cProfile    # Profilazione opzionale del server
+import pstats      # Unione dei profili dei singoli thread
+import tracemalloc # Snapshot della memoria in profilazione
+import asyncio     # Per la modalità server asincrona
+import argparse    # Per l'uso da riga di comando
+import tempfile    # Directory temporanee per i benchmark
+import io          # Per silenziare l'output durante i benchmark
+import types       # Oggetti semplici nei benchmark
+import platform    # Descrizione della macchina nei risultati dei benchmark
+import string      # Alfabeto dei testi casuali dei benchmark
+from concurrent.futures import ThreadPoolExecutor  # Pool di thread per il fan-out dei broadcast
+try:
+    import fcntl   # Lock tra processi sul file del pool di chiavi (solo POSIX)
+except ImportError:
+    fcntl = None
 from typing import Dict, Optional, Tuple  # Type hints
 
 
+def _small_primes(limit):
+    """Primi dispari minori di limit (crivello di Eratostene)"""
+    is_prime = bytearray([1]) * limit
+    is_prime[0:2] = b'\x00\x00'
+    for i in range(2, int(limit ** 0.5) + 1):
+        if is_prime[i]:
+            is_prime[i * i::i] = bytes(len(range(i * i, limit, i)))
+    return [i for i in range(3, limit) if is_prime[i]]
+
+
+SMALL_PRIMES = _small_primes(2048)  # Tabella per il crivello dei candidati primi
+
+
+class RSAKeyContext:
+    """
+    Contesto precalcolato per una chiave RSA, costruito una sola volta per chiave.
+    Contiene le tabelle delle finestre degli esponenti, la lunghezza in byte del
+    modulo e la dimensione massima di un blocco di testo in chiaro.
+    """
+    
+    def __init__(self, key):
+        self.key = key
+        self.n = key[1]
+        self.byte_length = (self.n.bit_length() + 7) // 8         # Byte del modulo
+        self.max_block_size = (self.n.bit_length() - 1) // 8 - 1  # Byte massimi per blocco
+        self.is_crt = len(key) == 7                               # Chiave privata estesa?
+        
+        if self.is_crt:
+            d, n, p, q, dP, dQ, qInv = key
+            self.p, self.q, self.qInv = p, q, qInv
+            self.windows_p = self.build_windows(dP)               # Finestre per c^dP mod p
+            self.windows_q = self.build_windows(dQ)               # Finestre per c^dQ mod q
+        else:
+            self.windows = self.build_windows(key[0])             # Finestre per e oppure d
+    
+    @staticmethod
+    def window_size(exponent_bits):
+        """Sceglie la larghezza della finestra in base alla dimensione dell'esponente"""
+        if exponent_bits <= 8:
+            return 1
+        if exponent_bits <= 64:
+            return 3
+        if exponent_bits <= 256:
+            return 4
+        if exponent_bits <= 768:
+            return 5
+        return 6
+    
+    @classmethod
+    def build_windows(cls, exponent):
+        """
+        Ricodifica l'esponente a finestre scorrevoli (dal bit più significativo).
+        Ritorna (larghezza, [(quadrature, cifra dispari), ...], quadrature finali).
+        """
+        bits = bin(exponent)[2:]
+        width = cls.window_size(len(bits))
+        windows = []
+        pending_squarings = 0
+        i = 0
+        
+        while i < len(bits):
+            if bits[i] == '0':                      # Gli zeri costano solo una quadratura
+                pending_squarings += 1
+                i += 1
+                continue
+            
+            j = min(i + width, len(bits))           # Finestra di al massimo 'width' bit...
+            while bits[j - 1] == '0':               # ...che termina con un bit a 1
+                j -= 1
+            
+            windows.append((pending_squarings + (j - i), int(bits[i:j], 2)))
+            pending_squarings = 0
+            i = j
+        
+        return width, windows, pending_squarings
+    
+    @staticmethod
+    def windowed_exponentiation(base, windows, modulus):
+        """Esponenziazione modulare a finestre scorrevoli con tabella delle potenze dispari"""
+        if modulus == 1:
+            return 0
+        
+        width, steps, trailing_squarings = windows
+        if not steps:                               # Esponente 0
+            return 1
+        
+        # Tabella delle potenze dispari: base^1, base^3, ..., base^(2^width - 1)
+        base = base % modulus
+        table = [base]
+        if width > 1:
+            base_squared = (base * base) % modulus
+            for _ in range((1 << (width - 1)) - 1):
+                table.append((table[-1] * base_squared) % modulus)
+        
+        first_squarings, first_digit = steps[0]
+        result = table[first_digit >> 1]            # Il primo passo parte da 1: niente quadrature
+        
+        for squarings, digit in steps[1:]:
+            for _ in range(squarings):
+                result = (result * result) % modulus
+            result = (result * table[digit >> 1]) % modulus
+        
+        for _ in range(trailing_squarings):
+            result = (result * result) % modulus
+        
+        return result
+    
+    def apply(self, value):
+        """Applica la chiave: value^e mod n (pubblica) oppure value^d mod n (privata)"""
+        if not self.is_crt:
+            return self.windowed_exponentiation(value, self.windows, self.n)
+        
+        # Due esponenziazioni su moduli di metà dimensione invece di una su n
+        m1 = self.windowed_exponentiation(value % self.p, self.windows_p, self.p)
+        m2 = self.windowed_exponentiation(value % self.q, self.windows_q, self.q)
+        
+        # Ricombinazione di Garner: m = m2 + q * (qInv * (m1 - m2) mod p)
+        h = (self.qInv * (m1 - m2)) % self.p
+        return m2 + h * self.q
+
+
 class RSAKeyGenerator:
-    def __init__(self, bits=1024):
+    def __init__(self, bits=1024, public_exponent=65537, workers=1, sieve_window=4096,
+                 compression_threshold=256):
         self.bits = bits          # Dimensione della chiave in bits (default 1024)
+        # Processi per la ricerca dei primi (1 = ricerca seriale, None = tutti i core)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        # Candidati dispari consecutivi setacciati per ogni punto di partenza (0 = ricerca casuale)
+        self.sieve_window = sieve_window
+        self.prime_stats = {'primes': 0, 'candidates': 0, 'sieved_out': 0, 'primality_tests': 0}
+        self._prime_stats_lock = threading.Lock()   # Più thread possono cercare primi insieme
+        # Esponente pubblico fisso (65537 di default); None = esponente casuale (vecchio metodo)
+        if public_exponent is not None and (public_exponent < 3 or public_exponent % 2 == 0):
+            raise ValueError("L'esponente pubblico deve essere dispari e almeno 3")
+        self.public_exponent = public_exponent
+        self.max_contexts = 1024  # Numero massimo di contesti di chiave in cache
+        self._contexts: Dict[Tuple[int, ...], RSAKeyContext] = {}
+        self._contexts_lock = threading.Lock()
+        # Testi da almeno questo numero di byte vengono compressi prima della cifratura (None = mai)
+        self.compression_threshold = compression_threshold
+        self.compression_stats = {'messages': 0, 'compressed': 0, 'blocks_plain': 0, 'blocks_sent': 0}
+        self._compression_lock = threading.Lock()
+    
+    def get_key_context(self, key) -> RSAKeyContext:
+        """Ritorna il contesto precalcolato della chiave, creandolo al primo utilizzo"""
+        key = tuple(key)  # Le chiavi ricevute via JSON arrivano come liste
+        context = self._contexts.get(key)
+        if context is None:
+            context = RSAKeyContext(key)
+            with self._contexts_lock:
+                if len(self._contexts) >= self.max_contexts:  # Scarta il contesto più vecchio
+                    self._contexts.pop(next(iter(self._contexts)))
+                self._contexts[key] = context
+        return context
     
     def _is_prime(self, n: int) -> bool:
         return sympy.isprime(n)     # Usa sympy per verificare se n è primo
 
-    def generate_prime(self):
+    def generate_prime(self, should_stop=None):
         """Genera un numero primo casuale di dimensione specificata"""
+        if self.sieve_window:
+            return self._generate_prime_sieved(should_stop)
+        
         while True:
+            if should_stop and should_stop():   # Ricerca annullata (modalità parallela)
+                return None
             p = random.getrandbits(self.bits) # Genera numero casuale di self.bits bits
             p |= (1 << (self.bits - 1)) | 1 # Imposta MSB e LSB a 1 (numero dispari)
+            self._record_prime_stats(candidates=1, primality_tests=1)
             if self._is_prime(p):       # Verifica se è primo
+                self._record_prime_stats(primes=1)
+                return p
+
+    def _generate_prime_sieved(self, should_stop=None):
+        """
+        Ricerca incrementale: parte da un numero dispari casuale e setaccia una
+        finestra di candidati successivi con la tabella dei piccoli primi. Il test
+        di primalità completo viene eseguito solo sui sopravvissuti.
+        """
+        window = self.sieve_window
+        ones = b'\x01' * window
+        
+        while True:
+            start = random.getrandbits(self.bits)
+            start |= (1 << (self.bits - 1)) | 1     # Imposta MSB e LSB a 1 (numero dispari)
+            # Solo i candidati che restano di self.bits bit: start + 2i < 2^bits
+            limit = min(window, ((1 << self.bits) + 1 - start) // 2)
+            
+            # composite[i] = 1 se start + 2*i è divisibile per un piccolo primo
+            composite = bytearray(limit)
+            for small_prime in SMALL_PRIMES:
+                # start + 2i ≡ 0 (mod sp)  <=>  i ≡ -start * 2^-1 (mod sp)
+                i = ((small_prime - start % small_prime) * ((small_prime + 1) // 2)) % small_prime
+                if start + 2 * i == small_prime:    # Il piccolo primo stesso non è composto
+                    i += small_prime
+                if i < limit:
+                    composite[i::small_prime] = ones[:(limit - 1 - i) // small_prime + 1]
+            
+            tests = 0
+            for i in range(limit):
+                if composite[i]:
+                    continue
+                
+                if should_stop and should_stop():   # Ricerca annullata (modalità parallela)
+                    self._record_prime_stats(candidates=i, sieved_out=i - tests,
+                                             primality_tests=tests)
+                    return None
+                
+                tests += 1
+                candidate = start + 2 * i
+                if self._is_prime(candidate):       # Test completo solo sui sopravvissuti
+                    self._record_prime_stats(primes=1, candidates=i + 1,
+                                             sieved_out=i + 1 - tests, primality_tests=tests)
+                    return candidate
+            
+            self._record_prime_stats(candidates=limit, sieved_out=limit - tests,
+                                     primality_tests=tests)
+
+    def _record_prime_stats(self, **counts):
+        """Aggiorna le statistiche della ricerca dei primi"""
+        with self._prime_stats_lock:
+            for name, value in counts.items():
+                self.prime_stats[name] += value
+    
+    def reset_prime_stats(self):
+        """Azzera le statistiche della ricerca dei primi"""
+        with self._prime_stats_lock:
+            for name in self.prime_stats:
+                self.prime_stats[name] = 0
+    
+    def prime_search_summary(self):
+        """Medie per primo trovato: candidati esaminati, scartati dal crivello e test completi"""
+        with self._prime_stats_lock:
+            stats = dict(self.prime_stats)
+        primes = stats['primes'] or 1
+        return {
+            'primes': stats['primes'],
+            'candidates_per_prime': stats['candidates'] / primes,
+            'sieved_out_per_prime': stats['sieved_out'] / primes,
+            'primality_tests_per_prime': stats['primality_tests'] / primes,
+        }
+
+    def generate_primes_parallel(self, count=2):
+        """
+        Cerca 'count' primi distinti in parallelo su self.workers processi.
+        Ogni processo esplora il proprio flusso di candidati; appena sono stati
+        trovati abbastanza primi gli altri processi vengono fermati. Se tutti i
+        processi terminano senza risultato (OOM, segnale, errore all'avvio) i
+        primi mancanti vengono cercati in modo seriale.
+        """
+        # fork da un processo con altri thread attivi può ereditare lock già presi: in quel caso spawn
+        context = multiprocessing.get_context(None if threading.active_count() == 1 else 'spawn')
+        stop_event = context.Event()
+        result_queue = context.Queue()
+        processes = [
+            context.Process(
+                target=_prime_search_worker,
+                args=(self.bits, self.public_exponent, self.sieve_window, random.getrandbits(64),
+                      stop_event, result_queue),
+                daemon=True
+            )
+            for _ in range(self.workers)
+        ]
+        
+        for process in processes:
+            process.start()
+        
+        primes = []
+        try:
+            while len(primes) < count:
+                try:
+                    prime, stats = result_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if any(process.is_alive() for process in processes):
+                        continue
+                    print("⚠️ Processi di ricerca terminati senza risultato, uso la ricerca seriale")
+                    break
+                self._record_prime_stats(**stats)           # Statistiche del processo che l'ha trovato
+                if prime not in primes:                     # Scarta eventuali duplicati
+                    primes.append(prime)
+        finally:
+            stop_event.set()                                # Ferma i processi perdenti
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+            result_queue.close()
+        
+        while len(primes) < count:                          # Ripiego seriale
+            prime = (self.generate_prime() if self.public_exponent is None
+                     else self.generate_prime_for_exponent(self.public_exponent))
+            if prime not in primes:
+                primes.append(prime)
+        return primes
+
+    def generate_prime_for_exponent(self, e):
+        """Genera un primo p tale che gcd(e, p-1) = 1, rigenerandolo se necessario"""
+        while True:
+            p = self.generate_prime()
+            if self.gcd(e, p - 1) == 1:     # e deve essere invertibile modulo p-1
                 return p
 
     def gcd(self, a, b):
@@ -74,7 +389,8 @@ class RSAKeyGenerator:
 
     def encrypt(self, message, public_key):
         """Cifra un messaggio usando la chiave pubblica RSA"""
-        e, n = public_key   # Estrae esponente e modulo
+        context = self.get_key_context(public_key)  # Esponente e modulo precalcolati
+        n = context.n
         
         if message >= n:    # Verifica che messaggio < n
             raise ValueError(f"Il messaggio ({message}) deve essere minore di n ({n})")
@@ -82,15 +398,65 @@ class RSAKeyGenerator:
         if message < 0: # Verifica che messaggio >= 0
             raise ValueError("Il messaggio deve essere un numero positivo")
         
-        ciphertext = self.modular_exponentiation(message, e, n)  # Cifra: msg^e mod n
+        ciphertext = context.apply(message)  # Cifra: msg^e mod n
         return ciphertext
 
     def decrypt(self, ciphertext, private_key):
         """Decifra un messaggio usando la chiave privata RSA"""
-        d, n = private_key  # Estrae esponente privato e modulo
-        message = self.modular_exponentiation(ciphertext, d, n) # Decifra: cipher^d mod n
+        # Con la chiave estesa il contesto usa il CRT, con (d, n) l'esponenziazione completa
+        context = self.get_key_context(private_key)
+        message = context.apply(ciphertext) # Decifra: cipher^d mod n
         return message
 
+    def build_crt_private_key(self, d, p, q):
+        """Costruisce la chiave privata estesa (d, n, p, q, dP, dQ, qInv)"""
+        if p < q:                                           # Convenzione: p > q
+            p, q = q, p
+        
+        n = p * q
+        dP = d % (p - 1)                                    # d mod (p-1)
+        dQ = d % (q - 1)                                    # d mod (q-1)
+        qInv = self.modinv(q, p)                            # q^-1 mod p
+        return (d, n, p, q, dP, dQ, qInv)
+
+    def factor_modulus(self, e, d, n):
+        """Recupera p e q conoscendo e, d e n (e*d - 1 è multiplo di φ(n))"""
+        k = e * d - 1
+        t = 0
+        while k % 2 == 0:                                   # k = 2^t * r con r dispari
+            k //= 2
+            t += 1
+        
+        for _ in range(100):
+            g = random.randint(2, n - 2)
+            x = self.modular_exponentiation(g, k, n)
+            if x == 1 or x == n - 1:
+                continue
+            
+            for _ in range(t):
+                y = (x * x) % n
+                if y == 1:                                  # x è una radice non banale di 1
+                    p = self.gcd(x - 1, n)
+                    return p, n // p
+                if y == n - 1:
+                    break
+                x = y
+        
+        raise Exception("Impossibile fattorizzare il modulo con la chiave fornita")
+
+    def expand_private_key(self, public_key, private_key):
+        """Converte una chiave privata (d, n) nel formato esteso per il CRT"""
+        if len(private_key) != 2:                           # Già nel formato esteso
+            return private_key
+        
+        e, n = public_key
+        d, private_n = private_key
+        if n != private_n:
+            raise ValueError("La chiave pubblica e quella privata hanno moduli diversi")
+        
+        p, q = self.factor_modulus(e, d, n)
+        return self.build_crt_private_key(d, p, q)
+
     def string_to_number(self, text):
         """Converte una stringa in un numero intero"""
         text_bytes = text.encode('utf-8')
@@ -109,7 +475,7 @@ class RSAKeyGenerator:
     """METODI PER STRINGHE LUNGHE"""
     def encrypt_string(self, text, public_key):
         """Cifra una stringa usando RSA"""
-        e, n = public_key
+        n = self.get_key_context(public_key).n
         message_number = self.string_to_number(text)        # Converte stringa in numero
         
         if message_number >= n:                             # Se troppo grande
@@ -118,33 +484,34 @@ class RSAKeyGenerator:
         ciphertext = self.encrypt(message_number, public_key)    # Cifra normalmente
         return [ciphertext]                                 # Ritorna lista con un elemento
 
-def decrypt_string(self, ciphertext_blocks, private_key):
-    """Decifra una lista di blocchi cifrati"""
-    if len(ciphertext_blocks) == 1:                     # Se un solo blocco
-        decrypted_number = self.decrypt(ciphertext_blocks[0], private_key)
-        return self.number_to_string(decrypted_number)
-    else:                                               # Se blocchi multipli
-        return self._decrypt_large_string(ciphertext_blocks, private_key)
-
-"""Metodi per stringhe grandi (divise in blocchi)"""
-def _encrypt_large_string(self, text, public_key):
-    """Cifra stringhe troppo grandi dividendole in blocchi"""
-    e, n = public_key
-    max_bytes = (n.bit_length() - 1) // 8 - 1          # Calcola dimensione massima blocco
-    text_bytes = text.encode('utf-8')                   # Converte in bytes
-    
-    ciphertext_blocks = []
-    for i in range(0, len(text_bytes), max_bytes):      # Divide in blocchi
-        block = text_bytes[i:i + max_bytes]             # Estrae blocco
-        block_number = int.from_bytes(block, byteorder='big')  # Converte in numero
-        encrypted_block = self.encrypt(block_number, public_key)  # Cifra blocco
-        ciphertext_blocks.append(encrypted_block)       # Aggiunge alla lista
-    
-    return ciphertext_blocks
+    def decrypt_string(self, ciphertext_blocks, private_key, compressed=False):
+        """Decifra una lista di blocchi cifrati (compressed: blocchi prodotti da encrypt_text compressi)"""
+        if compressed:                                      # Blocchi con sentinella, testo compresso
+            return zlib.decompress(b''.join(self.decrypt_stream(ciphertext_blocks, private_key))).decode('utf-8')
+        if len(ciphertext_blocks) == 1:                     # Se un solo blocco
+            decrypted_number = self.decrypt(ciphertext_blocks[0], private_key)
+            return self.number_to_string(decrypted_number)
+        else:                                               # Se blocchi multipli
+            return self._decrypt_large_string(ciphertext_blocks, private_key)
+
+    """Metodi per stringhe grandi (divise in blocchi)"""
+    def _encrypt_large_string(self, text, public_key):
+        """Cifra stringhe troppo grandi dividendole in blocchi"""
+        max_bytes = self.get_key_context(public_key).max_block_size  # Dimensione massima blocco
+        text_bytes = text.encode('utf-8')                   # Converte in bytes
+        
+        ciphertext_blocks = []
+        for i in range(0, len(text_bytes), max_bytes):      # Divide in blocchi
+            block = text_bytes[i:i + max_bytes]             # Estrae blocco
+            block_number = int.from_bytes(block, byteorder='big')  # Converte in numero
+            encrypted_block = self.encrypt(block_number, public_key)  # Cifra blocco
+            ciphertext_blocks.append(encrypted_block)       # Aggiunge alla lista
+        
+        return ciphertext_blocks
 
     def _decrypt_large_string(self, ciphertext_blocks, private_key):
         """Decifra blocchi multipli"""
-        decrypted_bytes = b''                               # Bytes decrittati
+        block_list = []                                     # Bytes decrittati, uniti alla fine
         
         for encrypted_block in ciphertext_blocks:           # Per ogni blocco cifrato
             decrypted_number = self.decrypt(encrypted_block, private_key)  # Decifra
@@ -155,9 +522,160 @@ def _encrypt_large_string(self, text, public_key):
                 byte_length = (decrypted_number.bit_length() + 7) // 8
                 block_bytes = decrypted_number.to_bytes(byte_length, byteorder='big')
             
-            decrypted_bytes += block_bytes                   # Concatena bytes
+            block_list.append(block_bytes)                  # Un solo join: niente copie ripetute
+        
+        return b''.join(block_list).decode('utf-8')         # Decodifica UTF-8
+    
+    """Cifratura in streaming per payload grandi"""
+    STREAM_BUFFER_SIZE = 64 * 1024  # Byte accumulati prima di produrre un pezzo decifrato
+    
+    @staticmethod
+    def _stream_views(source, buffer):
+        """Produce memoryview dei byte di source (bytes, file binario o iterabile di bytes)"""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = (source,)
+        elif hasattr(source, 'readinto'):                   # File: letture nel buffer preallocato
+            view = memoryview(buffer)
+            while True:
+                read = source.readinto(buffer)
+                if not read:
+                    return
+                yield view[:read]
+        for piece in source:
+            yield memoryview(piece).cast('B')
+    
+    def encrypt_stream(self, source, public_key, buffer_size=STREAM_BUFFER_SIZE):
+        """
+        Generatore: cifra i byte di source un blocco alla volta, senza mai tenere
+        in memoria più di buffer_size byte in chiaro. Ogni blocco è il byte
+        sentinella 0x01 seguito da max_block_size - 1 byte di dati, così gli zeri
+        iniziali sopravvivono; si decifra con decrypt_stream.
+        """
+        context = self.get_key_context(public_key)
+        chunk_size = context.max_block_size - 1
+        sentinel = 1 << (8 * chunk_size)                    # 0x01 davanti a un blocco pieno
+        pending = bytearray()                               # Resto di una lettura precedente
+        
+        for view in self._stream_views(source, bytearray(max(buffer_size, chunk_size))):
+            start = 0
+            if pending:                                     # Completa il blocco lasciato a metà
+                start = min(chunk_size - len(pending), len(view))
+                pending += view[:start]
+                if len(pending) < chunk_size:
+                    continue
+                yield context.apply(sentinel | int.from_bytes(pending, 'big'))
+                pending.clear()
+            end = start + (len(view) - start) // chunk_size * chunk_size
+            for i in range(start, end, chunk_size):
+                yield context.apply(sentinel | int.from_bytes(view[i:i + chunk_size], 'big'))
+            pending += view[end:]
+        
+        if pending:                                         # Ultimo blocco, più corto
+            yield context.apply((1 << (8 * len(pending))) | int.from_bytes(pending, 'big'))
+    
+    def decrypt_stream(self, ciphertext_blocks, private_key, buffer_size=STREAM_BUFFER_SIZE):
+        """
+        Generatore inverso di encrypt_stream: decifra i blocchi nell'ordine in cui
+        arrivano e produce pezzi di al più buffer_size byte, accumulati in un
+        bytearray preallocato.
+        """
+        context = self.get_key_context(private_key)
+        buffer = bytearray(max(buffer_size, context.max_block_size))
+        filled = 0
+        for encrypted_block in ciphertext_blocks:
+            block = context.apply(encrypted_block)
+            length = (block.bit_length() - 1) // 8          # Byte di dati dopo la sentinella
+            if block >> (8 * length) != 1:
+                raise ValueError("Blocco senza sentinella: chiave errata o dati corrotti")
+            if filled + length > len(buffer):
+                yield bytes(buffer[:filled])
+                filled = 0
+            buffer[filled:filled + length] = (block ^ (1 << (8 * length))).to_bytes(length, 'big')
+            filled += length
+        if filled:
+            yield bytes(buffer[:filled])
+    
+    def encrypt_file(self, source, destination, public_key, buffer_size=STREAM_BUFFER_SIZE):
+        """
+        Cifra il file binario source in destination: ogni blocco cifrato occupa
+        esattamente byte_length byte del modulo. Ritorna il numero di blocchi scritti.
+        """
+        width = self.get_key_context(public_key).byte_length
+        blocks = 0
+        for encrypted_block in self.encrypt_stream(source, public_key, buffer_size):
+            destination.write(encrypted_block.to_bytes(width, 'big'))
+            blocks += 1
+        return blocks
+    
+    def decrypt_file(self, source, destination, private_key, buffer_size=STREAM_BUFFER_SIZE):
+        """Inverso di encrypt_file: legge blocchi a larghezza fissa e scrive i byte in chiaro"""
+        width = self.get_key_context(private_key).byte_length
+        written = 0
+        for chunk in self.decrypt_stream(self.read_fixed_blocks(source, width, buffer_size), private_key, buffer_size):
+            destination.write(chunk)
+            written += len(chunk)
+        return written
+    
+    @staticmethod
+    def read_fixed_blocks(source, width, buffer_size=STREAM_BUFFER_SIZE):
+        """Generatore: legge da un file binario numeri a larghezza fissa di width byte"""
+        buffer = bytearray(max(buffer_size // width, 1) * width)
+        view = memoryview(buffer)
+        filled = 0
+        while True:
+            read = source.readinto(view[filled:])
+            if read:
+                filled += read
+            complete = filled // width * width
+            for i in range(0, complete, width):
+                yield int.from_bytes(view[i:i + width], 'big')
+            if not read:
+                if filled != complete:
+                    raise ValueError("File cifrato troncato")
+                return
+            buffer[:filled - complete] = bytes(view[complete:filled])  # Resto di un blocco incompleto
+            filled -= complete
+    
+    """Compressione prima della cifratura"""
+    def encrypt_text(self, text, public_key, compress=True):
+        """
+        Cifra un testo comprimendolo con zlib se supera compression_threshold e
+        se così servono meno blocchi. Ritorna (blocchi, compresso); i blocchi
+        compressi vanno decifrati con decrypt_string(..., compressed=True).
+        """
+        text_bytes = text.encode('utf-8')
+        block_size = self.get_key_context(public_key).max_block_size
+        plain_blocks = max(1, -(-len(text_bytes) // block_size))
         
-        return decrypted_bytes.decode('utf-8')              # Decodifica UTF-8
+        packed = None
+        if compress and self.compression_threshold is not None and len(text_bytes) >= self.compression_threshold:
+            packed = zlib.compress(text_bytes, 6)
+            if -(-len(packed) // (block_size - 1)) >= plain_blocks:   # Nessun blocco risparmiato
+                packed = None
+        
+        if packed is None:
+            blocks = self.encrypt_string(text, public_key)
+        else:
+            blocks = list(self.encrypt_stream(packed, public_key))
+        self._record_compression(plain_blocks, len(blocks), packed is not None)
+        return blocks, packed is not None
+    
+    def _record_compression(self, plain_blocks, sent_blocks, compressed):
+        with self._compression_lock:
+            stats = self.compression_stats
+            stats['messages'] += 1
+            stats['compressed'] += compressed
+            stats['blocks_plain'] += plain_blocks
+            stats['blocks_sent'] += sent_blocks
+    
+    def compression_summary(self):
+        """Blocchi RSA risparmiati in totale e per messaggio grazie alla compressione"""
+        with self._compression_lock:
+            stats = dict(self.compression_stats)
+        saved = stats['blocks_plain'] - stats['blocks_sent']
+        stats['blocks_saved'] = saved
+        stats['blocks_saved_per_message'] = saved / stats['messages'] if stats['messages'] else 0.0
+        return stats
 
     """Genera chiavi"""
     def find_random_coprime_e(self, phi):
@@ -182,19 +700,37 @@ def _encrypt_large_string(self, text, public_key):
         
         raise Exception("Impossibile trovare un esponente pubblico valido")
 
-    def generate_keys(self):
+    def generate_keys(self, verbose=True):
         """Genera una coppia di chiavi RSA"""
-        print("🔑 Generando chiavi RSA...")
-        p = self.generate_prime()                           # Genera primo p
-        q = self.generate_prime()                           # Genera primo q
+        if verbose:
+            print("🔑 Generando chiavi RSA...")
+        fixed_e = self.public_exponent
         
-        while q == p:                                       # Assicura che p != q
-            q = self.generate_prime()
+        if self.workers > 1:                                # Cerca p e q in parallelo
+            try:
+                p, q = self.generate_primes_parallel(2)
+            except OSError as e:                            # Processi non disponibili: ripiega sul seriale
+                print(f"⚠️ Ricerca parallela non disponibile ({e}), uso la ricerca seriale")
+                self.workers = 1
+                return self.generate_keys(verbose)
+        elif fixed_e is not None:                           # Esponente fisso: filtra i primi
+            p = self.generate_prime_for_exponent(fixed_e)   # Genera primo p
+            q = self.generate_prime_for_exponent(fixed_e)   # Genera primo q
+            while q == p:                                   # Assicura che p != q
+                q = self.generate_prime_for_exponent(fixed_e)
+        else:
+            p = self.generate_prime()                       # Genera primo p
+            q = self.generate_prime()                       # Genera primo q
+            while q == p:                                   # Assicura che p != q
+                q = self.generate_prime()
         
         n = p * q                                           # Calcola modulo n
         phi = (p - 1) * (q - 1)                            # Calcola φ(n)
         
-        e = self.find_random_coprime_e(phi)                 # Trova esponente pubblico
+        if fixed_e is not None:
+            e = fixed_e                                     # Esponente pubblico fisso
+        else:
+            e = self.find_random_coprime_e(phi)             # Trova esponente pubblico casuale
         
         if self.gcd(e, phi) != 1:                          # Verifica che e sia coprimo con φ
             raise Exception(f"Errore: e={e} non è coprimo con phi={phi}")
@@ -205,64 +741,540 @@ def _encrypt_large_string(self, text, public_key):
             raise Exception("Errore nella verifica: (e * d) % phi != 1")
         
         public_key = (e, n)                                 # Chiave pubblica
-        private_key = (d, n)                                # Chiave privata
+        private_key = self.build_crt_private_key(d, p, q)   # Chiave privata estesa (CRT)
         
-        print("✅ Chiavi generate con successo!")
+        if verbose:
+            print("✅ Chiavi generate con successo!")
         return public_key, private_key
 
 
+def _atomic_write(path, data: bytes):
+    """Scrive un file in modo atomico e leggibile solo dal proprietario (contiene chiavi private)"""
+    temp_file = path + ".tmp"
+    fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temp_file, path)
+
+
+class RSAKeyPool:
+    """
+    Pool di coppie di chiavi pregenerate in background e salvate su file.
+    Le chiavi vengono consegnate subito ai nuovi client; quando il pool scende
+    sotto la soglia minima un thread lo riempie fino alla soglia massima.
+    Il file predefinito sta nella home dell'utente (~/.rsa_chat/key_pool.pkl).
+    """
+    
+    DEFAULT_POOL_FILE = os.path.join(os.path.expanduser('~'), '.rsa_chat', 'key_pool.pkl')
+    
+    def __init__(self, rsa_generator=None, pool_file=DEFAULT_POOL_FILE, high_water=8, low_water=3,
+                 startup_generator=None):
+        if low_water > high_water:
+            raise ValueError("La soglia minima del pool non può superare quella massima")
+        # Generatore del thread di riempimento: non va condiviso con chi usa il pool
+        self.rsa = rsa_generator or RSAKeyGenerator()
+        # Generatore per la generazione immediata a pool vuoto (es. ricerca parallela); il riempimento usa self.rsa
+        self.startup_generator = startup_generator or self.rsa
+        self.pool_file = pool_file
+        pool_dir = os.path.dirname(pool_file)
+        if pool_dir:
+            os.makedirs(pool_dir, mode=0o700, exist_ok=True)    # Contiene chiavi private
+        self.high_water = high_water    # Dimensione massima del pool
+        self.low_water = low_water      # Sotto questa soglia parte il riempimento
+        self.lock = threading.Lock()    # Per thread safety all'interno del processo
+        self.refill_thread = None
+    
+    @contextlib.contextmanager
+    def _locked(self):
+        """Lock sul pool, valido anche tra processi diversi che condividono il file"""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.pool_file + ".lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _load(self):
+        """Legge le chiavi del pool dal file (da chiamare con il lock acquisito)"""
+        try:
+            if os.path.exists(self.pool_file):
+                with open(self.pool_file, 'rb') as f:
+                    return pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Errore nel caricamento del pool di chiavi: {e}")
+        return []
+    
+    def _save(self, keys):
+        """Scrive le chiavi del pool in modo atomico (da chiamare con il lock acquisito)"""
+        _atomic_write(self.pool_file, pickle.dumps(keys))
+    
+    def size(self) -> int:
+        """Numero di coppie di chiavi disponibili"""
+        with self._locked():
+            return len(self._load())
+    
+    def acquire(self):
+        """Consegna una coppia di chiavi (generandola al momento se il pool è vuoto)"""
+        with self._locked():
+            keys = self._load()
+            key_pair = keys.pop(0) if keys else None
+            if key_pair:
+                self._save(keys)
+            remaining = len(keys)
+        
+        if remaining < self.low_water:
+            self.start_refill()
+        
+        if key_pair:
+            print(f"🔑 Chiavi prese dal pool ({remaining} rimaste)")
+            return key_pair
+        
+        print("⚠️ Pool di chiavi vuoto, generazione immediata")
+        return self.startup_generator.generate_keys()
+    
+    def start_refill(self):
+        """Avvia il riempimento in background (se non è già in corso)"""
+        with self.lock:
+            if self.refill_thread and self.refill_thread.is_alive():
+                return
+            self.refill_thread = threading.Thread(target=self._refill)
+            self.refill_thread.daemon = True
+            self.refill_thread.start()
+    
+    def _refill(self):
+        """Genera chiavi finché il pool non raggiunge la soglia massima"""
+        try:
+            while self.size() < self.high_water:
+                key_pair = self.rsa.generate_keys(verbose=False)  # Fuori dal lock: è l'operazione lenta
+                with self._locked():
+                    keys = self._load()
+                    if len(keys) >= self.high_water:      # Riempito nel frattempo da un altro processo
+                        return
+                    keys.append(key_pair)
+                    self._save(keys)
+        except Exception as e:
+            print(f"⚠️ Errore nel riempimento del pool di chiavi: {e}")
+
+
+def _prime_search_worker(bits, public_exponent, sieve_window, seed, stop_event, result_queue):
+    """Processo di ricerca dei primi usato da RSAKeyGenerator.generate_primes_parallel"""
+    random.seed(seed)                               # Flusso di candidati diverso per ogni processo
+    generator = RSAKeyGenerator(bits, public_exponent, workers=1, sieve_window=sieve_window)
+    
+    while not stop_event.is_set():
+        p = generator.generate_prime(should_stop=stop_event.is_set)
+        if p is None:
+            return
+        if public_exponent is None or generator.gcd(public_exponent, p - 1) == 1:
+            result_queue.put((p, dict(generator.prime_stats)))
+            generator.reset_prime_stats()               # Ogni primo riporta solo il proprio lavoro
+
+
+class JsonCodec:
+    """Formato JSON dei messaggi (predefinito e compatibile con i client esistenti)"""
+    
+    name = 'json'
+    
+    @staticmethod
+    def _encode_bytes(value):
+        if isinstance(value, (bytes, bytearray)):   # I dati binari viaggiano in base64
+            return {'__bytes__': base64.b64encode(value).decode('ascii')}
+        raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+    
+    @staticmethod
+    def _decode_bytes(obj):
+        if len(obj) == 1 and '__bytes__' in obj:
+            return base64.b64decode(obj['__bytes__'])
+        return obj
+    
+    def encode(self, data) -> bytes:
+        return json.dumps(data, default=self._encode_bytes).encode('utf-8')
+    
+    def decode(self, body) -> dict:
+        return json.loads(bytes(body).decode('utf-8'), object_hook=self._decode_bytes)
+
+
+class BinaryCodec:
+    """
+    Formato binario versionato dei messaggi. Ogni messaggio è:
+        versione (1 byte) | numero campi (1 byte) | campi
+    Ogni campo è: id chiave (1 byte, 0xFF + nome per le chiavi non in tabella)
+    | tipo (1 byte) | valore. Gli interi sono big-endian con lunghezza a 2 byte;
+    le liste di interi non negativi (blocchi cifrati) usano una larghezza fissa.
+    """
+    
+    name = 'binary1'
+    VERSION = 1
+    
+    # Chiavi note: trasmesse come un solo byte
+    KEYS = (
+        'e', 'n', 'modes', 'mode', 'wire_formats', 'wire_format',
+        'action', 'username', 'status', 'message', 'encrypted_challenge', 'challenge_response',
+        'wrapped_session_key', 'blocks', 'signature', 'sender', 'signature_valid', 'type',
+        'target', 'payload', 'compressed',
+        'file', 'transfer', 'name', 'size', 'sha256', 'offset', 'data', 'digest', 'rewind', 'reason',
+        'wrapped_resume_key',
+    )
+    KEY_IDS = {key: index for index, key in enumerate(KEYS)}
+    UNKNOWN_KEY = 0xFF
+    
+    # Tipi dei valori
+    T_NONE, T_FALSE, T_TRUE, T_INT, T_NEG_INT, T_FLOAT, T_STR, T_BYTES, T_INT_LIST, T_LIST, T_DICT = range(11)
+    
+    U8 = struct.Struct('>B')
+    U16 = struct.Struct('>H')
+    U32 = struct.Struct('>I')
+    F64 = struct.Struct('>d')
+    
+    def encode(self, data) -> bytes:
+        parts = [self.U8.pack(self.VERSION)]
+        self._encode_fields(data, parts)
+        return b''.join(parts)
+    
+    def _encode_fields(self, data, parts):
+        if len(data) > 255:
+            raise ValueError("Troppi campi in un messaggio binario")
+        parts.append(self.U8.pack(len(data)))
+        for key, value in data.items():
+            key_id = self.KEY_IDS.get(key)
+            if key_id is None:
+                key_bytes = key.encode('utf-8')
+                parts.append(self.U8.pack(self.UNKNOWN_KEY) + self.U8.pack(len(key_bytes)) + key_bytes)
+            else:
+                parts.append(self.U8.pack(key_id))
+            self._encode_value(value, parts)
+    
+    def _encode_value(self, value, parts):
+        if value is None:
+            parts.append(self.U8.pack(self.T_NONE))
+        elif value is True or value is False:
+            parts.append(self.U8.pack(self.T_TRUE if value else self.T_FALSE))
+        elif isinstance(value, int):
+            magnitude = abs(value)
+            value_bytes = magnitude.to_bytes((magnitude.bit_length() + 7) // 8, 'big')
+            parts.append(self.U8.pack(self.T_NEG_INT if value < 0 else self.T_INT))
+            parts.append(self.U16.pack(len(value_bytes)))
+            parts.append(value_bytes)
+        elif isinstance(value, float):
+            parts.append(self.U8.pack(self.T_FLOAT) + self.F64.pack(value))
+        elif isinstance(value, str):
+            value_bytes = value.encode('utf-8')
+            parts.append(self.U8.pack(self.T_STR) + self.U32.pack(len(value_bytes)))
+            parts.append(value_bytes)
+        elif isinstance(value, (bytes, bytearray)):
+            parts.append(self.U8.pack(self.T_BYTES) + self.U32.pack(len(value)))
+            parts.append(bytes(value))
+        elif isinstance(value, (list, tuple)):
+            if value and all(type(item) is int and item >= 0 for item in value):
+                # Blocchi cifrati: tutti con la stessa larghezza, senza separatori
+                width = max((item.bit_length() + 7) // 8 for item in value) or 1
+                parts.append(self.U8.pack(self.T_INT_LIST) + self.U32.pack(len(value)) + self.U16.pack(width))
+                parts.extend(item.to_bytes(width, 'big') for item in value)
+            else:
+                parts.append(self.U8.pack(self.T_LIST) + self.U32.pack(len(value)))
+                for item in value:
+                    self._encode_value(item, parts)
+        elif isinstance(value, dict):
+            parts.append(self.U8.pack(self.T_DICT))
+            self._encode_fields(value, parts)
+        else:
+            raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+    
+    def decode(self, body) -> dict:
+        view = memoryview(body)
+        (version,) = self.U8.unpack_from(view, 0)
+        if version != self.VERSION:
+            raise ValueError(f"Versione del formato binario non supportata: {version}")
+        data, offset = self._decode_fields(view, 1)
+        return data
+    
+    def _decode_fields(self, view, offset):
+        (count,) = self.U8.unpack_from(view, offset)
+        offset += 1
+        data = {}
+        for _ in range(count):
+            (key_id,) = self.U8.unpack_from(view, offset)
+            offset += 1
+            if key_id == self.UNKNOWN_KEY:
+                (length,) = self.U8.unpack_from(view, offset)
+                key = bytes(view[offset + 1:offset + 1 + length]).decode('utf-8')
+                offset += 1 + length
+            else:
+                key = self.KEYS[key_id]
+            data[key], offset = self._decode_value(view, offset)
+        return data, offset
+    
+    def _decode_value(self, view, offset):
+        (value_type,) = self.U8.unpack_from(view, offset)
+        offset += 1
+        
+        if value_type == self.T_NONE:
+            return None, offset
+        if value_type in (self.T_TRUE, self.T_FALSE):
+            return value_type == self.T_TRUE, offset
+        if value_type in (self.T_INT, self.T_NEG_INT):
+            (length,) = self.U16.unpack_from(view, offset)
+            offset += 2
+            value = int.from_bytes(view[offset:offset + length], 'big')
+            return (-value if value_type == self.T_NEG_INT else value), offset + length
+        if value_type == self.T_FLOAT:
+            return self.F64.unpack_from(view, offset)[0], offset + 8
+        if value_type in (self.T_STR, self.T_BYTES):
+            (length,) = self.U32.unpack_from(view, offset)
+            offset += 4
+            value = bytes(view[offset:offset + length])
+            return (value.decode('utf-8') if value_type == self.T_STR else value), offset + length
+        if value_type == self.T_INT_LIST:
+            (count,) = self.U32.unpack_from(view, offset)
+            (width,) = self.U16.unpack_from(view, offset + 4)
+            offset += 6
+            values = [int.from_bytes(view[start:start + width], 'big')
+                      for start in range(offset, offset + count * width, width)]
+            return values, offset + count * width
+        if value_type == self.T_LIST:
+            (count,) = self.U32.unpack_from(view, offset)
+            offset += 4
+            values = []
+            for _ in range(count):
+                value, offset = self._decode_value(view, offset)
+                values.append(value)
+            return values, offset
+        if value_type == self.T_DICT:
+            return self._decode_fields(view, offset)
+        
+        raise ValueError(f"Tipo di valore sconosciuto nel formato binario: {value_type}")
+
+
+# Formati dei messaggi disponibili, in ordine di preferenza
+WIRE_CODECS = {codec.name: codec for codec in (BinaryCodec(), JsonCodec())}
+JSON_CODEC = WIRE_CODECS['json']
+
+
+class SessionCipher:
+    """
+    Cifrario simmetrico autenticato per la chiave di sessione (modalità ibrida).
+    Keystream SHAKE-256(chiave || intestazione) in XOR con il testo, seguito da
+    un tag HMAC-SHA256 (encrypt-then-MAC). Usa solo la libreria standard.
+    
+    Formato: direzione (1 byte) | contatore (8 byte) | testo cifrato | tag (32 byte)
+    
+    Il contatore cresce a ogni messaggio inviato e il tag copre anche la
+    direzione: chi riceve scarta i messaggi rimandati al mittente (direzione
+    sbagliata) e quelli ripetuti o fuori ordine (contatore non crescente).
+    Cifratura e invio devono quindi avvenire nello stesso ordine.
+    """
+    
+    KEY_SIZE = 32
+    TAG_SIZE = 32
+    CLIENT = 1                      # Direzione client -> server
+    SERVER = 2                      # Direzione server -> client
+    HEADER = struct.Struct('>BQ')   # Direzione, contatore
+    
+    def __init__(self, session_key: bytes, role: int):
+        if len(session_key) != self.KEY_SIZE:
+            raise ValueError(f"La chiave di sessione deve essere di {self.KEY_SIZE} byte")
+        # Chiavi indipendenti per cifratura e autenticazione derivate dalla chiave di sessione
+        self.encryption_key = hmac.new(session_key, b'encryption', hashlib.sha256).digest()
+        self.mac_key = hmac.new(session_key, b'authentication', hashlib.sha256).digest()
+        # role: lato che usa il cifrario (CLIENT o SERVER); i messaggi in arrivo hanno la direzione opposta
+        self.send_direction = role
+        self.receive_direction = self.SERVER if role == self.CLIENT else self.CLIENT
+        self.send_counter = 0       # Ultimo contatore inviato
+        self.receive_counter = 0    # Ultimo contatore accettato
+        self.lock = threading.Lock()
+    
+    def _keystream_xor(self, header: bytes, data: bytes) -> bytes:
+        keystream = hashlib.shake_256(self.encryption_key + header).digest(len(data))
+        result = int.from_bytes(data, 'big') ^ int.from_bytes(keystream, 'big')
+        return result.to_bytes(len(data), 'big')
+    
+    def encrypt(self, plaintext: bytes) -> bytes:
+        """Cifra e autentica i dati con il prossimo contatore (l'intestazione non si ripete mai)"""
+        with self.lock:
+            self.send_counter += 1
+            header = self.HEADER.pack(self.send_direction, self.send_counter)
+        ciphertext = self._keystream_xor(header, plaintext)
+        tag = hmac.new(self.mac_key, header + ciphertext, hashlib.sha256).digest()
+        return header + ciphertext + tag
+    
+    def decrypt(self, data: bytes) -> bytes:
+        """Verifica tag, direzione e contatore, poi decifra i dati"""
+        if len(data) < self.HEADER.size + self.TAG_SIZE:
+            raise ValueError("Messaggio cifrato troppo corto")
+        
+        header = data[:self.HEADER.size]
+        ciphertext = data[self.HEADER.size:-self.TAG_SIZE]
+        tag = data[-self.TAG_SIZE:]
+        expected_tag = hmac.new(self.mac_key, header + ciphertext, hashlib.sha256).digest()
+        if not hmac.compare_digest(tag, expected_tag):
+            raise ValueError("Autenticazione del messaggio fallita")
+        
+        direction, counter = self.HEADER.unpack(header)
+        if direction != self.receive_direction:
+            raise ValueError("Messaggio con direzione errata (rimandato al mittente)")
+        with self.lock:
+            if counter <= self.receive_counter:
+                raise ValueError("Messaggio ripetuto o fuori ordine")
+            self.receive_counter = counter
+        return self._keystream_xor(header, ciphertext)
+    
+    def encrypt_message(self, data, codec=None) -> bytes:
+        """Serializza un dizionario con il formato indicato (JSON di default) e lo cifra"""
+        return self.encrypt((codec or JSON_CODEC).encode(data))
+    
+    def decrypt_message(self, payload: bytes, codec=None):
+        """Decifra un payload prodotto da encrypt_message"""
+        return (codec or JSON_CODEC).decode(self.decrypt(payload))
+
+
+class UserStore:
+    """
+    Archivio degli utenti registrati su SQLite in modalità WAL. Ogni
+    registrazione è un inserimento nel B-tree indicizzato per username (niente
+    riscrittura dell'intero file) e le chiavi pubbliche si leggono su richiesta,
+    con una piccola cache LRU. Il WAL viene riportato nel database ogni
+    compact_every registrazioni. Al primo avvio importa il vecchio users.pkl.
+    """
+    
+    def __init__(self, db_file="users.db", legacy_file="users.pkl", cache_size=1024, compact_every=1000):
+        self.db_file = db_file
+        self.legacy_file = legacy_file
+        self.cache_size = cache_size
+        self.compact_every = compact_every          # Registrazioni tra due checkpoint del WAL
+        self.cache = collections.OrderedDict()      # username -> (e, n), ordine LRU
+        self.pending_writes = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")    # In WAL resta consistente anche dopo un crash
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "username TEXT PRIMARY KEY, e BLOB NOT NULL, n BLOB NOT NULL, registered_at REAL NOT NULL)"
+        )
+        self.migrate_legacy_file()
+    
+    @staticmethod
+    def _to_blob(value: int) -> bytes:
+        return value.to_bytes((value.bit_length() + 7) // 8 or 1, 'big')
+    
+    def add(self, username: str, public_key: Tuple[int, int]) -> bool:
+        """Inserisce un utente; False se l'username è già registrato"""
+        return self.add_many([(username, public_key)]) == 1
+    
+    def add_many(self, users) -> int:
+        """Inserisce più utenti in una sola transazione; ritorna quanti erano nuovi"""
+        rows = [(username, self._to_blob(e), self._to_blob(n), time.time()) for username, (e, n) in users]
+        with self.lock:
+            before = self.db.total_changes
+            with self.db:                               # BEGIN ... COMMIT
+                self.db.execute("BEGIN")
+                self.db.executemany("INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?)", rows)
+            added = self.db.total_changes - before
+            self.pending_writes += added
+            if self.pending_writes >= self.compact_every:
+                self._checkpoint()
+        return added
+    
+    def get(self, username: str) -> Optional[Tuple[int, int]]:
+        """Chiave pubblica dell'utente (dalla cache o con una ricerca sull'indice)"""
+        with self.lock:
+            public_key = self.cache.get(username)
+            if public_key is not None:
+                self.cache.move_to_end(username)
+                return public_key
+            row = self.db.execute("SELECT e, n FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            public_key = (int.from_bytes(row[0], 'big'), int.from_bytes(row[1], 'big'))
+            self.cache[username] = public_key
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return public_key
+    
+    def __contains__(self, username: str) -> bool:
+        return self.get(username) is not None
+    
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    
+    def compact(self, vacuum=False):
+        """Riporta il WAL nel database e lo tronca; con vacuum ricompatta anche il file"""
+        with self.lock:
+            self._checkpoint()
+            if vacuum:
+                self.db.execute("VACUUM")
+    
+    def _checkpoint(self):
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.pending_writes = 0
+    
+    def migrate_legacy_file(self):
+        """Importa users.pkl (se presente) e lo rinomina in users.pkl.migrated"""
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+        with open(self.legacy_file, 'rb') as f:
+            legacy_users = pickle.load(f)
+        added = self.add_many(legacy_users.items())
+        self.compact()
+        os.replace(self.legacy_file, self.legacy_file + ".migrated")
+        print(f"📦 Migrati {added} utenti da {self.legacy_file} a {self.db_file}")
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
 class RSAAuthenticator:
     """
     Sistema di autenticazione passwordless usando RSA con persistenza
     """
     
-    def __init__(self, rsa_generator, storage_file="users.pkl"):
+    def __init__(self, rsa_generator, storage_file="users.db", legacy_file="users.pkl"):
         self.rsa = rsa_generator
-        self.storage_file = storage_file
-        self.registered_users: Dict[str, Tuple[int, int]] = {}  # username -> (e, n)
-        self.authenticated_users: Dict[str, float] = {}  # username -> timestamp
+        self.storage_file = storage_file  # None: solo firme, nessun archivio utenti (lato client)
+        self.legacy_file = legacy_file
+        self.registered_users: Optional[UserStore] = None  # username -> (e, n), su disco
+        self.authenticated_users: Dict[str, float] = {}  # username -> timestamp dell'ultima attività
         self.session_timeout = 3600  # 1 ora in secondi
+        self.expiry_heap = []  # (scadenza, username): min-heap, al più una voce per utente
+        self.scheduled_deadlines: Dict[str, float] = {}  # username -> scadenza della sua voce nel heap
+        self.expiry_stats = {'sweeps': 0, 'expired': 0, 'rescheduled': 0, 'stale': 0,
+                             'last_sweep_ms': 0.0, 'max_sweep_ms': 0.0}
         self.lock = threading.Lock()  # Per thread safety
+        # Cache LRU delle verifiche di firma: ((e, n), SHA-256 del messaggio, firma) -> esito
+        self.signature_cache = collections.OrderedDict()
+        self.signature_cache_size = 4096
+        self.signature_stats = {'hits': 0, 'misses': 0}
+        self.signature_lock = threading.Lock()
         
-        # Carica utenti registrati da file
-        self.load_users()
-        
-    def load_users(self):
-        """Carica gli utenti registrati dal file di storage"""
-        try:
-            if os.path.exists(self.storage_file):
-                with open(self.storage_file, 'rb') as f:
-                    self.registered_users = pickle.load(f)
-                print(f"📂 Caricati {len(self.registered_users)} utenti registrati")
-            else:
-                print("📂 Nessun file utenti esistente, creando nuovo database")
-        except Exception as e:
-            print(f"⚠️ Errore nel caricamento utenti: {e}")
-            self.registered_users = {}
+        # Apre l'archivio degli utenti registrati
+        if storage_file:
+            self.load_users()
     
-    def save_users(self):
-        """Salva gli utenti registrati nel file di storage"""
+    def load_users(self):
+        """Apre l'archivio utenti (le chiavi si leggono su richiesta, non tutte all'avvio)"""
         try:
-            with open(self.storage_file, 'wb') as f:
-                pickle.dump(self.registered_users, f)
+            self.registered_users = UserStore(self.storage_file, self.legacy_file)
+            print(f"📂 Archivio utenti {self.storage_file}: {len(self.registered_users)} utenti registrati")
         except Exception as e:
-            print(f"⚠️ Errore nel salvataggio utenti: {e}")
+            print(f"⚠️ Errore nell'apertura dell'archivio utenti: {e}")
+            raise
     
     def register_user(self, username: str, public_key: Tuple[int, int]) -> bool:
         """Registra un nuovo utente associando username alla chiave pubblica"""
-        with self.lock:
-            if username in self.registered_users:
-                return False
-            
-            self.registered_users[username] = public_key
-            self.save_users()  # Salva immediatamente
-            print(f"✅ Utente '{username}' registrato con successo")
-            return True
+        if not self.registered_users.add(username, public_key):  # Salvato subito, senza riscrivere il file
+            return False
+        print(f"✅ Utente '{username}' registrato con successo")
+        return True
     
     def user_exists(self, username: str) -> bool:
         """Controlla se un utente è già registrato"""
-        with self.lock:
-            return username in self.registered_users
+        return username in self.registered_users
     
     def generate_challenge(self) -> int:
         """Genera un challenge casuale per l'autenticazione"""
@@ -270,50 +1282,105 @@ class RSAAuthenticator:
     
     def create_challenge_for_user(self, username: str) -> Optional[Tuple[int, int]]:
         """Crea un challenge cifrato per un utente specifico"""
-        with self.lock:
-            if username not in self.registered_users:
-                return None
-            
-            challenge = self.generate_challenge()
-            user_public_key = self.registered_users[username]
-            
-            # Cifra il challenge con la chiave pubblica dell'utente
-            encrypted_challenge = self.rsa.encrypt(challenge, user_public_key)
-            
-            return encrypted_challenge, challenge
+        user_public_key = self.registered_users.get(username)
+        if user_public_key is None:
+            return None
+        
+        challenge = self.generate_challenge()
+        
+        # Cifra il challenge con la chiave pubblica dell'utente
+        encrypted_challenge = self.rsa.encrypt(challenge, user_public_key)
+        
+        return encrypted_challenge, challenge
     
     def verify_challenge_response(self, username: str, original_challenge: int, 
                                 response: int) -> bool:
         """Verifica che il client abbia decrittato correttamente il challenge"""
         if response == original_challenge:
             # Autenticazione successful - registra la sessione
-            with self.lock:
-                self.authenticated_users[username] = time.time()
+            self.start_session(username)
             return True
         return False
     
-    def sign_message(self, message: str, private_key: Tuple[int, int]) -> int:
+    def start_session(self, username: str):
+        """Registra una sessione autenticata e ne pianifica la scadenza"""
+        now = time.time()
+        with self.lock:
+            self.authenticated_users[username] = now
+            # Una voce già in coda basta: alla sweep viene rimessa con la scadenza aggiornata
+            if username not in self.scheduled_deadlines:
+                self.scheduled_deadlines[username] = now + self.session_timeout
+                heapq.heappush(self.expiry_heap, (now + self.session_timeout, username))
+    
+    def sign_message(self, message: str, private_key: Tuple[int, ...]) -> int:
         """Firma un messaggio usando la chiave privata"""
         message_hash = hashlib.sha256(message.encode()).hexdigest()
         message_number = int(message_hash[:32], 16)  # Primi 32 char dell'hash
         
-        # Firma = messaggio^d mod n
-        signature = self.rsa.encrypt(message_number, private_key)
+        # Firma = messaggio^d mod n (operazione privata, usa il CRT se disponibile)
+        signature = self.rsa.decrypt(message_number, private_key)
         return signature
     
     def verify_signature(self, message: str, signature: int, 
                         public_key: Tuple[int, int]) -> bool:
         """Verifica la firma di un messaggio"""
-        try:
-            message_hash = hashlib.sha256(message.encode()).hexdext()
-            expected_number = int(message_hash[:32], 16)
-            
-            # Verifica: firma^e mod n dovrebbe dare il messaggio originale
-            decrypted_signature = self.rsa.decrypt(signature, public_key) # Modifica qui
-            
-            return decrypted_signature == expected_number
-        except:
-            return False
+        return self.verify_signatures([(message, signature, public_key)])[0]
+    
+    def verify_signatures(self, items) -> list:
+        """
+        Verifica un lotto di (messaggio, firma, chiave pubblica) e ritorna gli esiti
+        nello stesso ordine. Le firme già verificate vengono servite dalla cache e
+        quelle ripetute nel lotto si verificano una volta sola.
+        """
+        cache_keys = []
+        for message, signature, public_key in items:
+            try:
+                cache_key = ((public_key[0], public_key[1]), hashlib.sha256(message.encode()).digest(), signature)
+                hash(cache_key)
+            except Exception:
+                cache_key = None                            # Dati malformati: firma non valida
+            cache_keys.append(cache_key)
+        
+        results = [False] * len(cache_keys)
+        missing = {}                                        # chiave di cache -> posizioni nel lotto
+        with self.signature_lock:
+            for position, cache_key in enumerate(cache_keys):
+                if cache_key is None:
+                    continue
+                cached = self.signature_cache.get(cache_key)
+                if cached is None:
+                    missing.setdefault(cache_key, []).append(position)
+                    self.signature_stats['misses'] += 1
+                else:
+                    self.signature_cache.move_to_end(cache_key)
+                    results[position] = cached
+                    self.signature_stats['hits'] += 1
+        
+        # Verifica: firma^e mod n dovrebbe dare i primi 128 bit dell'hash (fuori dal lock)
+        verified = {}
+        for cache_key in missing:
+            public_key, digest, signature = cache_key
+            try:
+                verified[cache_key] = self.rsa.encrypt(signature, public_key) == int.from_bytes(digest[:16], 'big')
+            except Exception:
+                verified[cache_key] = False
+        
+        with self.signature_lock:
+            for cache_key, valid in verified.items():
+                self.signature_cache[cache_key] = valid
+                for position in missing[cache_key]:
+                    results[position] = valid
+            while len(self.signature_cache) > self.signature_cache_size:
+                self.signature_cache.popitem(last=False)
+        return results
+    
+    def get_signature_stats(self):
+        """Contatori della cache delle verifiche di firma"""
+        with self.signature_lock:
+            stats = dict(self.signature_stats, cached=len(self.signature_cache))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
     
     def is_user_authenticated(self, username: str) -> bool:
         """Controlla se un utente è attualmente autenticato"""
@@ -330,31 +1397,724 @@ class RSAAuthenticator:
             return True
     
     def logout_user(self, username: str):
-        """Effettua il logout di un utente"""
+        """Effettua il logout di un utente (la sua voce nel heap diventa obsoleta)"""
         with self.lock:
             if username in self.authenticated_users:
                 del self.authenticated_users[username]
     
+    def touch_session(self, username: str):
+        """Registra attività sulla sessione: O(1), la scadenza nel heap si aggiorna alla sweep"""
+        with self.lock:
+            if username in self.authenticated_users:
+                self.authenticated_users[username] = time.time()
+    
+    def expire_sessions(self, now: Optional[float] = None) -> list:
+        """
+        Rimuove le sessioni inattive da più di session_timeout e ritorna i loro
+        username. Esamina solo le voci del heap già scadute: una voce la cui
+        sessione ha avuto attività nel frattempo viene rimessa con la nuova
+        scadenza, una di una sessione già chiusa (o non più registrata in
+        scheduled_deadlines) viene scartata.
+        """
+        now = time.time() if now is None else now
+        start = time.perf_counter()
+        expired = []
+        rescheduled = stale = 0
+        with self.lock:
+            heap = self.expiry_heap
+            while heap and heap[0][0] <= now:
+                deadline, username = heapq.heappop(heap)
+                if self.scheduled_deadlines.get(username) != deadline:
+                    stale += 1                              # Voce non più pianificata
+                    continue
+                del self.scheduled_deadlines[username]
+                last_seen = self.authenticated_users.get(username)
+                if last_seen is None:
+                    stale += 1
+                elif last_seen + self.session_timeout <= now:
+                    del self.authenticated_users[username]
+                    expired.append(username)
+                else:
+                    self.scheduled_deadlines[username] = last_seen + self.session_timeout
+                    heapq.heappush(heap, (last_seen + self.session_timeout, username))
+                    rescheduled += 1
+            
+            sweep_ms = (time.perf_counter() - start) * 1000
+            stats = self.expiry_stats
+            stats['sweeps'] += 1
+            stats['expired'] += len(expired)
+            stats['rescheduled'] += rescheduled
+            stats['stale'] += stale
+            stats['last_sweep_ms'] = sweep_ms
+            stats['max_sweep_ms'] = max(stats['max_sweep_ms'], sweep_ms)
+        return expired
+    
+    def get_expiry_stats(self):
+        """Statistiche delle sweep, con sessioni attive e dimensione del heap"""
+        with self.lock:
+            return dict(self.expiry_stats, sessions=len(self.authenticated_users), heap_size=len(self.expiry_heap))
+    
     def get_user_public_key(self, username: str) -> Optional[Tuple[int, int]]:
         """Ottiene la chiave pubblica di un utente"""
-        with self.lock:
-            return self.registered_users.get(username)
+        return self.registered_users.get(username)
 
 
-class ClientHandler:
-    """Gestisce la connessione di un singolo client"""
+class FramedSocket:
+    """
+    Trasporto a frame condiviso da server e client: header di 4 byte con la
+    lunghezza + corpo. La ricezione legge con recv_into in un buffer
+    preallocato e ricompone i frame arrivati in più segmenti TCP; l'invio
+    spedisce header e corpo con una sola chiamata (sendmsg o sendall).
+    """
     
-    def __init__(self, client_socket, client_address, server):
-        self.client_socket = client_socket
-        self.client_address = client_address
-        self.server = server
-        self.rsa = server.rsa
-        self.authenticator = server.authenticator
-        self.client_public_key = None
-        self.current_user = None
-        self.authenticated = False
+    HEADER = struct.Struct('>I')
+    MAX_FRAME_SIZE = 64 * 1024 * 1024      # Frame più grandi chiudono la connessione
+    HANDSHAKE_FRAME_SIZE = 64 * 1024       # Limite prima del login: scambio chiavi e autenticazione
+    
+    def __init__(self, sock, buffer_size=65536, max_frame_size=MAX_FRAME_SIZE):
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0                      # Inizio dei dati non ancora consumati
+        self.end = 0                        # Fine dei dati ricevuti
+        self.max_frame_size = max_frame_size
+        self.send_lock = threading.Lock()   # Frame inviati da thread diversi non si mescolano
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Niente attesa di Nagle
+        except (OSError, AttributeError):
+            pass
+    
+    def send_frame(self, body):
+        """Invia un frame completo (header + corpo) con una sola chiamata di sistema"""
+        header = self.HEADER.pack(len(body))
+        with self.send_lock:
+            if hasattr(self.sock, 'sendmsg'):
+                sent = self.sock.sendmsg([header, body])        # Scatter-gather: nessuna copia
+                if sent < len(header) + len(body):             # Invio parziale: completa il resto
+                    self.sock.sendall((header + bytes(body))[sent:])
+            else:
+                self.sock.sendall(header + bytes(body))
+    
+    def receive_frame(self):
+        """
+        Ritorna il corpo del prossimo frame come memoryview sul buffer interno
+        (valida fino alla chiamata successiva), oppure None se la connessione è chiusa.
+        """
+        if not self._fill(self.HEADER.size):
+            return None
+        (length,) = self.HEADER.unpack_from(self.buffer, self.start)
+        if length > self.max_frame_size:
+            raise ValueError(f"Frame troppo grande: {length} byte")
+        
+        if not self._fill(self.HEADER.size + length):
+            return None
+        body_start = self.start + self.HEADER.size
+        self.start = body_start + length
+        return self.view[body_start:self.start]
+    
+    def has_buffered_frame(self) -> bool:
+        """True se nel buffer c'è già un frame completo (leggibile senza recv)"""
+        available = self.end - self.start
+        if available < self.HEADER.size:
+            return False
+        (length,) = self.HEADER.unpack_from(self.buffer, self.start)
+        return available >= self.HEADER.size + length
+    
+    def _fill(self, needed) -> bool:
+        """Riceve dati finché nel buffer ci sono almeno 'needed' byte non consumati"""
+        while self.end - self.start < needed:
+            if self.start + needed > len(self.buffer):
+                self._make_room(needed)
+            received = self.sock.recv_into(self.view[self.end:])
+            if received == 0:
+                return False
+            self.end += received
+        return True
+    
+    def _make_room(self, needed):
+        """Sposta i dati pendenti all'inizio del buffer, ingrandendolo se non bastasse"""
+        pending = bytes(self.view[self.start:self.end])
+        if needed > len(self.buffer):
+            # Nuovo buffer: i memoryview già restituiti restano validi sul vecchio
+            self.buffer = bytearray(max(needed, len(self.buffer) * 2))
+            self.view = memoryview(self.buffer)
+        self.view[:len(pending)] = pending
+        self.start = 0
+        self.end = len(pending)
+    
+    def close(self):
+        self.sock.close()
+
+
+class OutboundQueue:
+    """
+    Coda di uscita limitata di un client, svuotata da un thread writer dedicato:
+    un client lento accumula messaggi nella propria coda senza bloccare chi invia.
+    Due corsie: 'system' (presenza, conferme, errori) ha la precedenza su 'chat'.
+    A coda piena si applica la policy: 'drop_oldest' scarta il messaggio più
+    vecchio della corsia, 'disconnect' chiude il client, 'block' attende al più
+    block_timeout secondi e poi scarta il nuovo messaggio.
+    Un frame può essere una funzione senza argomenti che lo produce: viene
+    chiamata dal writer al momento dell'invio (cifratura nell'ordine della coda).
+    """
+    
+    LANES = ('system', 'chat')
+    POLICIES = ('drop_oldest', 'disconnect', 'block')
+    
+    def __init__(self, send_frame, on_failure, max_size=256, policy='drop_oldest', block_timeout=1.0,
+                 name="writer"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Policy della coda non valida: {policy}")
+        self.send_frame = send_frame        # Invio effettivo di un frame (bloccante)
+        self.on_failure = on_failure        # Chiamata con il motivo se il client va disconnesso
+        self.max_size = max_size            # Messaggi massimi per corsia
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.lanes = {lane: collections.deque() for lane in self.LANES}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.stats = {'enqueued': 0, 'sent': 0, 'dropped': 0, 'blocked': 0, 'max_depth': 0}
+        self.start_writer(name)
+    
+    def start_writer(self, name):
+        """Avvia il thread writer che svuota la coda"""
+        self.writer = threading.Thread(target=self._writer_loop, name=name)
+        self.writer.daemon = True
+        self.writer.start()
+    
+    def can_block(self) -> bool:
+        """True se il thread che accoda può attendere spazio (policy 'block')"""
+        return True
+    
+    def wake(self):
+        """Sveglia il writer dopo un accodamento o la chiusura (il thread writer attende già sulla condition)"""
+        
+    def put(self, frame, lane='chat') -> bool:
+        """Accoda un frame nella corsia indicata; False se è stato scartato"""
+        pending = self.lanes[lane]
+        overflow = False
+        with self.condition:
+            if self.closed:
+                return False
+            if len(pending) >= self.max_size:
+                if self.policy == 'drop_oldest':
+                    pending.popleft()
+                    self.stats['dropped'] += 1
+                elif self.policy == 'block':
+                    self.stats['blocked'] += 1
+                    if not self.can_block() or not self.condition.wait_for(
+                            lambda: self.closed or len(pending) < self.max_size, self.block_timeout):
+                        self.stats['dropped'] += 1
+                        return False
+                    if self.closed:
+                        return False
+                else:
+                    self.stats['dropped'] += 1
+                    self.closed = True
+                    self.condition.notify_all()
+                    overflow = True
+            if not overflow:
+                pending.append(frame)
+                self.stats['enqueued'] += 1
+                self.stats['max_depth'] = max(self.stats['max_depth'], self.depth())
+                self.condition.notify_all()
+        
+        if overflow:                        # Policy 'disconnect': fuori dal lock
+            self.on_failure("coda di uscita piena")
+            return False
+        self.wake()
+        return True
+    
+    def depth(self) -> int:
+        return sum(len(pending) for pending in self.lanes.values())
+    
+    def get_stats(self):
+        """Profondità attuale per corsia e contatori di invii e scarti"""
+        with self.condition:
+            stats = dict(self.stats)
+            stats['depth'] = {lane: len(pending) for lane, pending in self.lanes.items()}
+        stats['policy'] = self.policy
+        return stats
+    
+    def close(self):
+        """Ferma il writer; i messaggi ancora in coda vengono scartati"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.wake()
+        
+    def _writer_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.closed or self.depth())
+                if self.closed:
+                    return
+                lane = self.lanes['system'] if self.lanes['system'] else self.lanes['chat']
+                frame = lane.popleft()
+                self.condition.notify_all()             # Sblocca i produttori in attesa
+            try:
+                if callable(frame):
+                    frame = frame()
+                self.send_frame(frame)
+            except Exception as e:
+                self.close()
+                self.on_failure(f"errore di invio: {e}")
+                return
+            with self.condition:
+                self.stats['sent'] += 1
+
+
+class MetricTimer:
+    """Context manager che osserva la durata del blocco in un istogramma"""
+    
+    __slots__ = ('registry', 'name', 'labels', 'start')
+    
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    """
+    Registro delle metriche: contatori, gauge e istogrammi di latenza a bucket
+    fissi (in secondi). Ogni serie è identificata da nome ed etichette; render()
+    produce il formato testuale di Prometheus, summary() un riepilogo leggibile.
+    """
+    
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    LABEL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+    
+    def __init__(self, prefix="rsa_chat"):
+        self.prefix = prefix                # Prefisso dei nomi esportati
+        self.definitions = {}               # nome -> (tipo, descrizione, bucket)
+        self.series = {}                    # (nome, etichette) -> valore, o [conteggi per bucket, somma, conteggio]
+        self.functions = {}                 # nome -> funzione letta a ogni esportazione (gauge)
+        self.lock = threading.Lock()
+    
+    def counter(self, name, description):
+        self.definitions[name] = ('counter', description, None)
+    
+    def gauge(self, name, description, function=None):
+        """Gauge impostato con set() o, se indicata, calcolato da function() a ogni lettura"""
+        self.definitions[name] = ('gauge', description, None)
+        if function:
+            self.functions[name] = function
+    
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS):
+        self.definitions[name] = ('histogram', description, tuple(buckets))
+    
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+    
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+    
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.series[self._key(name, labels)] = value
+    
+    def observe(self, name, value, **labels):
+        """Registra un campione (in secondi per gli istogrammi di latenza)"""
+        buckets = self.definitions[name][2]
+        position = bisect.bisect_left(buckets, value)       # len(buckets): oltre l'ultimo bucket (+Inf)
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.series.get(key)
+            if histogram is None:
+                histogram = self.series[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histogram[0][position] += 1
+            histogram[1] += value
+            histogram[2] += 1
+    
+    def time(self, name, **labels) -> MetricTimer:
+        """with registry.time('nome'): ... osserva la durata del blocco"""
+        return MetricTimer(self, name, labels)
+    
+    def collect(self):
+        """Copia coerente delle serie: (nome, etichette) -> valore, più i gauge calcolati"""
+        with self.lock:
+            series = {key: [list(value[0]), value[1], value[2]] if isinstance(value, list) else value
+                      for key, value in self.series.items()}
+        for name, function in self.functions.items():
+            try:
+                series[(name, ())] = function()
+            except Exception:
+                pass                                        # Un gauge non disponibile non blocca gli altri
+        return series
+    
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        # Nei valori delle etichette \, " e a capo vanno protetti (formato testuale di Prometheus)
+        pairs = [f'{key}="{str(value).translate(MetricsRegistry.LABEL_ESCAPES)}"'
+                 for key, value in (*labels, *extra)]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    def render(self) -> str:
+        """Metriche nel formato testuale di Prometheus"""
+        series = self.collect()
+        lines = []
+        for name, (kind, description, buckets) in self.definitions.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {description}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for (series_name, labels), value in series.items():
+                if series_name != name:
+                    continue
+                if kind != 'histogram':
+                    lines.append(f"{full_name}{self._format_labels(labels)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{full_name}_sum{self._format_labels(labels)} {total}")
+                lines.append(f"{full_name}_count{self._format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+    
+    @staticmethod
+    def bucket_quantile(buckets, counts, share):
+        """Limite superiore del bucket che contiene il quantile (None se oltre l'ultimo)"""
+        target = share * sum(counts)
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return None
+    
+    def summary(self) -> list:
+        """Una riga per serie: valori per contatori e gauge, media e p50/p95 stimati per gli istogrammi"""
+        lines = []
+        for (name, labels), value in sorted(self.collect().items(), key=lambda item: item[0]):
+            label = name + self._format_labels(labels)
+            if self.definitions[name][0] != 'histogram':
+                lines.append(f"{label}: {value:g}")
+                continue
+            counts, total, count = value
+            if not count:
+                continue
+            buckets = self.definitions[name][2]
+            quantiles = []
+            for share in (0.5, 0.95):
+                bound = self.bucket_quantile(buckets, counts, share)
+                limit = f"≤{bound * 1000:g} ms" if bound is not None else f">{buckets[-1] * 1000:g} ms"
+                quantiles.append(f"p{share * 100:g} {limit}")
+            lines.append(f"{label}: {count} campioni, media {total / count * 1000:.2f} ms, {', '.join(quantiles)}")
+        return lines
+
+
+class MetricsEndpoint:
+    """Endpoint HTTP delle metriche, raggiungibile solo da localhost: GET /metrics"""
+    
+    def __init__(self, registry, port=9100):
+        class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass                                        # Nessuna riga di log per ogni lettura
+        
+        # Solo l'interfaccia di loopback: le metriche non escono dalla macchina
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), MetricsRequestHandler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics")
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+NULL_SPAN = contextlib.nullcontext()  # Span usato quando la traccia è spenta
+
+
+class TraceSpan:
+    """Context manager che registra un intervallo nella traccia del profiler"""
+    
+    __slots__ = ('profiler', 'name', 'args', 'start')
+    
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+    
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.profiler.record_span(self.name, self.start, time.perf_counter_ns(), self.args)
+
+
+class ProfileSnapshot:
+    """Statistiche di un profiler ancora attivo in un altro thread, lette senza disattivarlo"""
+    
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.stats = {}
+    
+    def create_stats(self):                                 # Chiamato da pstats.Stats
+        self.profiler.snapshot_stats()
+        self.stats = self.profiler.stats
+
+
+class ServerProfiler:
+    """
+    Profilazione opzionale del server, attivata con --profile o con la variabile
+    RSA_CHAT_PROFILE (es. "cpu,trace" o "all"). I risultati vanno in una
+    sottodirectory con data e ora di directory:
+    - cpu: un cProfile per thread, uniti in profile.prof e per ruolo del thread
+      in profile-<ruolo>.prof (pstats, snakeviz), più il riepilogo profile.txt.
+      Da Python 3.12 cProfile usa sys.monitoring, che ammette un solo profiler
+      attivo: un unico cProfile di processo vede tutti i thread (profile-process.prof)
+    - memory: snapshot tracemalloc ogni snapshot_interval secondi in
+      memory-<n>.snap (tracemalloc.Snapshot.load) e le differenze in memory.txt
+    - trace: span del percorso dei messaggi in trace.json, formato Chrome
+      Trace Event (chrome://tracing, Perfetto)
+    Da spento il server non crea il profiler e gli span sono un context manager vuoto.
+    """
+    
+    KINDS = ('cpu', 'memory', 'trace')
+    ENV_VAR = 'RSA_CHAT_PROFILE'
+    PER_THREAD_CPU = sys.version_info < (3, 12)     # Un cProfile per thread (prima di sys.monitoring)
+    DIR_ENV_VAR = 'RSA_CHAT_PROFILE_DIR'
+    
+    def __init__(self, kinds=KINDS, directory="profile", snapshot_interval=30.0, max_spans=1_000_000,
+                 memory_frames=10):
+        self.kinds = set(kinds)
+        self.directory = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S"))
+        self.snapshot_interval = snapshot_interval
+        self.max_spans = max_spans                  # Oltre questo numero gli span vengono contati e scartati
+        self.memory_frames = memory_frames          # Frame conservati per ogni allocazione
+        self.profilers = {}                         # ident del thread -> (nome del thread, cProfile.Profile)
+        self.spans = []                             # (nome, inizio ns, fine ns, ident del thread, argomenti)
+        self.dropped_spans = 0
+        self.thread_names = {}
+        self.origin = time.perf_counter_ns()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.running = False
+    
+    @classmethod
+    def from_options(cls, kinds=None, directory=None, **options):
+        """Profiler per i tipi richiesti (o quelli di RSA_CHAT_PROFILE se kinds è None); None se disattivato"""
+        if kinds is None:
+            kinds = os.environ.get(cls.ENV_VAR, '')
+        if isinstance(kinds, str):
+            kinds = [kind.strip() for kind in kinds.split(',') if kind.strip()]
+        kinds = list(kinds)
+        if not kinds or kinds == ['0']:
+            return None
+        if 'all' in kinds or '1' in kinds:
+            kinds = cls.KINDS
+        unknown = set(kinds) - set(cls.KINDS)
+        if unknown:
+            raise ValueError(f"Tipo di profilazione non valido: {', '.join(sorted(unknown))}")
+        return cls(kinds, directory or os.environ.get(cls.DIR_ENV_VAR, "profile"), **options)
+    
+    @property
+    def tracing(self) -> bool:
+        return 'trace' in self.kinds
+    
+    def start(self):
+        """Avvia la profilazione; i thread avviati da qui in poi hanno un cProfile ciascuno"""
+        os.makedirs(self.directory, exist_ok=True)
         self.running = True
+        if 'memory' in self.kinds:
+            tracemalloc.start(self.memory_frames)
+            self.sampler = threading.Thread(target=self._memory_loop, name="profiler-memory")
+            self.sampler.daemon = True
+            self.sampler.start()
+        if 'cpu' in self.kinds:
+            if self.PER_THREAD_CPU:
+                threading.setprofile(self._thread_hook)
+            else:
+                self._start_process_profiler()
+        print(f"📊 Profilazione attiva ({', '.join(sorted(self.kinds))}) in {self.directory}")
+    
+    def _thread_hook(self, frame, event, arg):
+        """Prima chiamata in un nuovo thread: lo sostituisce con il suo cProfile"""
+        sys.setprofile(None)
+        if self.running:
+            self.profile_current_thread()
+    
+    def _start_process_profiler(self):
+        """Un solo cProfile per tutti i thread: i tempi dei thread concorrenti sono approssimati"""
+        profiler = cProfile.Profile()
+        with self.lock:
+            self.profilers[threading.get_ident()] = ("process", profiler)
+        profiler.enable()
+    
+    def profile_current_thread(self):
+        """Attiva un cProfile per il thread corrente (se non ne ha già uno)"""
+        if 'cpu' not in self.kinds or not self.PER_THREAD_CPU:
+            return                                          # Da 3.12 il profiler di processo copre già il thread
+        ident = threading.get_ident()
+        with self.lock:
+            if ident in self.profilers:
+                return
+            profiler = cProfile.Profile()
+            self.profilers[ident] = (threading.current_thread().name, profiler)
+        profiler.enable()
+    
+    def span(self, name, **args) -> TraceSpan:
+        return TraceSpan(self, name, args)
+    
+    def record_span(self, name, start, end, args):
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return
+        ident = threading.get_ident()
+        if ident not in self.thread_names:
+            self.thread_names[ident] = threading.current_thread().name
+        self.spans.append((name, start, end, ident, args))  # append è atomico: nessun lock
+    
+    def _memory_loop(self):
+        previous = None
+        number = 0
+        while not self.stop_event.wait(self.snapshot_interval):
+            number += 1
+            previous = self.take_memory_snapshot(number, previous)
+    
+    def take_memory_snapshot(self, number, previous=None):
+        """Salva uno snapshot tracemalloc e scrive in memory.txt le allocazioni cresciute di più"""
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        snapshot.dump(os.path.join(self.directory, f"memory-{number:04d}.snap"))
+        current, peak = tracemalloc.get_traced_memory()
+        top = snapshot.compare_to(previous, 'lineno') if previous else snapshot.statistics('lineno')
+        with open(os.path.join(self.directory, "memory.txt"), 'a', encoding='utf-8') as f:
+            f.write(f"--- snapshot {number} ({time.strftime('%H:%M:%S')}): "
+                    f"{current / 1024:.0f} KB allocati, picco {peak / 1024:.0f} KB\n")
+            for statistic in top[:10]:
+                f.write(f"{statistic}\n")
+        return snapshot
+    
+    @staticmethod
+    def thread_role(name):
+        """Ruolo di un thread dal nome: 'Thread-3 (handle_client)' -> handle_client, 'rsa-worker_2' -> rsa-worker"""
+        if name.endswith(')') and '(' in name:
+            return name[name.rindex('(') + 1:-1]
+        if name.startswith('writer-'):
+            return 'writer'
+        return name.rstrip('0123456789').rstrip('_-') or name
+    
+    def stop(self):
+        """Ferma la profilazione e scrive i file dei risultati"""
+        if not self.running:
+            return
+        self.running = False
+        self.stop_event.set()
+        if 'cpu' in self.kinds:
+            threading.setprofile(None)
+            self._write_profiles()
+        if 'memory' in self.kinds:
+            self.take_memory_snapshot(0)                    # Stato finale in memory-0000.snap
+            tracemalloc.stop()
+        if self.tracing:
+            self._write_trace()
+        print(f"📊 Profilazione salvata in {self.directory}")
+    
+    def _write_profiles(self):
+        with self.lock:
+            profilers = dict(self.profilers)
+        own = profilers.get(threading.get_ident())
+        if own:
+            own[1].disable()
+        if not self.PER_THREAD_CPU:
+            for _, profiler in profilers.values():         # Il profiler di processo va fermato da qualsiasi thread
+                profiler.disable()
+        
+        by_role = {}
+        for name, profiler in profilers.values():
+            snapshot = ProfileSnapshot(profiler)
+            snapshot.create_stats()
+            if snapshot.stats:                              # pstats rifiuta i profili vuoti
+                by_role.setdefault(self.thread_role(name), []).append(snapshot)
+        if not by_role:
+            return
         
+        everything = None
+        for role, snapshots in by_role.items():
+            stats = pstats.Stats(*snapshots)
+            stats.dump_stats(os.path.join(self.directory, f"profile-{role}.prof"))
+            if everything is None:
+                everything = pstats.Stats(*snapshots)
+            else:
+                everything.add(*snapshots)
+        everything.dump_stats(os.path.join(self.directory, "profile.prof"))
+        with open(os.path.join(self.directory, "profile.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"Thread profilati: {len(profilers)} ({', '.join(sorted(by_role))})\n")
+            pstats.Stats(os.path.join(self.directory, "profile.prof"), stream=f).sort_stats('cumulative').print_stats(40)
+    
+    def _write_trace(self):
+        pid = os.getpid()
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident, 'args': {'name': name}}
+            for ident, name in self.thread_names.items()
+        ]
+        events.extend(
+            {'name': name, 'ph': 'X', 'pid': pid, 'tid': ident, 'ts': (start - self.origin) / 1000,
+             'dur': (end - start) / 1000, 'args': args}
+            for name, start, end, ident, args in list(self.spans)
+        )
+        with open(os.path.join(self.directory, "trace.json"), 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_spans': self.dropped_spans}}, f, default=str)
+
+
+class ClientHandler:
+    """Gestisce la connessione di un singolo client"""
+    
+    INVALID_ACTION_RESPONSE = {
+        'status': 'error', 
+        'message': 'Azione non valida. Usa "register" o "login"'
+    }
+    MAX_BATCH = 32  # Frame già ricevuti processati insieme
+    
+    def __init__(self, client_socket, client_address, server):
+        self.client_socket = client_socket
+        # Fino al login il buffer di ricezione non cresce oltre HANDSHAKE_FRAME_SIZE: un client non
+        # autenticato non può far allocare al server frame da MAX_FRAME_SIZE
+        self.transport = (FramedSocket(client_socket, max_frame_size=FramedSocket.HANDSHAKE_FRAME_SIZE)
+                          if client_socket else None)
+        self.client_address = client_address
+        self.server = server
+        self.rsa = server.rsa
+        self.authenticator = server.authenticator
+        self.client_public_key = None
+        self.server_public_key = None   # Chiavi del server usate per questa sessione
+        self.server_private_key = None
+        self.current_user = None
+        self.authenticated = False
+        self.running = True
+        self.encryption_mode = 'rsa'    # Modalità negoziata: 'hybrid' o 'rsa' (compatibilità)
+        self.session_cipher = None      # Cifrario simmetrico della sessione (modalità ibrida)
+        self.codec = JSON_CODEC         # Formato dei messaggi (negoziato nello scambio chiavi)
+        self.compression = False        # Compressione dei messaggi RSA (negoziata)
+        self.outbound = None            # Coda di uscita con writer dedicato (avviata dopo il login)
+    
     def handle_client(self):
         """Gestisce l'intera sessione del client"""
         try:
@@ -383,22 +2143,46 @@ class ClientHandler:
     def exchange_public_keys(self):
         """Scambia le chiavi pubbliche con il client"""
         try:
-            # Invia la propria chiave pubblica
-            key_data = {
-                'e': self.server.public_key[0],
-                'n': self.server.public_key[1]
-            }
-            self.send_json_message(key_data)
-            
-            # Ricevi la chiave pubblica del client
-            client_key_data = self.receive_json_message()
-            self.client_public_key = (client_key_data['e'], client_key_data['n'])
-            print(f"🔑 Chiave pubblica client ricevuta da {self.client_address}")
+            with self.server.metrics.time('handshake_seconds'):
+                # Invia la propria chiave pubblica
+                self.send_json_message(self.build_server_key_message())
+                
+                # Ricevi la chiave pubblica del client
+                self.accept_client_key(self.receive_json_message())
             
         except Exception as e:
+            self.server.metrics.inc('handshake_failures_total')
             print(f"❌ Errore nello scambio chiavi con {self.client_address}: {e}")
             raise
     
+    def build_server_key_message(self):
+        """Prepara il messaggio con la chiave pubblica del server e le modalità supportate"""
+        # Fissa le chiavi del server per tutta la sessione (sopravvive a una rotazione)
+        self.server_public_key, self.server_private_key = self.server.key_store.get_keys()
+        
+        return {
+            'e': self.server_public_key[0],
+            'n': self.server_public_key[1],
+            'modes': list(self.server.encryption_modes),  # Modalità di cifratura supportate
+            'wire_formats': list(WIRE_CODECS),            # Formati dei messaggi supportati
+            'compression': ['zlib']                       # Compressione prima dei blocchi RSA
+        }
+    
+    def accept_client_key(self, client_key_data):
+        """Registra la chiave pubblica del client e la modalità di cifratura richiesta"""
+        self.client_public_key = (client_key_data['e'], client_key_data['n'])
+        
+        # I client che non indicano una modalità usano la cifratura RSA a blocchi
+        requested_mode = client_key_data.get('mode', 'rsa')
+        if requested_mode in self.server.encryption_modes:
+            self.encryption_mode = requested_mode
+        
+        # Da qui in poi i messaggi usano il formato scelto dal client (JSON se non indicato)
+        self.codec = WIRE_CODECS.get(client_key_data.get('wire_format'), JSON_CODEC)
+        self.compression = client_key_data.get('compression') == 'zlib'  # Il client sa decomprimere
+        print(f"🔑 Chiave pubblica client ricevuta da {self.client_address} "
+              f"(modalità {self.encryption_mode}, formato {self.codec.name})")
+    
     def handle_authentication(self) -> bool:
         """Gestisce il processo di autenticazione completo"""
         try:
@@ -418,12 +2202,14 @@ class ClientHandler:
                         
                 elif action == 'login':
                     return self.handle_login(auth_request)
-                    
+                
+                elif action == 'resume':
+                    if self.handle_resume(auth_request):
+                        return True
+                    continue  # Ticket rifiutato: il client può fare il login completo
+                
                 else:
-                    self.send_json_message({
-                        'status': 'error', 
-                        'message': 'Azione non valida. Usa "register" o "login"'
-                    })
+                    self.send_json_message(self.INVALID_ACTION_RESPONSE)
                     
         except Exception as e:
             print(f"❌ Errore nell'autenticazione con {self.client_address}: {e}")
@@ -433,100 +2219,216 @@ class ClientHandler:
     
     def handle_registration(self, request) -> bool:
         """Gestisce la registrazione di un nuovo utente"""
+        success, response = self.register(request)
+        self.send_json_message(response)
+        self.server.metrics.inc('registrations_total', result='success' if success else 'failure')
+        return success
+    
+    def register(self, request):
+        """Registra l'utente richiesto; ritorna (successo, risposta da inviare)"""
         username = request.get('username')
         
         if not username:
-            self.send_json_message({'status': 'error', 'message': 'Username mancante'})
-            return False
+            return False, {'status': 'error', 'message': 'Username mancante'}
         
         # Usa la chiave pubblica del client per la registrazione
         if self.authenticator.register_user(username, self.client_public_key):
-            self.send_json_message({
+            return True, {
                 'status': 'success', 
                 'message': f'Utente {username} registrato con successo! Ora puoi fare login.'
-            })
-            return True
+            }
         else:
-            self.send_json_message({
+            return False, {
                 'status': 'error', 
                 'message': 'Utente già esistente'
-            })
-            return False
+            }
     
     def handle_login(self, request) -> bool:
         """Gestisce il processo di login con challenge-response"""
+        with self.server.metrics.time('login_seconds'):
+            success = self._login(request)
+        self.server.metrics.inc('logins_total', result='success' if success else 'failure')
+        return success
+    
+    def _login(self, request) -> bool:
+        error, challenge_message, original_challenge = self.start_login(request)
+        if error:
+            self.send_json_message(error)
+            return False
+        
+        # Invia challenge cifrato
+        self.send_json_message(challenge_message)
+        
+        # Ricevi risposta al challenge
+        response_message = self.receive_json_message()
+        if not response_message:
+            return False
+        
+        success, reply = self.complete_login(request.get('username'), original_challenge, response_message)
+        self.send_json_message(reply)
+        if success:
+            self.join_chat()
+        return success
+
+    def start_login(self, request):
+        """Prima fase del login: ritorna (errore, messaggio di challenge, challenge originale)"""
         username = request.get('username')
         
         if not username:
-            self.send_json_message({'status': 'error', 'message': 'Username mancante'})
-            return False
+            return {'status': 'error', 'message': 'Username mancante'}, None, None
         
         # Controlla se l'utente esiste
         if not self.authenticator.user_exists(username):
-            self.send_json_message({'status': 'error', 'message': 'Utente non registrato'})
-            return False
+            return {'status': 'error', 'message': 'Utente non registrato'}, None, None
         
-        # Genera e invia challenge
+        # Genera challenge
         result = self.authenticator.create_challenge_for_user(username)
         if not result:
-            self.send_json_message({'status': 'error', 'message': 'Errore nella generazione del challenge'})
-            return False
+            return {'status': 'error', 'message': 'Errore nella generazione del challenge'}, None, None
         
         encrypted_challenge, original_challenge = result
         
-        # Invia challenge cifrato
         challenge_message = {
             'status': 'challenge',
             'encrypted_challenge': encrypted_challenge,
             'message': 'Decritta il challenge con la tua chiave privata'
         }
-        self.send_json_message(challenge_message)
-        
-        # Ricevi risposta al challenge
-        response_message = self.receive_json_message()
-        if not response_message:
-            return False
-            
+        return None, challenge_message, original_challenge
+    
+    def complete_login(self, username, original_challenge, response_message):
+        """Seconda fase del login: verifica la risposta; ritorna (successo, risposta da inviare)"""
         challenge_response = response_message.get('challenge_response')
         
         if challenge_response is None:
-            self.send_json_message({'status': 'error', 'message': 'Risposta al challenge mancante'})
-            return False
+            return False, {'status': 'error', 'message': 'Risposta al challenge mancante'}
         
         # Verifica risposta
-        if self.authenticator.verify_challenge_response(username, original_challenge, challenge_response):
-            self.current_user = username
-            self.authenticated = True
-            
-            # Aggiungi il client alla lista dei client connessi
-            self.server.add_authenticated_client(self)
-            
-            self.send_json_message({
-                'status': 'authenticated', 
-                'message': f'Benvenuto {username}! Autenticazione completata.'
-            })
-            return True
+        if not self.authenticator.verify_challenge_response(username, original_challenge, challenge_response):
+            return False, {'status': 'error', 'message': 'Challenge response non valido'}
+        
+        self.current_user = username
+        self.authenticated = True
+        
+        auth_response = {
+            'status': 'authenticated', 
+            'message': f'Benvenuto {username}! Autenticazione completata.'
+        }
+        
+        user_public_key = self.authenticator.get_user_public_key(username)
+        if self.encryption_mode == 'hybrid':
+            # Chiave di sessione cifrata con la chiave pubblica registrata dell'utente
+            resume_key = os.urandom(SessionCipher.KEY_SIZE)
+            auth_response['wrapped_session_key'] = self.rsa.encrypt(
+                int.from_bytes(resume_key, 'big'), user_public_key
+            )
+            self.session_cipher = SessionCipher(resume_key, SessionCipher.SERVER)
         else:
-            self.send_json_message({'status': 'error', 'message': 'Challenge response non valido'})
-            return False
+            # Modalità RSA: chiave di ripresa dedicata, cifrata allo stesso modo
+            resume_key = os.urandom(ResumptionTickets.KEY_SIZE)
+            auth_response['wrapped_resume_key'] = self.rsa.encrypt(
+                int.from_bytes(resume_key, 'big'), user_public_key
+            )
+        
+        # Ticket per riprendere la sessione senza operazioni RSA
+        auth_response['ticket'] = self.server.tickets.issue(
+            username, ResumptionTickets.login_secret(resume_key), self.encryption_mode
+        )
+        return True, auth_response
+    
+    def handle_resume(self, request) -> bool:
+        """Gestisce la ripresa di una sessione con un ticket"""
+        success, reply = self.resume(request)
+        self.send_json_message(reply)
+        if success:
+            self.join_chat()
+        return success
+    
+    def resume(self, request):
+        """Verifica il ticket di ripresa; ritorna (successo, risposta da inviare)"""
+        username = request.get('username')
+        client_nonce = request.get('nonce')
+        secret = self.server.tickets.redeem(username, request.get('ticket'), client_nonce, request.get('proof'),
+                                            self.encryption_mode)
+        if secret is None:
+            return False, {'status': 'error', 'message': 'Ticket non valido o scaduto'}
+        
+        self.current_user = username
+        self.authenticated = True
+        self.authenticator.start_session(username)
+        
+        # Nuova chiave di sessione e nuovo ticket, legati ai nonce di entrambe le parti
+        server_nonce = os.urandom(16)
+        nonces = client_nonce + server_nonce
+        if self.encryption_mode == 'hybrid':
+            self.session_cipher = SessionCipher(ResumptionTickets.derive(secret, b"session", nonces),
+                                                SessionCipher.SERVER)
+        return True, {
+            'status': 'authenticated',
+            'message': f'Bentornato {username}! Sessione ripresa.',
+            'nonce': server_nonce,
+            'ticket': self.server.tickets.issue(username, ResumptionTickets.derive(secret, b"resume", nonces),
+                                                self.encryption_mode)
+        }
+    
+    def join_chat(self):
+        """
+        Dopo l'invio della risposta di login: avvia la coda di uscita e aggiunge
+        il client a quelli connessi (nessun messaggio di chat precede la risposta)
+        """
+        self.allow_large_frames()
+        self.start_outbound_queue()
+        self.server.add_authenticated_client(self)
+    
+    def allow_large_frames(self):
+        """Dopo il login: frame fino a MAX_FRAME_SIZE (chunk dei file, messaggi RSA lunghi)"""
+        self.transport.max_frame_size = FramedSocket.MAX_FRAME_SIZE
+        
+    def start_outbound_queue(self):
+        """Avvia la coda di uscita del client con il suo thread writer"""
+        self.outbound = OutboundQueue(
+            self.traced_send_frame if self.server.tracer else self.transport.send_frame, self.handle_outbound_failure,
+            max_size=self.server.outbound_queue_size,
+            policy=self.server.outbound_policy,
+            block_timeout=self.server.outbound_block_timeout,
+            name=f"writer-{self.current_user}"
+        )
+    
+    def traced_send_frame(self, frame):
+        """Invio di un frame dal writer, registrato nella traccia"""
+        with self.span('send', bytes=len(frame)):
+            self.transport.send_frame(frame)
+    
+    def span(self, name, **args):
+        """Span della traccia del profiler (un context manager vuoto se la traccia è spenta)"""
+        tracer = self.server.tracer
+        if tracer is None:
+            return NULL_SPAN
+        return tracer.span(name, user=self.current_user, **args)
+    
+    def handle_outbound_failure(self, reason):
+        """Disconnette il client quando la sua coda di uscita non può più essere servita"""
+        if self.running:
+            print(f"🐢 Disconnessione di {self.current_user} da {self.client_address}: {reason}")
+        self.running = False
+        self.close_connection()
     
+    def get_outbound_stats(self):
+        """Statistiche della coda di uscita (profondità, invii, scarti)"""
+        return self.outbound.get_stats() if self.outbound else None
+    
+    def outbound_depth(self) -> int:
+        """Messaggi in attesa nella coda di uscita"""
+        return self.outbound.depth() if self.outbound else 0
+
     def start_encrypted_chat(self):
         """Avvia la chat crittografata dopo l'autenticazione"""
         print(f"💬 Chat attiva per {self.current_user} da {self.client_address}")
         
-        # Thread per ricevere messaggi da questo client
-        receive_thread = threading.Thread(target=self.receive_messages)
-        receive_thread.daemon = True
-        receive_thread.start()
-        
-        # Mantieni il thread attivo
-        try:
-            receive_thread.join()
-        except:
-            pass
+        # La ricezione gira direttamente nel thread del client: niente thread aggiuntivo
+        self.receive_messages()
     
     def receive_messages(self):
-        """Thread per ricevere e processare messaggi del client"""
+        """Riceve e processa i messaggi del client"""
         try:
             while self.running:
                 # Ricevi il messaggio cifrato
@@ -535,115 +2437,808 @@ class ClientHandler:
                 if not message_data:
                     break
                 
-                encrypted_blocks = message_data.get('blocks', [])
-                signature = message_data.get('signature')
-                message_type = message_data.get('type', 'broadcast')  # default broadcast
-                target_user = message_data.get('target')  # per messaggi privati
-                
-                # Decifra il messaggio
-                decrypted_message = self.rsa.decrypt_string(encrypted_blocks, self.server.private_key)
+                # I frame già arrivati insieme vengono processati in un solo lotto
+                batch = [message_data]
+                while len(batch) < self.MAX_BATCH and self.transport.has_buffered_frame():
+                    batch.append(self.receive_json_message())
                 
-                # Verifica la firma se presente
-                signature_valid = False
-                if signature:
-                    signature_valid = self.authenticator.verify_signature(
-                        decrypted_message, signature, self.client_public_key
-                    )
-                
-                if decrypted_message.lower() == 'quit':
-                    print(f"📨 {self.current_user} ha lasciato la chat")
-                    self.running = False
+                if not self.process_messages([message for message in batch if message]) or not all(batch):
                     break
                 
-                # Gestisci il messaggio in base al tipo
-                if message_type == 'private' and target_user:
-                    # Messaggio privato
-                    self.server.send_private_message(
-                        self.current_user, target_user, decrypted_message, signature_valid
-                    )
-                else:
-                    # Messaggio broadcast (default)
-                    self.server.broadcast_message(
-                        self.current_user, decrypted_message, signature_valid, exclude_sender=True
-                    )
-                
         except Exception as e:
             if self.running:
                 print(f"❌ Errore nella ricezione da {self.current_user}: {e}")
             self.running = False
     
-    def send_message_to_client(self, sender: str, message: str, signature_valid: bool = False, message_type: str = "broadcast"):
-        """Invia un messaggio cifrato al client"""
+    def process_message(self, message_data) -> bool:
+        """Decifra, verifica e instrada un messaggio del client; False se il client esce"""
+        return self.process_messages([message_data])
+    
+    def process_messages(self, batch) -> bool:
+        """Come process_message per un lotto di messaggi: le firme si verificano in una chiamata"""
+        with self.span('receive', frames=len(batch)):
+            return self._process_messages(batch)
+    
+    def _process_messages(self, batch) -> bool:
+        # I frame dei trasferimenti di file vanno al relay, non alla chat; l'ordine del batch resta
+        # quello di arrivo, quindi i messaggi di chat precedenti un frame di file partono prima di esso
+        self.authenticator.touch_session(self.current_user)
+        chat_batch = []
+        for message_data in batch:
+            if message_data.get('type') != 'file':
+                chat_batch.append(message_data)
+                continue
+            if not self._process_chat_batch(chat_batch):
+                return False
+            chat_batch = []
+            self.server.file_relay.relay(self, open_file_frame(
+                message_data, self.codec, self.session_cipher, self.rsa, self.server_private_key
+            ))
+        return self._process_chat_batch(chat_batch)
+    
+    def _process_chat_batch(self, chat_batch) -> bool:
+        """Decifra, verifica (in blocco) e instrada messaggi di chat consecutivi; False se il client esce"""
+        if not chat_batch:
+            return True
+        opened = [self.open_message(message_data) for message_data in chat_batch]
+        
+        # Verifica le firme presenti
+        signed = [(decrypted_message, signature, self.client_public_key)
+                  for decrypted_message, signature, _, _ in opened if signature]
+        verified = []
+        if signed:
+            with self.span('verify', signatures=len(signed)), self.server.metrics.time('signature_verify_seconds'):
+                verified = self.authenticator.verify_signatures(signed)
+            valid = sum(verified)
+            self.server.metrics.inc('signatures_total', valid, result='valid')
+            self.server.metrics.inc('signatures_total', len(verified) - valid, result='invalid')
+        
+        results = iter(verified)
+        for decrypted_message, signature, message_type, target_user in opened:
+            signature_valid = next(results) if signature else False
+            with self.span('route', type=message_type):
+                if not self.route_message(decrypted_message, signature_valid, message_type, target_user):
+                    return False
+        return True
+    
+    def open_message(self, message_data):
+        """Decifra un messaggio; ritorna (testo, firma, tipo, destinatario)"""
+        if self.session_cipher and 'payload' in message_data:
+            # Modalità ibrida: un solo payload con cifratura simmetrica autenticata
+            with self.span('decrypt', mode='hybrid'), self.server.metrics.time('decrypt_seconds', mode='hybrid'):
+                message_data = self.session_cipher.decrypt_message(message_data['payload'], self.codec)
+            decrypted_message = message_data.get('message', '')
+        else:
+            # Decifra il messaggio (modalità RSA a blocchi)
+            encrypted_blocks = message_data.get('blocks', [])
+            with self.span('decrypt', mode='rsa'), self.server.metrics.time('decrypt_seconds', mode='rsa'):
+                decrypted_message = self.rsa.decrypt_string(encrypted_blocks, self.server_private_key,
+                                                             message_data.get('compressed', False))
+        
+        signature = message_data.get('signature')
+        message_type = message_data.get('type', 'broadcast')  # default broadcast
+        target_user = message_data.get('target')  # per messaggi privati
+        return decrypted_message, signature, message_type, target_user
+    
+    def route_message(self, decrypted_message, signature_valid, message_type, target_user) -> bool:
+        """Instrada un messaggio decifrato; False se il client esce"""
+        if decrypted_message.lower() == 'quit':
+            print(f"📨 {self.current_user} ha lasciato la chat")
+            self.running = False
+            return False
+        
+        if decrypted_message.strip() == '/stats':
+            self.send_stats()
+            return True
+        
+        self.server.metrics.inc('messages_total', type='private' if message_type == 'private' and target_user
+                                else 'broadcast')
+        
+        # Gestisci il messaggio in base al tipo
+        if message_type == 'private' and target_user:
+            # Messaggio privato
+            self.server.send_private_message(
+                self.current_user, target_user, decrypted_message, signature_valid, origin=self
+            )
+        else:
+            # Messaggio broadcast (default)
+            self.server.broadcast_message(
+                self.current_user, decrypted_message, signature_valid, exclude_sender=True
+            )
+        return True
+    
+    def send_stats(self):
+        """Risponde a /stats con il riepilogo delle metriche (solo amministratori)"""
+        if self.current_user not in self.server.admins:
+            self.send_message_to_client("Sistema", "Il comando /stats è riservato agli amministratori", True, "error")
+            return
+        summary = "\n".join(self.server.metrics.summary())
+        self.send_message_to_client("Sistema", f"Metriche del server:\n{summary}", True, "system")
+    
+    @staticmethod
+    def message_lane(sender: str, message_type: str) -> str:
+        """Corsia della coda di uscita: i messaggi di sistema precedono la chat"""
+        return 'system' if sender == "Sistema" or message_type in ("system", "error") else 'chat'
+    
+    def send_message_to_client(self, sender: str, message: str, signature_valid: bool = False,
+                               message_type: str = "broadcast", signature: Optional[int] = None) -> bool:
+        """Invia un messaggio cifrato al client (signature: firma del server già calcolata); False se non accodato"""
+        def seal():
+            with self.span('encrypt', sender=sender, type=message_type):
+                return self.seal_message(sender, message, signature_valid, message_type, signature)
+        return self.queue_sealed(seal, self.message_lane(sender, message_type))
+    
+    def queue_sealed(self, seal, lane='chat') -> bool:
+        """
+        Accoda un messaggio cifrato da seal() nel writer al momento dell'invio, così cifratura
+        e invio seguono l'ordine della coda. Prima del login cifra e invia subito.
+        False se il messaggio non è stato accodato (coda chiusa o piena) o l'invio è fallito.
+        """
+        if self.outbound:
+            return self.outbound.put(lambda: self.codec.encode(seal()), lane)
         try:
-            # Cifra il messaggio con la chiave pubblica del client
-            encrypted_blocks = self.rsa.encrypt_string(message, self.client_public_key)
-            
-            # Firma il messaggio con la chiave privata del server
-            signature = self.authenticator.sign_message(message, self.server.private_key)
-            
-            # Prepara i dati da inviare
-            message_data = {
-                'blocks': encrypted_blocks,
-                'signature': signature,
+            self.send_json_message(seal(), lane)
+        except Exception as e:
+            print(f"❌ Errore nell'invio messaggio a {self.current_user}: {e}")
+            return False
+        return self.running
+        
+    def seal_message(self, sender, message, signature_valid, message_type, signature=None):
+        """Cifra un messaggio per il client: payload della sessione o blocchi RSA firmati"""
+        if self.session_cipher:
+            # Modalità ibrida: il MAC della sessione autentica già il server
+            return {'payload': self.session_cipher.encrypt_message({
+                'message': message,
                 'sender': sender,
                 'signature_valid': signature_valid,
                 'type': message_type
-            }
-            
-            # Invia il messaggio
-            self.send_json_message(message_data)
-            
-        except Exception as e:
-            print(f"❌ Errore nell'invio messaggio a {self.current_user}: {e}")
+            }, self.codec)}
+        
+        # Cifra il messaggio con la chiave pubblica del client (compresso se conviene)
+        encrypted_blocks, compressed = self.rsa.encrypt_text(message, self.client_public_key, self.compression)
+        
+        # Firma il messaggio con la chiave privata del server (se non già firmato)
+        if signature is None:
+            signature = self.authenticator.sign_message(message, self.server_private_key)
+        
+        # Prepara i dati da inviare
+        message_data = {
+            'blocks': encrypted_blocks,
+            'signature': signature,
+            'sender': sender,
+            'signature_valid': signature_valid,
+            'type': message_type
+        }
+        if compressed:
+            message_data['compressed'] = True
+        return message_data
     
-    def send_json_message(self, data):
-        """Invia un messaggio JSON"""
+    def send_file_frame(self, fields):
+        """Invia un frame di trasferimento file; chunk e fine trasferimento nella corsia della chat"""
+        lane = 'chat' if fields.get('file') in ('chunk', 'done') else 'system'
+        # Cifrato dal writer come gli altri messaggi: i contatori della sessione seguono l'ordine di invio
+        self.queue_sealed(lambda: seal_file_frame(
+            fields, self.codec, self.session_cipher, self.rsa, self.client_public_key
+        ), lane)
+    
+    def send_json_message(self, data, lane='system'):
+        """
+        Invia un messaggio (JSON o binario, secondo il formato negoziato).
+        Dopo il login passa dalla coda di uscita del client nella corsia indicata.
+        """
         try:
-            message = json.dumps(data).encode('utf-8')
-            self.client_socket.send(len(message).to_bytes(4, 'big'))
-            self.client_socket.send(message)
+            frame = self.codec.encode(data)
+            if self.outbound:
+                self.outbound.put(frame, lane)
+            else:
+                self.transport.send_frame(frame)
         except:
             self.running = False
-    
+
     def receive_json_message(self):
-        """Riceve un messaggio JSON"""
+        """Riceve un messaggio (JSON o binario, secondo il formato negoziato)"""
         try:
-            length_bytes = self.client_socket.recv(4)
-            if not length_bytes:
+            message = self.transport.receive_frame()
+            if message is None:
                 return None
-                
-            length = int.from_bytes(length_bytes, 'big')
-            message = self.client_socket.recv(length).decode('utf-8')
-            return json.loads(message)
+            return self.codec.decode(message)
         except:
             return None
     
     def cleanup(self):
         """Pulisce le risorse del client"""
         self.running = False
+        if self.outbound:
+            self.outbound.close()
         try:
             if self.current_user:
-                self.authenticator.logout_user(self.current_user)
                 self.server.remove_authenticated_client(self)
+                self.server.file_relay.drop_client(self)
+                # Logout solo quando si chiude l'ultima sessione dell'utente
+                if not self.server.is_user_online(self.current_user):
+                    self.authenticator.logout_user(self.current_user)
                 self.server.broadcast_user_list()
-            if self.client_socket:
-                self.client_socket.close()
+            self.close_connection()
             print(f"🧹 Connessione chiusa per {self.current_user or 'client non autenticato'} da {self.client_address}")
         except:
             pass
+    
+    def end_session(self, reason):
+        """Chiude la sessione dal lato server (es. scadenza); cleanup() segue nel thread del client"""
+        if self.running:
+            print(f"⌛ Disconnessione di {self.current_user} da {self.client_address}: {reason}")
+        self.running = False
+        self.close_connection()
+    
+    def close_connection(self):
+        """Chiude il socket del client (shutdown sblocca anche il thread fermo in ricezione)"""
+        if self.client_socket:
+            try:
+                self.client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.client_socket.close()
+
+
+class ServerKeyStore:
+    """
+    Archivio persistente della chiave del server in un file binario compatto.
+    La chiave viene caricata solo al primo utilizzo e, se è configurato un
+    intervallo di rotazione, rigenerata quando diventa troppo vecchia.
+    
+    Formato: 'RSAK' | versione (1 byte) | creazione (double) | numero campi (1 byte)
+             | per ogni campo: lunghezza (2 byte) + intero big-endian
+    """
+    
+    MAGIC = b'RSAK'
+    VERSION = 1
+    HEADER = struct.Struct('>4sBdB')
+    FIELD_LENGTH = struct.Struct('>H')
+    
+    def __init__(self, rsa_generator, key_file="server_key.bin", rotation_interval=None, startup_generator=None):
+        self.rsa = rsa_generator
+        # Generatore della prima chiave all'avvio (es. ricerca parallela); le rotazioni usano self.rsa
+        self.startup_generator = startup_generator or rsa_generator
+        self.key_file = key_file
+        self.rotation_interval = rotation_interval  # Secondi di validità della chiave (None = mai)
+        # (chiave pubblica, chiave privata) in un solo attributo: il percorso veloce di get_keys lo legge
+        # senza lock e una rotazione lo sostituisce con un unico assegnamento, mai una coppia mista
+        self.keys = None
+        self.created_at = None
+        self.lock = threading.Lock()
+    
+    def get_keys(self):
+        """Ritorna (chiave pubblica, chiave privata), caricandole o generandole se necessario"""
+        keys = self.keys
+        if keys is not None and not self._rotation_due():
+            return keys                                     # Percorso veloce: chiave già in memoria
+        
+        with self.lock:
+            if self.keys is None:
+                self._load_or_generate()
+            if self._rotation_due():
+                print("🔄 Chiave del server scaduta, rotazione in corso...")
+                self._generate_and_save()
+            return self.keys
+    
+    def rotate(self):
+        """Forza la rotazione della chiave del server"""
+        with self.lock:
+            self._generate_and_save()
+    
+    def _rotation_due(self) -> bool:
+        return (self.rotation_interval is not None and self.created_at is not None
+                and time.time() - self.created_at >= self.rotation_interval)
+    
+    def _load_or_generate(self):
+        try:
+            if os.path.exists(self.key_file):
+                with open(self.key_file, 'rb') as f:
+                    self._decode(f.read())
+                print(f"📂 Chiave del server caricata da {self.key_file}")
+                return
+        except Exception as e:
+            print(f"⚠️ Errore nel caricamento della chiave del server: {e}")
+        self._generate_and_save(self.startup_generator)
+    
+    def _generate_and_save(self, rsa_generator=None):
+        public_key, private_key = (rsa_generator or self.rsa).generate_keys()
+        self.keys = (public_key, private_key)
+        self.created_at = time.time()
+        try:
+            _atomic_write(self.key_file, self._encode())
+            print(f"💾 Chiave del server salvata in {self.key_file}")
+        except Exception as e:
+            print(f"⚠️ Errore nel salvataggio della chiave del server: {e}")
+    
+    def _encode(self) -> bytes:
+        """Serializza la coppia di chiavi nel formato binario"""
+        public_key, private_key = self.keys
+        fields = (public_key[0],) + tuple(private_key)      # e, d, n, p, q, dP, dQ, qInv
+        parts = [self.HEADER.pack(self.MAGIC, self.VERSION, self.created_at, len(fields))]
+        for value in fields:
+            value_bytes = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+            parts.append(self.FIELD_LENGTH.pack(len(value_bytes)))
+            parts.append(value_bytes)
+        return b''.join(parts)
+    
+    def _decode(self, data: bytes):
+        """Legge la coppia di chiavi dal formato binario"""
+        magic, version, created_at, count = self.HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError("Formato del file della chiave non riconosciuto")
+        
+        offset = self.HEADER.size
+        fields = []
+        for _ in range(count):
+            (length,) = self.FIELD_LENGTH.unpack_from(data, offset)
+            offset += self.FIELD_LENGTH.size
+            fields.append(int.from_bytes(data[offset:offset + length], 'big'))
+            offset += length
+        
+        if count != 8:
+            raise ValueError(f"Numero di campi non valido nel file della chiave: {count}")
+        
+        self.keys = ((fields[0], fields[2]),                # (e, n)
+                     tuple(fields[1:]))                     # (d, n, p, q, dP, dQ, qInv)
+        self.created_at = created_at
+
+
+class BroadcastFanout:
+    """
+    Distribuzione dei broadcast. Il broadcast entra subito nella coda di uscita
+    di ogni destinatario, lo stesso percorso dei messaggi privati e di sistema,
+    quindi l'ordine relativo è quello di invio. La cifratura per ogni
+    destinatario avviene nel writer del client al momento dell'invio; la firma
+    del server (modalità RSA) viene calcolata una sola volta per ogni chiave del
+    server in uso. Non c'è un pool di thread: l'esponenziazione modulare in
+    Python puro tiene il GIL e più thread non cifrerebbero in parallelo.
+    """
+    
+    def __init__(self, server, slow_broadcast_ms=500):
+        self.server = server
+        self.slow_broadcast_ms = slow_broadcast_ms  # Soglia oltre la quale il broadcast viene segnalato
+        self.stats = {
+            'broadcasts': 0, 'recipients': 0, 'failures': 0,
+            'last_latency_ms': 0.0, 'max_latency_ms': 0.0, 'total_latency_ms': 0.0, 'measured': 0
+        }
+        self.stats_lock = threading.Lock()
+    
+    def submit(self, sender: str, message: str, signature_valid: bool, recipients):
+        """Accoda un broadcast verso i destinatari indicati"""
+        queued_at = time.perf_counter()
+        remaining = [len(recipients)]   # Destinatari per cui il messaggio non è ancora stato cifrato
+        
+        # Una firma per ogni chiave del server in uso nelle connessioni RSA (i client ibridi non ne hanno
+        # bisogno): dopo una rotazione le connessioni aperte prima mantengono la chiave del loro handshake
+        signatures = {}
+        for client in recipients:
+            if not client.session_cipher and client.server_private_key not in signatures:
+                signatures[client.server_private_key] = self.server.authenticator.sign_message(
+                    message, client.server_private_key
+                )
+        
+        def sealer(client):
+            def seal():
+                with client.span('encrypt', sender=sender, type="broadcast"):
+                    message_data = client.seal_message(sender, message, signature_valid, "broadcast",
+                                                       signatures.get(client.server_private_key))
+                self._sealed(queued_at, sender, remaining)
+                return message_data
+            return seal
+        
+        failed = [client for client in recipients
+                  if not client.queue_sealed(sealer(client), client.message_lane(sender, "broadcast"))]
+        
+        self.server.metrics.inc('broadcast_recipients_total', len(recipients))
+        with self.stats_lock:
+            self.stats['broadcasts'] += 1
+            self.stats['recipients'] += len(recipients)
+            self.stats['failures'] += len(failed)
+        
+        for client in failed:                               # Rimuovi i client non raggiungibili
+            self.server.remove_authenticated_client(client)
+    
+    def _sealed(self, queued_at, sender, remaining):
+        """Messaggio cifrato per un destinatario: con l'ultimo registra la latenza del broadcast"""
+        # Un messaggio scartato dalla coda di un client lento non viene mai cifrato:
+        # quel broadcast non contribuisce alla latenza
+        with self.stats_lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+            latency_ms = (time.perf_counter() - queued_at) * 1000
+            self.stats['measured'] += 1
+            self.stats['last_latency_ms'] = latency_ms
+            self.stats['max_latency_ms'] = max(self.stats['max_latency_ms'], latency_ms)
+            self.stats['total_latency_ms'] += latency_ms
+        self.server.metrics.observe('broadcast_seconds', latency_ms / 1000)
+        
+        if latency_ms > self.slow_broadcast_ms:
+            print(f"🐢 Broadcast di {sender}: ultimo destinatario dopo {latency_ms:.1f} ms")
+    
+    def get_stats(self):
+        """Statistiche dei broadcast, inclusa la latenza media"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['avg_latency_ms'] = stats['total_latency_ms'] / stats['measured'] if stats['measured'] else 0.0
+        return stats
+
+
+class SessionSweeper:
+    """
+    Unico thread in background che ogni interval secondi fa scadere le sessioni
+    inattive: logout dell'utente e disconnessione di tutte le sue sessioni.
+    """
+    
+    def __init__(self, server, interval=5.0):
+        self.server = server
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._sweep_loop, name="session-sweeper")
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def _sweep_loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"❌ Errore nella scadenza delle sessioni: {e}")
+    
+    def sweep(self) -> list:
+        """Esegue una sweep e disconnette i client delle sessioni scadute"""
+        expired = self.server.authenticator.expire_sessions()
+        for username in expired:
+            for client in self.server.connections.lookup(username):
+                client.end_session("sessione scaduta")
+        return expired
+    
+    def shutdown(self):
+        self.stop_event.set()
+
+
+class ResumptionTickets:
+    """
+    Ticket di ripresa della sessione. Dopo un login il server consegna un ticket
+    opaco (id casuale | scadenza | MAC) e conserva in una cache LRU limitata il
+    segreto di ripresa, ricavato da una chiave consegnata cifrata con la chiave
+    pubblica registrata dell'utente (la chiave di sessione, o in modalità RSA
+    una chiave di ripresa dedicata). Il ticket vale solo per la modalità di
+    cifratura con cui è stato emesso.
+    Alla riconnessione il client presenta ticket, nonce e HMAC(segreto, ticket +
+    nonce): la verifica costa due HMAC invece delle operazioni RSA del login. I
+    ticket sono monouso: ogni ripresa ne consegna uno nuovo.
+    """
+    
+    TICKET = struct.Struct('>16sd16s')      # id, scadenza (epoch), MAC troncato
+    KEY_SIZE = 32                           # Byte della chiave di ripresa in modalità RSA
+    
+    def __init__(self, lifetime=600, max_tickets=10000):
+        self.lifetime = lifetime            # Validità di un ticket in secondi
+        self.max_tickets = max_tickets      # Oltre questo numero si scartano i meno recenti
+        self.key = os.urandom(32)           # Chiave del MAC dei ticket (solo in memoria)
+        self.cache = collections.OrderedDict()  # id -> (username, segreto, scadenza, modalità)
+        self.lock = threading.Lock()
+        self.stats = {'issued': 0, 'resumed': 0, 'rejected': 0, 'evicted': 0}
+    
+    @staticmethod
+    def derive(key: bytes, label: bytes, data: bytes) -> bytes:
+        """Deriva un valore da 32 byte (segreto di ripresa, chiave di sessione) con HMAC-SHA256"""
+        return hmac.new(key, label + data, hashlib.sha256).digest()
+    
+    @staticmethod
+    def login_secret(key: bytes) -> bytes:
+        """
+        Segreto di ripresa dopo un login, dalla chiave di sessione o di ripresa:
+        mai da valori passati in chiaro (come la risposta al challenge)
+        """
+        return ResumptionTickets.derive(key, b"resume", b"")
+    
+    @staticmethod
+    def proof(secret: bytes, ticket: bytes, nonce: bytes) -> bytes:
+        """Prova di possesso del segreto, legata al nonce della riconnessione"""
+        return hmac.new(secret, ticket + nonce, hashlib.sha256).digest()
+    
+    def _mac(self, ticket_id: bytes, expires: float, username: str) -> bytes:
+        return hmac.new(self.key, ticket_id + struct.pack('>d', expires) + username.encode(),
+                        hashlib.sha256).digest()[:16]
+    
+    def issue(self, username: str, secret: bytes, mode: str) -> bytes:
+        """Crea un ticket per l'utente e la modalità di cifratura e ne memorizza il segreto"""
+        ticket_id = os.urandom(16)
+        expires = time.time() + self.lifetime
+        with self.lock:
+            self.cache[ticket_id] = (username, secret, expires, mode)
+            self.stats['issued'] += 1
+            while len(self.cache) > self.max_tickets:
+                self.cache.popitem(last=False)
+                self.stats['evicted'] += 1
+        return self.TICKET.pack(ticket_id, expires, self._mac(ticket_id, expires, username))
+    
+    def redeem(self, username: str, ticket: bytes, nonce: bytes, proof: bytes, mode: str) -> Optional[bytes]:
+        """Verifica e consuma un ticket; ritorna il segreto o None se non è valido o di un'altra modalità"""
+        secret = None
+        if isinstance(ticket, (bytes, bytearray)) and len(ticket) == self.TICKET.size and username:
+            ticket_id, expires, mac = self.TICKET.unpack(ticket)
+            # Il MAC scarta i ticket falsificati prima di toccare la cache
+            if hmac.compare_digest(mac, self._mac(ticket_id, expires, username)) and expires > time.time():
+                with self.lock:
+                    entry = self.cache.pop(ticket_id, None)
+                if entry and entry[0] == username and entry[3] == mode \
+                        and isinstance(nonce, bytes) and isinstance(proof, bytes) \
+                        and hmac.compare_digest(proof, self.proof(entry[1], bytes(ticket), nonce)):
+                    secret = entry[1]
+        with self.lock:
+            self.stats['resumed' if secret else 'rejected'] += 1
+        return secret
+    
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, cached=len(self.cache))
+
+
+class ConnectionIndex:
+    """
+    Indice concorrente username -> sessioni attive (un utente può essere
+    connesso da più client). Inserimento, rimozione e ricerca costano O(1):
+    è l'unica fonte per instradamento dei privati, presenza e chiusura.
+    """
+    
+    def __init__(self):
+        self.sessions: Dict[str, Dict[object, None]] = {}  # username -> handler (dict come insieme ordinato)
+        self.count = 0
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return self.count
+    
+    def insert(self, client_handler) -> int:
+        """Aggiunge una sessione; ritorna il numero di sessioni dell'utente"""
+        with self.lock:
+            user_sessions = self.sessions.setdefault(client_handler.current_user, {})
+            if client_handler not in user_sessions:
+                user_sessions[client_handler] = None
+                self.count += 1
+            return len(user_sessions)
+    
+    def remove(self, client_handler) -> bool:
+        """Rimuove una sessione; True se era presente"""
+        with self.lock:
+            user_sessions = self.sessions.get(client_handler.current_user)
+            if not user_sessions or client_handler not in user_sessions:
+                return False
+            del user_sessions[client_handler]
+            self.count -= 1
+            if not user_sessions:
+                del self.sessions[client_handler.current_user]
+            return True
+    
+    def lookup(self, username: str) -> list:
+        """Sessioni attive dell'utente (lista vuota se non è connesso)"""
+        with self.lock:
+            return list(self.sessions.get(username, ()))
+    
+    def is_online(self, username: str) -> bool:
+        with self.lock:
+            return username in self.sessions
+    
+    def users(self) -> list:
+        """Utenti connessi, ognuno una sola volta anche con più sessioni"""
+        with self.lock:
+            return list(self.sessions)
+    
+    def all_clients(self, exclude_user: Optional[str] = None) -> list:
+        """Tutte le sessioni attive, escluse eventualmente quelle di exclude_user"""
+        with self.lock:
+            return [
+                client
+                for username, user_sessions in self.sessions.items() if username != exclude_user
+                for client in user_sessions
+            ]
+    
+    def clear(self) -> list:
+        """Svuota l'indice e ritorna le sessioni che conteneva"""
+        with self.lock:
+            clients = [client for user_sessions in self.sessions.values() for client in user_sessions]
+            self.sessions.clear()
+            self.count = 0
+            return clients
+
+
+def file_offer_text(name, size, sha256) -> str:
+    """Testo firmato dal mittente di un file: lega nome, dimensione e hash"""
+    return f"{name}:{size}:{sha256}"
+
+
+def seal_file_frame(fields, codec, session_cipher=None, rsa=None, public_key=None):
+    """Cifra i campi di un frame di trasferimento file con il canale della connessione"""
+    if session_cipher:
+        return {'type': 'file', 'payload': session_cipher.encrypt_message(fields, codec)}
+    return {'type': 'file', 'blocks': list(rsa.encrypt_stream(codec.encode(fields), public_key))}
+
+
+def open_file_frame(frame, codec, session_cipher=None, rsa=None, private_key=None):
+    """Inverso di seal_file_frame: ritorna i campi del frame"""
+    if session_cipher and 'payload' in frame:
+        return session_cipher.decrypt_message(frame['payload'], codec)
+    return codec.decode(b''.join(rsa.decrypt_stream(frame.get('blocks', []), private_key)))
+
+
+class FileRelay:
+    """
+    Instradamento dei trasferimenti di file tra utenti. Il server non conserva
+    i dati: ogni frame viene decifrato con il canale del mittente e ricifrato
+    per il destinatario. L'offerta va a tutte le sessioni del destinatario e la
+    prima che accetta resta fissata per il resto del trasferimento.
+    """
+    
+    def __init__(self, server):
+        self.server = server
+        self.routes = {}  # transfer -> {'sender', 'recipient' (None fino all'accept), 'target'}
+        self.lock = threading.Lock()
+        self.stats = {'offers': 0, 'completed': 0, 'cancelled': 0, 'chunks': 0, 'bytes': 0}
+    
+    @staticmethod
+    def cancel(transfer, reason):
+        return {'file': 'cancel', 'transfer': transfer, 'reason': reason}
+    
+    def relay(self, origin, fields):
+        """Inoltra un frame di trasferimento arrivato dalla sessione origin"""
+        action = fields.get('file')
+        transfer = fields.get('transfer')
+        if action == 'offer':
+            self.offer(origin, fields)
+            return
+        
+        with self.lock:
+            route = self.routes.get(transfer)
+            if (route and action in ('accept', 'cancel') and route['recipient'] is None
+                    and origin.current_user == route['target']):
+                route['recipient'] = origin                 # Prima sessione che accetta o rifiuta
+            peer = None
+            if route and origin is route['sender']:
+                peer = route['recipient']
+            elif route and origin is route['recipient']:
+                peer = route['sender']
+            
+            if peer is not None:
+                if action == 'cancel' or (action == 'ack' and 'status' in fields):
+                    del self.routes[transfer]
+                    self.stats['completed' if fields.get('status') == 'ok' else 'cancelled'] += 1
+                elif action == 'chunk':
+                    self.stats['chunks'] += 1
+                    self.stats['bytes'] += len(fields.get('data', b''))
+        
+        if peer is None:
+            if action != 'cancel':
+                origin.send_file_frame(self.cancel(transfer, "Trasferimento sconosciuto o accettato da un'altra sessione"))
+            return
+        if not peer.running:
+            self.drop_client(peer)
+            return
+        peer.send_file_frame(dict(fields, sender=origin.current_user))
+    
+    def offer(self, origin, fields):
+        """Offerta di un file: verifica la firma e la inoltra a tutte le sessioni del destinatario"""
+        transfer = fields.get('transfer')
+        target_user = fields.get('target')
+        recipients = [client for client in self.server.connections.lookup(target_user) if client is not origin]
+        if not recipients:
+            origin.send_file_frame(self.cancel(transfer, f"Utente {target_user} non trovato o non connesso"))
+            return
+        
+        with self.lock:
+            if transfer in self.routes:
+                duplicate = True
+            else:
+                duplicate = False
+                self.routes[transfer] = {'sender': origin, 'recipient': None, 'target': target_user}
+                self.stats['offers'] += 1
+        if duplicate:
+            origin.send_file_frame(self.cancel(transfer, "Identificativo di trasferimento già in uso"))
+            return
+        
+        signature = fields.get('signature')
+        signature_valid = bool(signature) and origin.authenticator.verify_signature(
+            file_offer_text(fields.get('name'), fields.get('size'), fields.get('sha256')),
+            signature, origin.client_public_key
+        )
+        forwarded = {key: value for key, value in fields.items() if key not in ('target', 'signature')}
+        forwarded.update(sender=origin.current_user, signature_valid=signature_valid)
+        for recipient in recipients:
+            recipient.send_file_frame(forwarded)
+    
+    def drop_client(self, client_handler):
+        """Annulla i trasferimenti di una sessione chiusa e avvisa l'altra parte"""
+        with self.lock:
+            dropped = [(transfer, route) for transfer, route in self.routes.items()
+                       if client_handler in (route['sender'], route['recipient'])]
+            for transfer, _ in dropped:
+                del self.routes[transfer]
+            self.stats['cancelled'] += len(dropped)
+        
+        for transfer, route in dropped:
+            if client_handler is route['sender']:
+                peers = [route['recipient']] if route['recipient'] else self.server.connections.lookup(route['target'])
+            else:
+                peers = [route['sender']]
+            for peer in peers:
+                peer.send_file_frame(self.cancel(transfer, f"{client_handler.current_user} si è disconnesso"))
+    
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, active=len(self.routes))
 
 
 class AuthenticatedRSAServer:
-    def __init__(self, host='localhost', port=12345):
+    def __init__(self, host='localhost', port=12345, key_file="server_key.bin", key_rotation_interval=None,
+                 encryption_modes=('hybrid', 'rsa'), backlog=5,
+                 outbound_queue_size=256, outbound_policy='drop_oldest', outbound_block_timeout=1.0,
+                 session_timeout=3600, session_sweep_interval=5.0, ticket_lifetime=600, max_tickets=10000,
+                 user_db="users.db", metrics_port=None, admins=(), profile=None, profile_dir=None, keygen_workers=1):
+        if outbound_policy not in OutboundQueue.POLICIES:
+            raise ValueError(f"Policy della coda non valida: {outbound_policy}")
+        # Profilazione opzionale (profile o RSA_CHAT_PROFILE), avviata prima dei thread del server
+        self.profiler = ServerProfiler.from_options(profile, profile_dir)
+        if self.profiler:
+            self.profiler.start()
+        self.tracer = self.profiler if self.profiler and self.profiler.tracing else None  # Span dei messaggi
         self.host = host
         self.port = port
+        self.backlog = backlog  # Connessioni in attesa di accept
+        self.encryption_modes = encryption_modes  # Modalità di cifratura accettate dai client
         self.rsa = RSAKeyGenerator()
-        self.public_key, self.private_key = self.rsa.generate_keys()
-        self.authenticator = RSAAuthenticator(self.rsa)
+        # Chiave del server persistente, caricata al primo utilizzo; se va generata all'avvio la
+        # ricerca dei primi usa keygen_workers processi (None = tutti i core), le rotazioni restano seriali
+        self.key_store = ServerKeyStore(self.rsa, key_file, key_rotation_interval,
+                                        startup_generator=RSAKeyGenerator(workers=keygen_workers))
+        self.authenticator = RSAAuthenticator(self.rsa, user_db)
+        self.authenticator.session_timeout = session_timeout  # Inattività massima di una sessione (secondi)
         self.socket = None
         self.running = True
-        self.authenticated_clients = []  # Lista dei client autenticati
-        self.clients_lock = threading.Lock()  # Per thread safety
+        self.connections = ConnectionIndex()  # Client autenticati, indicizzati per username
+        self.fanout = BroadcastFanout(self)  # Distribuzione dei broadcast
+        # Code di uscita per client: messaggi massimi per corsia e comportamento a coda piena
+        self.outbound_queue_size = outbound_queue_size
+        self.outbound_policy = outbound_policy
+        self.outbound_block_timeout = outbound_block_timeout
+        self.session_sweeper = SessionSweeper(self, interval=session_sweep_interval)  # Scadenza delle sessioni
+        self.tickets = ResumptionTickets(ticket_lifetime, max_tickets)  # Ripresa rapida delle sessioni
+        self.file_relay = FileRelay(self)  # Trasferimenti di file tra utenti
+        self.admins = set(admins)  # Utenti che possono usare /stats
+        self.metrics = MetricsRegistry()
+        self.register_metrics()
+        # Metriche in formato Prometheus su http://127.0.0.1:<metrics_port>/metrics (None = disattivato)
+        self.metrics_endpoint = MetricsEndpoint(self.metrics, metrics_port) if metrics_port is not None else None
+
+    def register_metrics(self):
+        """Definisce le metriche del server"""
+        metrics = self.metrics
+        metrics.histogram('handshake_seconds', "Durata dello scambio delle chiavi pubbliche")
+        metrics.counter('handshake_failures_total', "Scambi di chiavi non riusciti")
+        metrics.histogram('login_seconds', "Durata del login challenge-response")
+        metrics.counter('logins_total', "Login per esito")
+        metrics.counter('registrations_total', "Registrazioni per esito")
+        metrics.histogram('decrypt_seconds', "Decifratura di un messaggio per modalità")
+        metrics.histogram('signature_verify_seconds', "Verifica di un lotto di firme")
+        metrics.counter('signatures_total', "Firme verificate per esito")
+        metrics.counter('messages_total', "Messaggi di chat ricevuti per tipo")
+        metrics.histogram('broadcast_seconds', "Broadcast dall'accodamento all'ultimo destinatario")
+        metrics.counter('broadcast_recipients_total', "Destinatari dei broadcast")
+        metrics.gauge('connected_clients', "Sessioni autenticate", lambda: len(self.connections))
+        metrics.gauge('outbound_queue_depth', "Messaggi nelle code di uscita dei client",
+                      lambda: sum(client.outbound_depth() for client in self.connections.all_clients()))
+        metrics.gauge('signature_cache_hit_ratio', "Quota di verifiche servite dalla cache",
+                      lambda: self.authenticator.get_signature_stats()['hit_rate'])
+    
+    @property
+    def public_key(self):
+        return self.key_store.get_keys()[0]
+    
+    @property
+    def private_key(self):
+        return self.key_store.get_keys()[1]
         
     def start_server(self):
         """Avvia il server multi-client con autenticazione"""
@@ -651,9 +3246,13 @@ class AuthenticatedRSAServer:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind((self.host, self.port))
-            self.socket.listen(5)  # Accetta fino a 5 connessioni in coda
+            self.socket.listen(self.backlog)  # Connessioni accettate in coda
+            if self.profiler:
+                self.profiler.profile_current_thread()  # Thread che accetta le connessioni
             
             print(f"🌐 Server multi-client avviato su {self.host}:{self.port}")
+            if self.metrics_endpoint:
+                print(f"📈 Metriche su http://127.0.0.1:{self.metrics_endpoint.port}/metrics")
             print(f"📋 Chiave pubblica server: e={self.public_key[0]}, n={self.public_key[1]}")
             print("⏳ In attesa di connessioni...")
             
@@ -679,107 +3278,555 @@ class AuthenticatedRSAServer:
             self.cleanup()
     
     def add_authenticated_client(self, client_handler):
-        """Aggiunge un client alla lista dei client autenticati"""
-        with self.clients_lock:
-            self.authenticated_clients.append(client_handler)
-        print(f"👥 Client attivi: {len(self.authenticated_clients)}")
+        """Registra la sessione di un client autenticato nell'indice"""
+        self.connections.insert(client_handler)
+        print(f"👥 Client attivi: {len(self.connections)}")
     
     def remove_authenticated_client(self, client_handler):
-        """Rimuove un client dalla lista dei client autenticati"""
-        with self.clients_lock:
-            if client_handler in self.authenticated_clients:
-                self.authenticated_clients.remove(client_handler)
-        print(f"👥 Client attivi: {len(self.authenticated_clients)}")
+        """Rimuove la sessione di un client dall'indice"""
+        if self.connections.remove(client_handler):
+            print(f"👥 Client attivi: {len(self.connections)}")
+    
+    def is_user_online(self, username: str) -> bool:
+        """True se l'utente ha almeno una sessione attiva"""
+        return self.connections.is_online(username)
     
     def broadcast_message(self, sender: str, message: str, signature_valid: bool = False, exclude_sender: bool = False):
-        """Invia un messaggio a tutti i client connessi"""
-        with self.clients_lock:
-            clients_to_notify = self.authenticated_clients.copy()
+        """Invia un messaggio a tutti i client connessi (firma unica, cifratura nel writer di ogni client)"""
+        clients_to_notify = self.connections.all_clients(exclude_user=sender if exclude_sender else None)
         
-        for client in clients_to_notify:
+        if clients_to_notify:
+            self.fanout.submit(sender, message, signature_valid, clients_to_notify)
+    
+    def send_private_message(self, sender: str, target_user: str, message: str, signature_valid: bool = False,
+                             origin=None):
+        """
+        Invia un messaggio privato a tutte le sessioni di un utente.
+        La conferma (o l'errore) va alla sessione di origine, se indicata,
+        altrimenti a tutte le sessioni del mittente.
+        """
+        target_clients = self.connections.lookup(target_user)
+        sender_clients = [origin] if origin else self.connections.lookup(sender)
+        
+        if target_clients:
+            private_msg = f"(Privato da {sender}): {message}"
+            for target_client in target_clients:
+                target_client.send_message_to_client(sender, private_msg, signature_valid, "private")
+            
+            # Conferma al mittente
+            confirm_msg = f"Messaggio privato inviato a {target_user}: {message}"
+            for sender_client in sender_clients:
+                sender_client.send_message_to_client("Sistema", confirm_msg, True, "system")
+        else:
+            # Utente target non trovato
+            error_msg = f"Utente {target_user} non trovato o non connesso"
+            for sender_client in sender_clients:
+                sender_client.send_message_to_client("Sistema", error_msg, True, "error")
+    
+    def broadcast_user_list(self):
+        """Invia la lista degli utenti connessi a tutti i client"""
+        user_list = self.connections.users()
+        
+        if user_list:
+            users_message = f"Utenti connessi: {', '.join(user_list)}"
+            self.broadcast_message("Sistema", users_message, True)
+    
+    def get_outbound_stats(self):
+        """Statistiche delle code di uscita di ogni client connesso"""
+        return [
+            {'user': client.current_user, 'address': client.client_address, **(client.get_outbound_stats() or {})}
+            for client in self.connections.all_clients()
+        ]
+    
+    def cleanup(self):
+        """Pulisce le risorse del server"""
+        self.running = False
+        self.session_sweeper.shutdown()
+        if self.metrics_endpoint:
+            self.metrics_endpoint.shutdown()
+            self.metrics_endpoint = None
+        if self.profiler:
+            self.profiler.stop()
+        try:
+            for client in self.connections.clear():
+                client.cleanup()
+            
+            if self.socket:
+                self.socket.close()
+            self.authenticator.registered_users.compact()  # Riporta il WAL nel database
+            print("🧹 Server chiuso correttamente")
+        except Exception as e:
+            print(f"❌ Errore durante la chiusura del server: {e}")
+
+
+class AsyncOutboundQueue(OutboundQueue):
+    """
+    Coda di uscita di un client del server asyncio: stesse corsie e policy di
+    OutboundQueue, ma svuotata da una coroutine dell'event loop invece che da
+    un thread. I frame da cifrare (funzioni) passano nell'executor del server
+    uno alla volta, quindi cifratura e invio seguono l'ordine di accodamento.
+    Oltre buffer_limit byte nel buffer dello stream la coroutine attende che
+    si svuoti e i messaggi restano in coda. Con la policy 'block' attendono
+    solo i thread dell'executor: un messaggio accodato dall'event loop a coda
+    piena viene scartato.
+    """
+    
+    def __init__(self, handler, max_size=256, policy='drop_oldest', block_timeout=1.0, buffer_limit=1024 * 1024):
+        self.handler = handler
+        self.loop = handler.loop
+        self.ready = asyncio.Event()
+        handler.writer.transport.set_write_buffer_limits(high=buffer_limit)
+        super().__init__(None, handler.handle_outbound_failure, max_size, policy, block_timeout)
+    
+    def start_writer(self, name):
+        """Avvia la coroutine di invio (dal thread dell'event loop)"""
+        self.loop_thread = threading.get_ident()
+        self.writer = self.loop.create_task(self._send_loop())
+    
+    def can_block(self) -> bool:
+        return threading.get_ident() != self.loop_thread   # L'event loop non può fermarsi ad aspettare
+    
+    def wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:                                # Event loop già chiuso
+            pass
+    
+    def get_stats(self):
+        stats = super().get_stats()
+        writer = self.handler.writer
+        stats['buffered_bytes'] = 0 if writer.is_closing() else writer.transport.get_write_buffer_size()
+        return stats
+    
+    async def _send_loop(self):
+        while True:
+            with self.condition:
+                if self.closed:
+                    return
+                frame = None
+                if self.depth():
+                    lane = self.lanes['system'] if self.lanes['system'] else self.lanes['chat']
+                    frame = lane.popleft()
+                    self.condition.notify_all()             # Sblocca i produttori in attesa
+                else:
+                    self.ready.clear()                      # Il prossimo put() la reimposta
+            if frame is None:
+                await self.ready.wait()
+                continue
+            
             try:
-                if exclude_sender and client.current_user == sender:
+                if callable(frame):
+                    frame = await self.handler.run_in_executor(frame)
+                await self.send(frame)
+            except Exception as e:
+                self.close()
+                self.on_failure(f"errore di invio: {e}")
+                return
+            with self.condition:
+                self.stats['sent'] += 1
+    
+    async def send(self, message):
+        writer = self.handler.writer
+        if writer.is_closing():
+            raise ConnectionError("connessione chiusa")
+        with self.handler.span('send', bytes=len(message)):
+            writer.write(len(message).to_bytes(4, 'big') + message)
+        await writer.drain()                                # Attende solo oltre buffer_limit byte nel buffer
+
+
+class AsyncClientHandler(ClientHandler):
+    """
+    Versione asyncio di ClientHandler: stesso handshake, autenticazione e chat,
+    ma con stream reader/writer al posto di un thread per client. Le operazioni
+    RSA (challenge, decifratura, firme) girano nell'executor del server.
+    """
+    
+    def __init__(self, reader, writer, server, loop):
+        super().__init__(None, writer.get_extra_info('peername'), server)
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.max_frame_size = FramedSocket.HANDSHAKE_FRAME_SIZE  # Fino al login
+    
+    async def run_in_executor(self, function, *args):
+        """Esegue un'operazione bloccante o CPU-bound fuori dall'event loop"""
+        return await self.loop.run_in_executor(self.server.executor, function, *args)
+    
+    async def handle_client(self):
+        """Gestisce l'intera sessione del client"""
+        try:
+            print(f"🔗 Nuovo client connesso da {self.client_address}")
+            
+            # Scambio delle chiavi pubbliche
+            await self.exchange_public_keys()
+            
+            # Processo di autenticazione
+            if await self.handle_authentication():
+                print(f"🔐 Autenticazione completata per utente: {self.current_user} da {self.client_address}")
+                
+                # Notifica agli altri client della nuova connessione
+                self.server.broadcast_user_list()
+                
+                # Avvia la chat crittografata
+                print(f"💬 Chat attiva per {self.current_user} da {self.client_address}")
+                await self.receive_messages()
+            else:
+                print(f"❌ Autenticazione fallita per {self.client_address}")
+                
+        except Exception as e:
+            print(f"❌ Errore con client {self.client_address}: {e}")
+        finally:
+            self.cleanup()
+    
+    async def exchange_public_keys(self):
+        """Scambia le chiavi pubbliche con il client"""
+        try:
+            with self.server.metrics.time('handshake_seconds'):
+                # get_keys() può dover ruotare la chiave del server: la generazione gira nell'executor
+                self.send_json_message(await self.run_in_executor(self.build_server_key_message))
+                self.accept_client_key(await self.receive_json_message())
+        except Exception as e:
+            self.server.metrics.inc('handshake_failures_total')
+            print(f"❌ Errore nello scambio chiavi con {self.client_address}: {e}")
+            raise
+    
+    async def handle_authentication(self) -> bool:
+        """Gestisce il processo di autenticazione completo"""
+        try:
+            while not self.authenticated:
+                auth_request = await self.receive_json_message()
+                if not auth_request:
+                    return False
+                
+                action = auth_request.get('action')
+                
+                if action == 'register':
+                    if await self.handle_registration(auth_request):
+                        continue  # Dopo registrazione, attendi login
+                    else:
+                        return False
+                
+                elif action == 'login':
+                    return await self.handle_login(auth_request)
+                
+                elif action == 'resume':
+                    if await self.handle_resume(auth_request):
+                        return True
                     continue
+                
+                else:
+                    self.send_json_message(self.INVALID_ACTION_RESPONSE)
                     
-                client.send_message_to_client(sender, message, signature_valid, "broadcast")
-            except:
-                # Se c'è un errore, rimuovi il client dalla lista
-                self.remove_authenticated_client(client)
-    
-    def send_private_message(self, sender: str, target_user: str, message: str, signature_valid: bool = False):
-        """Invia un messaggio privato a un utente specifico"""
-        target_client = None
-        
-        with self.clients_lock:
-            for client in self.authenticated_clients:
-                if client.current_user == target_user:
-                    target_client = client
-                    break
+        except Exception as e:
+            print(f"❌ Errore nell'autenticazione con {self.client_address}: {e}")
+            return False
         
-        if target_client:
-            try:
-                private_msg = f"(Privato da {sender}): {message}"
-                target_client.send_message_to_client(sender, private_msg, signature_valid, "private")
+        return False
+    
+    async def handle_registration(self, request) -> bool:
+        """Gestisce la registrazione (il salvataggio su file gira nell'executor)"""
+        success, response = await self.run_in_executor(self.register, request)
+        self.send_json_message(response)
+        self.server.metrics.inc('registrations_total', result='success' if success else 'failure')
+        return success
+    
+    async def handle_login(self, request) -> bool:
+        """Gestisce il login con challenge-response (operazioni RSA nell'executor)"""
+        with self.server.metrics.time('login_seconds'):
+            success = await self._login(request)
+        self.server.metrics.inc('logins_total', result='success' if success else 'failure')
+        return success
+    
+    async def _login(self, request) -> bool:
+        error, challenge_message, original_challenge = await self.run_in_executor(self.start_login, request)
+        if error:
+            self.send_json_message(error)
+            return False
+        
+        self.send_json_message(challenge_message)
+        
+        response_message = await self.receive_json_message()
+        if not response_message:
+            return False
+        
+        success, reply = await self.run_in_executor(
+            self.complete_login, request.get('username'), original_challenge, response_message
+        )
+        self.send_json_message(reply)
+        if success:
+            self.join_chat()
+        return success
+
+    async def handle_resume(self, request) -> bool:
+        """Gestisce la ripresa con un ticket (solo HMAC: niente executor)"""
+        return super().handle_resume(request)
+    
+    async def receive_messages(self):
+        """Riceve i messaggi del client; decifratura e instradamento nell'executor"""
+        try:
+            while self.running:
+                message_data = await self.receive_json_message()
                 
-                # Conferma al mittente
-                sender_client = None
-                for client in self.authenticated_clients:
-                    if client.current_user == sender:
-                        sender_client = client
-                        break
+                if not message_data:
+                    break
                 
-                if sender_client:
-                    confirm_msg = f"Messaggio privato inviato a {target_user}: {message}"
-                    sender_client.send_message_to_client("Sistema", confirm_msg, True, "system")
-                    
-            except:
-                # Errore nell'invio
-                pass
-        else:
-            # Utente target non trovato
-            sender_client = None
-            with self.clients_lock:
-                for client in self.authenticated_clients:
-                    if client.current_user == sender:
-                        sender_client = client
-                        break
-            
-            if sender_client:
-                error_msg = f"Utente {target_user} non trovato o non connesso"
-                sender_client.send_message_to_client("Sistema", error_msg, True, "error")
+                if not await self.run_in_executor(self.process_message, message_data):
+                    break
+                
+        except Exception as e:
+            if self.running:
+                print(f"❌ Errore nella ricezione da {self.current_user}: {e}")
+            self.running = False
+    
+    def allow_large_frames(self):
+        self.max_frame_size = FramedSocket.MAX_FRAME_SIZE
+    
+    def start_outbound_queue(self):
+        """Nessun thread writer: la coda di uscita è svuotata da una coroutine dell'event loop"""
+        self.outbound = AsyncOutboundQueue(
+            self, max_size=self.server.outbound_queue_size, policy=self.server.outbound_policy,
+            block_timeout=self.server.outbound_block_timeout, buffer_limit=self.server.outbound_buffer_limit
+        )
+        
+    def send_json_message(self, data, lane='system'):
+        """Invia un messaggio (può essere chiamato da qualsiasi thread)"""
+        try:
+            message = self.codec.encode(data)
+            if self.outbound:
+                self.outbound.put(message, lane)
+            else:
+                self.loop.call_soon_threadsafe(self._write_frame, len(message).to_bytes(4, 'big') + message)
+        except:
+            self.running = False
+    
+    def _write_frame(self, frame):
+        if not self.writer.is_closing():
+            self.writer.write(frame)
+
+    async def receive_json_message(self):
+        """Riceve un messaggio (JSON o binario, secondo il formato negoziato)"""
+        try:
+            length_bytes = await self.reader.readexactly(4)
+            length = int.from_bytes(length_bytes, 'big')
+            if length > self.max_frame_size:                # Stessi limiti del server a thread
+                raise ValueError(f"Frame troppo grande: {length} byte")
+            message = await self.reader.readexactly(length)
+            return self.codec.decode(message)
+        except:
+            return None
+    
+    def close_connection(self):
+        """Chiude lo stream del client"""
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+
+class AsyncRSAServer(AuthenticatedRSAServer):
+    """
+    Server asyncio: una coroutine per client invece di un thread per client.
+    Stesso protocollo di AuthenticatedRSAServer; il lavoro CPU-bound gira su
+    un pool di thread dedicato (executor_workers).
+    """
+    
+    def __init__(self, *args, executor_workers=None, outbound_buffer_limit=1024 * 1024, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbound_buffer_limit = outbound_buffer_limit  # Byte nel buffer dello stream oltre cui l'invio attende
+        self.executor = ThreadPoolExecutor(
+            max_workers=executor_workers or (os.cpu_count() or 1) * 4,
+            thread_name_prefix="rsa-worker"
+        )
+        self.loop = None
+        self.async_server = None
+    
+    def start_server(self):
+        """Avvia il server asyncio multi-client con autenticazione"""
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            print(f"❌ Errore del server: {e}")
+        finally:
+            self.cleanup()
+    
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        if self.profiler:
+            self.profiler.profile_current_thread()  # Thread dell'event loop
+        self.async_server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, backlog=self.backlog, reuse_address=True
+        )
+        
+        print(f"🌐 Server asyncio multi-client avviato su {self.host}:{self.port}")
+        if self.metrics_endpoint:
+            print(f"📈 Metriche su http://127.0.0.1:{self.metrics_endpoint.port}/metrics")
+        print(f"📋 Chiave pubblica server: e={self.public_key[0]}, n={self.public_key[1]}")
+        print("⏳ In attesa di connessioni...")
+        
+        async with self.async_server:
+            await self.async_server.serve_forever()
+    
+    async def _handle_connection(self, reader, writer):
+        client_handler = AsyncClientHandler(reader, writer, self, self.loop)
+        await client_handler.handle_client()
+    
+    def cleanup(self):
+        """Pulisce le risorse del server"""
+        super().cleanup()
+        self.executor.shutdown(wait=False)
+        if self.loop and self.async_server and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.async_server.close)
+
+
+class OutgoingFile:
+    """
+    File in uscita: offset confermato dal destinatario e richieste di reinvio.
+    Le risposte arrivano dal thread di ricezione tramite update(), il thread
+    che invia aspetta con wait().
+    """
+    
+    def __init__(self, transfer, target_user):
+        self.transfer = transfer
+        self.target_user = target_user
+        self.condition = threading.Condition()
+        self.offset = None      # Offset da cui partire, indicato nell'accept
+        self.acked = 0          # Byte confermati dal destinatario
+        self.rewind = None      # Offset da reinviare (chunk mancante o corrotto)
+        self.result = None      # 'ok' oppure il motivo del fallimento
+    
+    def update(self, fields):
+        with self.condition:
+            action = fields.get('file')
+            if action == 'accept':
+                self.offset = self.acked = int(fields.get('offset', 0))
+            elif action == 'ack':
+                offset = int(fields.get('offset', 0))
+                self.acked = max(self.acked, offset)
+                if fields.get('rewind'):
+                    self.rewind = offset
+                if 'status' in fields:
+                    self.result = 'ok' if fields['status'] == 'ok' else fields.get('reason', 'errore del destinatario')
+            elif action == 'cancel':
+                self.result = fields.get('reason', 'trasferimento annullato')
+            self.condition.notify_all()
+    
+    def wait(self, predicate, timeout) -> bool:
+        """Attende predicate() o la fine del trasferimento; False allo scadere del timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.result is not None or predicate(), timeout)
+
+
+class IncomingFile:
+    """
+    File in arrivo, scritto in un file .part nella cartella dei download con
+    l'hash SHA-256 aggiornato man mano. Il nome del .part contiene l'hash del
+    file intero: una nuova offerta dello stesso file riprende da dove si era
+    interrotta.
+    """
+    
+    def __init__(self, download_dir, fields):
+        self.transfer = fields['transfer']
+        self.sender = fields.get('sender', 'Sconosciuto')
+        self.name = self.safe_name(fields.get('name', ''))
+        self.size = int(fields['size'])
+        self.sha256 = str(fields['sha256'])
+        if self.size < 0:
+            raise ValueError("dimensione negativa")
+        if not re.fullmatch(r'[0-9a-f]{64}', self.sha256):   # Finisce nel nome del .part: niente percorsi
+            raise ValueError("hash SHA-256 non valido")
+        self.signature_valid = fields.get('signature_valid', False)
+        self.download_dir = download_dir
+        self.part_path = os.path.join(download_dir, f".{self.name}.{self.sha256[:16]}.part")
+        root = os.path.realpath(download_dir)
+        if os.path.commonpath([root, os.path.realpath(self.part_path)]) != root:
+            raise ValueError("percorso fuori dalla cartella dei download")
+        self.hasher = hashlib.sha256()
+        self.offset = 0
+        self.requested = None   # Offset già richiesto al mittente dopo un buco
+        self.saved_path = None
+        
+        os.makedirs(download_dir, exist_ok=True)
+        if os.path.exists(self.part_path) and os.path.getsize(self.part_path) <= self.size:
+            with open(self.part_path, 'rb') as partial:  # Ripresa: rilegge la parte già ricevuta
+                for chunk in iter(lambda: partial.read(1024 * 1024), b''):
+                    self.hasher.update(chunk)
+                    self.offset += len(chunk)
+        self.file = open(self.part_path, 'ab' if self.offset else 'wb')
+    
+    @staticmethod
+    def safe_name(name):
+        """Solo il nome del file, senza percorsi"""
+        name = os.path.basename(str(name).replace('\\', '/')).strip()
+        return name if name not in ('', '.', '..') else 'file'
+    
+    def ack(self, **extra):
+        return dict({'file': 'ack', 'transfer': self.transfer, 'offset': self.offset}, **extra)
+    
+    def receive_chunk(self, offset, data, digest):
+        """Scrive un chunk; ritorna la risposta da inviare al mittente (o None)"""
+        if offset < self.offset:                            # Duplicato dopo un reinvio
+            return None
+        if offset > self.offset:                            # Buco: chiede il reinvio una volta sola
+            return self.request_resend()
+        if hashlib.sha256(data).digest()[:16] != digest:
+            return self.request_resend(force=True)
+        if self.offset + len(data) > self.size:
+            self.close()
+            return {'file': 'cancel', 'transfer': self.transfer, 'reason': "Dati oltre la dimensione dichiarata"}
+        
+        self.file.write(data)
+        self.hasher.update(data)
+        self.offset += len(data)
+        self.requested = None
+        return self.ack()
     
-    def broadcast_user_list(self):
-        """Invia la lista degli utenti connessi a tutti i client"""
-        with self.clients_lock:
-            user_list = [client.current_user for client in self.authenticated_clients if client.current_user]
+    def request_resend(self, force=False):
+        if self.requested == self.offset and not force:
+            return None
+        self.requested = self.offset
+        return self.ack(rewind=True)
+    
+    def finish(self):
+        """Fine dei chunk: verifica l'hash e sposta il file nella cartella dei download"""
+        if self.offset < self.size:
+            return self.request_resend(force=True)
+        self.close()
+        if self.hasher.hexdigest() != self.sha256:
+            os.remove(self.part_path)
+            return self.ack(status='error', reason="SHA-256 del file ricevuto diverso da quello annunciato")
         
-        if user_list:
-            users_message = f"Utenti connessi: {', '.join(user_list)}"
-            self.broadcast_message("Sistema", users_message, True)
+        base, extension = os.path.splitext(self.name)
+        path = os.path.join(self.download_dir, self.name)
+        copy = 1
+        while os.path.exists(path):                         # Non sovrascrive file esistenti
+            path = os.path.join(self.download_dir, f"{base} ({copy}){extension}")
+            copy += 1
+        os.replace(self.part_path, path)
+        self.saved_path = path
+        return self.ack(status='ok')
     
-    def cleanup(self):
-        """Pulisce le risorse del server"""
-        self.running = False
-        try:
-            with self.clients_lock:
-                for client in self.authenticated_clients:
-                    client.cleanup()
-                self.authenticated_clients.clear()
-            
-            if self.socket:
-                self.socket.close()
-            print("🧹 Server chiuso correttamente")
-        except Exception as e:
-            print(f"❌ Errore durante la chiusura del server: {e}")
+    def close(self):
+        """Chiude il file .part (resta su disco per una ripresa)"""
+        if not self.file.closed:
+            self.file.close()
 
 
 class RSAClient:
     """Client RSA per connettersi al server multi-client"""
     
-    def __init__(self, host='localhost', port=12345, username=None):
+    FILE_CHUNK_SIZE = 32 * 1024  # Byte per chunk di un trasferimento di file
+    FILE_WINDOW = 8              # Chunk in attesa di conferma per trasferimento
+    MAX_FILE_SIZE = 100 * 1024 * 1024  # Dimensione massima predefinita di un file ricevuto
+    
+    def __init__(self, host='localhost', port=12345, username=None, key_pool=None, encryption_mode='hybrid',
+                 wire_format='binary1', download_dir='downloads', accept_files=False, max_file_size=MAX_FILE_SIZE,
+                 on_message=None, keygen_workers=1):
         self.host = host
         self.port = port
+        self.encryption_mode = encryption_mode  # Modalità preferita: 'hybrid' o 'rsa'
+        self.session_cipher = None
+        self.wire_format = wire_format          # Formato dei messaggi preferito
+        self.codec = JSON_CODEC                 # Formato in uso (JSON fino alla negoziazione)
+        self.compression = False                # Compressione dei messaggi RSA (se il server la supporta)
         self.rsa = RSAKeyGenerator()
+        self.signer = RSAAuthenticator(self.rsa, storage_file=None)  # Firma i messaggi in uscita
         self.username = username
         # Inizializza keys_file basandosi sull'username, se fornito.
         self.keys_file = f"{username}_keys.pkl" if username else None 
@@ -788,11 +3835,27 @@ class RSAClient:
         if self.username and self.load_keys(): 
             print(f"🔑 Chiavi esistenti caricate per {self.username}")
         else:
-            self.public_key, self.private_key = self.rsa.generate_keys()
-            print(f"🔑 Nuove chiavi generate")
+            # Con un pool (opzionale, --key-pool) le chiavi arrivano pregenerate; altrimenti
+            # vengono generate subito con keygen_workers processi (None = tutti i core)
+            if key_pool is not None:
+                self.public_key, self.private_key = key_pool.acquire()
+            else:
+                self.public_key, self.private_key = RSAKeyGenerator(workers=keygen_workers).generate_keys()
+            print(f"🔑 Nuove chiavi assegnate")
             
         self.server_public_key = None
+        self.resume_ticket = None   # Ticket di ripresa consegnato dal server
+        self.resume_secret = None   # Segreto associato al ticket
+        self.download_dir = download_dir  # Cartella dei file ricevuti
+        self.accept_files = accept_files  # La ricezione di file va attivata (--accept-files o /files on)
+        self.max_file_size = max_file_size
+        # Se indicato, riceve (mittente, messaggio, tipo, firma valida) al posto della stampa
+        self.on_message = on_message
+        self.send_lock = threading.Lock()  # Cifratura e invio nello stesso ordine (contatori della sessione)
+        self.outgoing_files: Dict[str, OutgoingFile] = {}  # transfer -> file in invio
+        self.incoming_files: Dict[str, IncomingFile] = {}  # transfer -> file in ricezione
         self.socket = None
+        self.transport = None
         self.authenticated = False
         self.running = True
         
@@ -808,7 +3871,12 @@ class RSAClient:
                     keys_data = pickle.load(f)
                     self.public_key = keys_data['public_key']
                     self.private_key = keys_data['private_key']
-                    return True
+                
+                # Le chiavi salvate nel vecchio formato (d, n) vengono estese per il CRT
+                if len(self.private_key) == 2:
+                    self.private_key = self.rsa.expand_private_key(self.public_key, self.private_key)
+                    self.save_keys()
+                return True
         except Exception as e:
             print(f"⚠️ Errore nel caricamento chiavi: {e}")
         return False
@@ -836,9 +3904,13 @@ class RSAClient:
             print("❌ Username non può essere vuoto")
             return False
         
+        return self.register(username)
+    
+    def register(self, username, save_keys=True) -> bool:
+        """Registra username con le chiavi correnti, senza prompt"""
         # Imposta username e file delle chiavi qui, dopo che l'utente lo ha inserito.
         self.username = username
-        self.keys_file = f"{username}_keys.pkl"
+        self.keys_file = f"{username}_keys.pkl" if save_keys else None
         
         # Invia richiesta di registrazione
         registration_request = {
@@ -856,7 +3928,7 @@ class RSAClient:
             self.save_keys() 
             return True
         else:
-            print(f"❌ Errore registrazione: {response.get('message', 'Errore sconosciuto')}")
+            print(f"❌ Errore registrazione: {(response or {}).get('message', 'Errore sconosciuto')}")
             return False
     
     def handle_login(self) -> bool:
@@ -914,6 +3986,22 @@ class RSAClient:
                 
                 if auth_response and auth_response.get('status') == 'authenticated':
                     self.authenticated = True
+                    
+                    resume_key = None
+                    wrapped_session_key = auth_response.get('wrapped_session_key')
+                    wrapped_resume_key = auth_response.get('wrapped_resume_key')
+                    if wrapped_session_key is not None:
+                        # Solo chi possiede la chiave privata può recuperare la chiave di sessione
+                        resume_key = self.rsa.decrypt(wrapped_session_key, self.private_key)
+                        resume_key = resume_key.to_bytes(SessionCipher.KEY_SIZE, 'big')
+                        self.session_cipher = SessionCipher(resume_key, SessionCipher.CLIENT)
+                    elif wrapped_resume_key is not None:
+                        # Modalità RSA: chiave di ripresa dedicata
+                        resume_key = self.rsa.decrypt(wrapped_resume_key, self.private_key)
+                        resume_key = resume_key.to_bytes(ResumptionTickets.KEY_SIZE, 'big')
+                    if auth_response.get('ticket') and resume_key:
+                        self.resume_ticket = bytes(auth_response['ticket'])
+                        self.resume_secret = ResumptionTickets.login_secret(resume_key)
                     # L'username è già impostato correttamente, non serve riassegnarlo qui
                     # self.username = username 
                     print(f"✅ {auth_response.get('message')}")
@@ -928,11 +4016,84 @@ class RSAClient:
         
         return False   
         
+    def resume_session(self) -> bool:
+        """Riprende la sessione con il ticket dell'ultimo login (nessuna operazione RSA)"""
+        if not self.resume_ticket:
+            return False
+        ticket, secret = self.resume_ticket, self.resume_secret
+        self.resume_ticket = self.resume_secret = None      # Monouso, anche se rifiutato
+        nonce = os.urandom(16)
+        self.send_json_message({
+            'action': 'resume',
+            'username': self.username,
+            'ticket': ticket,
+            'nonce': nonce,
+            'proof': ResumptionTickets.proof(secret, ticket, nonce)
+        })
+        
+        response = self.receive_json_message()
+        if not response or response.get('status') != 'authenticated':
+            print(f"⚠️ Ripresa non riuscita: {response.get('message') if response else 'nessuna risposta'}")
+            return False
+        
+        nonces = nonce + bytes(response['nonce'])
+        if self.encryption_mode == 'hybrid':
+            self.session_cipher = SessionCipher(ResumptionTickets.derive(secret, b"session", nonces),
+                                                SessionCipher.CLIENT)
+        self.resume_ticket = bytes(response['ticket'])
+        self.resume_secret = ResumptionTickets.derive(secret, b"resume", nonces)
+        self.authenticated = True
+        print(f"✅ {response.get('message')}")
+        return True
+    
+    def reconnect(self) -> bool:
+        """
+        Riapre la connessione (a thread di ricezione terminato): ripresa con il
+        ticket se possibile, altrimenti login completo
+        """
+        if self.socket:
+            self.socket.close()
+        self.authenticated = False
+        self.session_cipher = None
+        self.codec = JSON_CODEC                 # Lo scambio chiavi riparte in JSON
+        self.open_connection()
+        self.exchange_public_keys()
+        return self.resume_session() or self.handle_login()
+    
+    def login(self, username) -> bool:
+        """Login senza prompt con le chiavi già caricate"""
+        self.username = username
+        return self.handle_login()
+    
+    def connect(self, username, register=False) -> bool:
+        """
+        Connessione senza prompt: scambio chiavi, registrazione facoltativa (se
+        viene rifiutata, ad es. utente già registrato, il login avviene su una
+        nuova connessione) e login. Non avvia la chat:
+        i messaggi si ricevono con start_receiving() e si inviano con
+        send_encrypted_message().
+        """
+        self.open_connection()
+        self.exchange_public_keys()
+        if register and not self.register(username, save_keys=False):
+            # Il server chiude la connessione dopo una registrazione rifiutata
+            self.socket.close()
+            self.codec = JSON_CODEC             # Lo scambio chiavi riparte in JSON
+            self.open_connection()
+            self.exchange_public_keys()
+        return self.login(username)
+    
+    def start_receiving(self):
+        """Avvia il thread di ricezione dei messaggi"""
+        receive_thread = threading.Thread(target=self.receive_messages)
+        receive_thread.daemon = True
+        receive_thread.start()
+        return receive_thread
+    
     def connect_to_server(self):
         """Si connette al server"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            self.open_connection()
             print(f"🔗 Connesso al server {self.host}:{self.port}")
             
             # Scambio delle chiavi pubbliche
@@ -943,9 +4104,7 @@ class RSAClient:
                 print("✅ Autenticazione completata!")
                 
                 # Avvia thread per ricevere messaggi
-                receive_thread = threading.Thread(target=self.receive_messages)
-                receive_thread.daemon = True
-                receive_thread.start()
+                self.start_receiving()
                 
                 # Avvia chat interattiva
                 self.start_interactive_chat()
@@ -957,6 +4116,11 @@ class RSAClient:
         finally:
             self.cleanup()
     
+    def open_connection(self):
+        """Apre il socket verso il server e il trasporto a frame"""
+        self.socket = socket.create_connection((self.host, self.port))
+        self.transport = FramedSocket(self.socket)
+    
     def exchange_public_keys(self):
         """Scambia le chiavi pubbliche con il server"""
         try:
@@ -970,8 +4134,28 @@ class RSAClient:
                 'e': self.public_key[0],
                 'n': self.public_key[1]
             }
+            
+            # La modalità ibrida si usa solo se il server la supporta
+            if self.encryption_mode in server_key_data.get('modes', ['rsa']):
+                key_data['mode'] = self.encryption_mode
+            else:
+                self.encryption_mode = 'rsa'
+            
+            # Il formato binario si usa solo se il server lo supporta
+            use_wire_format = (self.wire_format in WIRE_CODECS
+                               and self.wire_format in server_key_data.get('wire_formats', ['json']))
+            if use_wire_format:
+                key_data['wire_format'] = self.wire_format
+            
+            # Compressione prima dei blocchi RSA, se il server la supporta
+            self.compression = 'zlib' in server_key_data.get('compression', [])
+            if self.compression:
+                key_data['compression'] = 'zlib'
             self.send_json_message(key_data)
             
+            if use_wire_format:   # Cambia formato dopo aver inviato la propria chiave in JSON
+                self.codec = WIRE_CODECS[self.wire_format]
+            
         except Exception as e:
             print(f"❌ Errore nello scambio chiavi: {e}")
             raise
@@ -1012,6 +4196,9 @@ class RSAClient:
         print("\n💬 === CHAT CRITTOGRAFATA ===")
         print("Comandi disponibili:")
         print("  /private <username> <messaggio> - Invia messaggio privato")
+        print("  /sendfile <username> <percorso> - Invia un file")
+        print(f"  /files on|off - Accetta o rifiuta i file in arrivo (ora: {'on' if self.accept_files else 'off'})")
+        print("  /stats - Metriche del server (solo amministratori)")
         print("  /quit - Esci dalla chat")
         print("  Qualsiasi altro testo - Messaggio broadcast")
         print("=" * 50)
@@ -1030,6 +4217,11 @@ class RSAClient:
                 # Gestisci comandi speciali
                 if message.startswith('/private '):
                     self.handle_private_message(message)
+                elif message.startswith('/sendfile '):
+                    self.handle_send_file(message)
+                elif message in ('/files on', '/files off'):
+                    self.accept_files = message.endswith('on')
+                    print(f"📥 Ricezione dei file {'attiva' if self.accept_files else 'disattivata'}")
                 else:
                     # Messaggio broadcast normale
                     self.send_encrypted_message(message)
@@ -1055,25 +4247,193 @@ class RSAClient:
         except Exception as e:
             print(f"❌ Errore nell'invio messaggio privato: {e}")
     
+    def handle_send_file(self, command):
+        """Gestisce /sendfile: l'invio prosegue in background mentre la chat resta attiva"""
+        parts = command.split(' ', 2)
+        if len(parts) < 3:
+            print("❌ Formato corretto: /sendfile <username> <percorso>")
+            return
+        
+        target_user = parts[1]
+        path = os.path.expanduser(parts[2].strip().strip('"'))
+        if not os.path.isfile(path):
+            print(f"❌ File non trovato: {path}")
+            return
+        
+        sender_thread = threading.Thread(target=self.send_file, args=(target_user, path))
+        sender_thread.daemon = True
+        sender_thread.start()
+    
+    def send_file(self, target_user, path, chunk_size=FILE_CHUNK_SIZE, window=FILE_WINDOW, timeout=30.0) -> bool:
+        """
+        Invia un file a un utente in chunk cifrati da chunk_size byte letti dal
+        disco, con al più window chunk in attesa di conferma. Parte dall'offset
+        indicato dal destinatario (ripresa di un invio interrotto) e torna
+        indietro quando il destinatario segnala un chunk mancante o corrotto.
+        """
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for read in iter(lambda: f.readinto(buffer), 0):
+                digest.update(view[:read])
+        size = os.path.getsize(path)
+        name = os.path.basename(path)
+        sha256 = digest.hexdigest()
+        
+        transfer = os.urandom(8).hex()
+        outgoing = OutgoingFile(transfer, target_user)
+        self.outgoing_files[transfer] = outgoing
+        start = time.perf_counter()
+        try:
+            self.send_file_frame({
+                'file': 'offer', 'transfer': transfer, 'target': target_user,
+                'name': name, 'size': size, 'sha256': sha256,
+                'signature': self.signer.sign_message(file_offer_text(name, size, sha256), self.private_key)
+            })
+            if not outgoing.wait(lambda: outgoing.offset is not None, timeout):
+                outgoing.result = "nessuna risposta dal destinatario"
+            
+            sent = outgoing.offset
+            done_sent = False
+            with open(path, 'rb') as f:
+                while outgoing.result is None:
+                    ready = outgoing.wait(lambda: outgoing.rewind is not None or
+                                          (not done_sent and sent - outgoing.acked < window * chunk_size), timeout)
+                    if outgoing.result is not None:
+                        break
+                    if not ready:
+                        outgoing.result = "nessuna risposta dal destinatario"
+                        break
+                    
+                    with outgoing.condition:
+                        if outgoing.rewind is not None:         # Reinvio dall'offset richiesto
+                            sent, outgoing.rewind, done_sent = outgoing.rewind, None, False
+                    
+                    if sent < size:
+                        f.seek(sent)
+                        read = f.readinto(view[:min(chunk_size, size - sent)])
+                        if not read:
+                            outgoing.result = "file modificato durante l'invio"
+                            break
+                        data = bytes(view[:read])
+                        self.send_file_frame({
+                            'file': 'chunk', 'transfer': transfer, 'offset': sent,
+                            'data': data, 'digest': hashlib.sha256(data).digest()[:16]
+                        })
+                        sent += read
+                    else:
+                        self.send_file_frame({'file': 'done', 'transfer': transfer})
+                        done_sent = True
+        finally:
+            del self.outgoing_files[transfer]
+        
+        elapsed = time.perf_counter() - start
+        if outgoing.result != 'ok':
+            if outgoing.offset is not None:
+                self.send_file_frame({'file': 'cancel', 'transfer': transfer, 'reason': outgoing.result})
+            print(f"\n❌ Invio di {name} a {target_user} non riuscito: {outgoing.result}")
+            return False
+        
+        megabytes = (size - outgoing.offset) / (1024 * 1024)
+        print(f"\n📤 {name} inviato a {target_user}: {megabytes:.2f} MB in {elapsed:.2f} s "
+              f"({megabytes / elapsed:.2f} MB/s)")
+        return True
+    
+    def send_file_frame(self, fields):
+        """Invia un frame di trasferimento file cifrato con il canale della connessione"""
+        with self.send_lock:
+            self.send_json_message(seal_file_frame(
+                fields, self.codec, self.session_cipher, self.rsa, self.server_public_key
+            ))
+    
+    def handle_file_frame(self, fields):
+        """Gestisce un frame di trasferimento file ricevuto dal server"""
+        action = fields.get('file')
+        transfer = fields.get('transfer')
+        
+        outgoing = self.outgoing_files.get(transfer)
+        if outgoing:                                        # Risposta a un nostro invio
+            outgoing.update(fields)
+            return
+        if action == 'offer':
+            self.accept_file(fields)
+            return
+        
+        incoming = self.incoming_files.get(transfer)
+        if incoming is None:
+            return
+        if action == 'chunk':
+            reply = incoming.receive_chunk(fields.get('offset'), fields.get('data', b''), fields.get('digest'))
+        elif action == 'done':
+            reply = incoming.finish()
+        else:                                               # cancel
+            incoming.close()
+            del self.incoming_files[transfer]
+            print(f"\n❌ Ricezione di {incoming.name} da {incoming.sender} interrotta: {fields.get('reason')}")
+            return
+        
+        if reply:
+            self.send_file_frame(reply)
+            if reply['file'] == 'cancel' or 'status' in reply:
+                del self.incoming_files[transfer]
+                if incoming.saved_path:
+                    print(f"\n📥 {incoming.name} da {incoming.sender} salvato in {incoming.saved_path}")
+                else:
+                    print(f"\n❌ Ricezione di {incoming.name} da {incoming.sender} non riuscita: {reply.get('reason')}")
+    
+    def accept_file(self, fields):
+        """Accetta un'offerta di file, riprendendo da un eventuale .part già ricevuto"""
+        transfer = fields.get('transfer')
+        if not self.accept_files:
+            print(f"\n📥 {fields.get('sender', 'Sconosciuto')} ha provato a inviarti {fields.get('name')}: "
+                  f"usa /files on per accettare i file")
+            self.send_file_frame({'file': 'cancel', 'transfer': transfer, 'reason': f"{self.username} non accetta file"})
+            return
+        try:
+            if int(fields['size']) > self.max_file_size:
+                raise ValueError(f"oltre il limite di {self.max_file_size // (1024 * 1024)} MB")
+            incoming = IncomingFile(self.download_dir, fields)
+        except (OSError, KeyError, ValueError, TypeError) as e:
+            self.send_file_frame({'file': 'cancel', 'transfer': transfer, 'reason': f"File non accettato: {e}"})
+            return
+        
+        self.incoming_files[transfer] = incoming
+        signature_indicator = "✅" if incoming.signature_valid else "⚠️"
+        resume_note = f", ripresa da {incoming.offset} byte" if incoming.offset else ""
+        print(f"\n📥 {signature_indicator} {incoming.sender} ti invia {incoming.name} "
+              f"({incoming.size / 1024:.1f} KB{resume_note})")
+        self.send_file_frame({'file': 'accept', 'transfer': transfer, 'offset': incoming.offset})
+    
     def send_encrypted_message(self, message, message_type='broadcast', target_user=None):
         """Invia un messaggio cifrato al server"""
         try:
-            # Cifra il messaggio con la chiave pubblica del server
-            encrypted_blocks = self.rsa.encrypt_string(message, self.server_public_key)
-            
             # Firma il messaggio con la propria chiave privata
-            authenticator = RSAAuthenticator(self.rsa)
-            signature = authenticator.sign_message(message, self.private_key)
-            
-            # Prepara i dati
-            message_data = {
-                'blocks': encrypted_blocks,
-                'signature': signature,
-                'type': message_type
-            }
+            signature = self.signer.sign_message(message, self.private_key)
             
-            if target_user:
-                message_data['target'] = target_user
+            if self.session_cipher:
+                # Modalità ibrida: messaggio, firma e metadati in un unico payload simmetrico
+                inner_data = {'message': message, 'signature': signature, 'type': message_type}
+                if target_user:
+                    inner_data['target'] = target_user
+                with self.send_lock:
+                    self.send_json_message({'payload': self.session_cipher.encrypt_message(inner_data, self.codec)})
+                return
+            else:
+                # Cifra il messaggio con la chiave pubblica del server (compresso se conviene)
+                encrypted_blocks, compressed = self.rsa.encrypt_text(message, self.server_public_key, self.compression)
+                
+                # Prepara i dati
+                message_data = {
+                    'blocks': encrypted_blocks,
+                    'signature': signature,
+                    'type': message_type
+                }
+                if compressed:
+                    message_data['compressed'] = True
+                
+                if target_user:
+                    message_data['target'] = target_user
             
             # Invia al server
             self.send_json_message(message_data)
@@ -1090,14 +4450,29 @@ class RSAClient:
                 if not message_data:
                     break
                 
-                encrypted_blocks = message_data.get('blocks', [])
-                signature = message_data.get('signature')
+                if message_data.get('type') == 'file':        # Trasferimento di file
+                    self.handle_file_frame(open_file_frame(
+                        message_data, self.codec, self.session_cipher, self.rsa, self.private_key
+                    ))
+                    continue
+                
+                if self.session_cipher and 'payload' in message_data:
+                    # Modalità ibrida: il payload contiene messaggio e metadati
+                    message_data = self.session_cipher.decrypt_message(message_data['payload'], self.codec)
+                    decrypted_message = message_data.get('message', '')
+                else:
+                    # Decritta il messaggio
+                    encrypted_blocks = message_data.get('blocks', [])
+                    decrypted_message = self.rsa.decrypt_string(encrypted_blocks, self.private_key,
+                                                                 message_data.get('compressed', False))
+                
                 sender = message_data.get('sender', 'Sconosciuto')
                 signature_valid = message_data.get('signature_valid', False)
                 message_type = message_data.get('type', 'broadcast')
                 
-                # Decritta il messaggio
-                decrypted_message = self.rsa.decrypt_string(encrypted_blocks, self.private_key)
+                if self.on_message:                           # Client senza interfaccia
+                    self.on_message(sender, decrypted_message, message_type, signature_valid)
+                    continue
                 
                 # Mostra il messaggio
                 signature_indicator = "✅" if signature_valid else "⚠️"
@@ -1116,30 +4491,27 @@ class RSAClient:
             self.running = False
     
     def send_json_message(self, data):
-        """Invia un messaggio JSON"""
+        """Invia un messaggio (JSON o binario, secondo il formato negoziato)"""
         try:
-            message = json.dumps(data).encode('utf-8')
-            self.socket.send(len(message).to_bytes(4, 'big'))
-            self.socket.send(message)
+            self.transport.send_frame(self.codec.encode(data))
         except:
             self.running = False
     
     def receive_json_message(self):
-        """Riceve un messaggio JSON"""
+        """Riceve un messaggio (JSON o binario, secondo il formato negoziato)"""
         try:
-            length_bytes = self.socket.recv(4)
-            if not length_bytes:
+            message = self.transport.receive_frame()
+            if message is None:
                 return None
-                
-            length = int.from_bytes(length_bytes, 'big')
-            message = self.socket.recv(length).decode('utf-8')
-            return json.loads(message)
+            return self.codec.decode(message)
         except:
             return None
     
     def cleanup(self):
         """Pulisce le risorse del client"""
         self.running = False
+        for incoming in list(self.incoming_files.values()):
+            incoming.close()                                # I .part restano per una ripresa
         try:
             if self.socket:
                 self.socket.close()
@@ -1148,9 +4520,10 @@ class RSAClient:
             pass
 
 
-def run_server():
-    """Avvia il server"""
-    server = AuthenticatedRSAServer()
+def run_server(async_mode=False, **server_options):
+    """Avvia il server (a thread o, con async_mode, asyncio)"""
+    server_class = AsyncRSAServer if async_mode else AuthenticatedRSAServer
+    server = server_class(**server_options)
     try:
         server.start_server()
     except KeyboardInterrupt:
@@ -1158,21 +4531,1042 @@ def run_server():
         server.cleanup()
 
 
-def run_client():
+def run_client(**client_options):
     """Avvia il client con username opzionale"""
-    print("Vuoi caricare un utente esistente?")
-    username = input("Username (lascia vuoto per nuovo utente): ").strip()
+    username = client_options.pop('username', None)
+    if username is None:
+        print("Vuoi caricare un utente esistente?")
+        username = input("Username (lascia vuoto per nuovo utente): ").strip()
     
     # Passa l'username al costruttore del client.
     # Il costruttore ora gestirà il caricamento o la generazione delle chiavi.
-    client = RSAClient(username=username if username else None) 
+    client = RSAClient(username=username if username else None, **client_options) 
     try:
         client.connect_to_server()
     except KeyboardInterrupt:
         print("\n👋 Disconnessione client...")
         client.cleanup()
+
+
+class LoadGenerator:
+    """
+    Generatore di carico: connette molti utenti sintetici (RSAClient senza
+    prompt, con poche coppie di chiavi riusate), invia messaggi a una frequenza
+    fissa con un mix di broadcast e privati e misura la latenza di consegna
+    end-to-end e il tasso di connessioni riuscite.
+    """
+    
+    MARKER = "carico#"  # Precede l'identificativo di ogni messaggio generato
+    
+    def __init__(self, host='localhost', port=12345, users=100, keypairs=4, bits=1024, encryption_mode='hybrid',
+                 concurrency=32, prefix="carico", seed=None, keys_file=None):
+        self.host = host
+        self.port = port
+        self.users = users
+        self.keypairs = keypairs
+        self.bits = bits
+        self.encryption_mode = encryption_mode
+        self.concurrency = concurrency
+        self.prefix = prefix
+        self.random = random.Random(seed)                   # Solo per il traffico, non per le chiavi
+        # Chiavi degli utenti sintetici, riusate tra un'esecuzione e l'altra
+        self.keys_file = keys_file or f"{prefix}_keys.pkl"
+        
+        self.clients = []
+        self.lock = threading.Lock()
+        self.connect_ms = []                                # Latenze di scambio chiavi + registrazione + login
+        self.connect_failures = collections.Counter()       # motivo -> connessioni fallite
+        self.sent = {}                                      # id -> (istante di invio, tipo, consegne attese)
+        self.latencies = {'broadcast': [], 'private': []}   # ms dall'invio a ogni consegna
+    
+    def load_keys(self):
+        """
+        Coppie di chiavi degli utenti sintetici: quelle di keys_file se esiste,
+        altrimenti keypairs nuove coppie salvate lì. Così una seconda esecuzione
+        contro lo stesso server rifà il login con le chiavi già registrate
+        (cancellare il file per rigenerarle).
+        """
+        if os.path.exists(self.keys_file):
+            with open(self.keys_file, 'rb') as f:
+                return pickle.load(f)
+        keys = [RSAKeyGenerator(self.bits, workers=1).generate_keys(verbose=False) for _ in range(self.keypairs)]
+        with open(self.keys_file, 'wb') as f:
+            pickle.dump(keys, f)
+        return keys
+    
+    def connect_users(self):
+        """Connette e autentica gli utenti sintetici con concurrency connessioni in parallelo"""
+        keys = self.load_keys()
+        
+        def connect(index):
+            client = RSAClient(self.host, self.port, key_pool=types.SimpleNamespace(acquire=lambda: keys[index % len(keys)]),
+                               encryption_mode=self.encryption_mode, accept_files=False, on_message=self.record_delivery)
+            start = time.perf_counter()
+            try:
+                connected = client.connect(f"{self.prefix}{index}", register=True)
+                failure = None if connected else "login rifiutato"
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                failure = type(e).__name__
+            
+            with self.lock:
+                if failure is None:
+                    self.connect_ms.append((time.perf_counter() - start) * 1000)
+                    self.clients.append(client)
+                else:
+                    self.connect_failures[failure] += 1
+            if failure is not None:
+                client.cleanup()
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(connect, range(self.users)))
+    
+    def record_delivery(self, sender, message, message_type, signature_valid):
+        """on_message dei client: registra la latenza dei messaggi generati"""
+        arrived = time.perf_counter()
+        if message_type not in self.latencies or self.MARKER not in message:
+            return                                          # Liste utenti, conferme, errori
+        try:
+            message_id = int(message.rpartition(self.MARKER)[2])
+        except ValueError:
+            return
+        with self.lock:
+            sent = self.sent.get(message_id)
+            if sent:
+                self.latencies[message_type].append((arrived - sent[0]) * 1000)
+    
+    def run_traffic(self, rate=10.0, duration=30.0, private_share=0.2, senders=8, drain=3.0):
+        """Invia rate messaggi al secondo per duration secondi da utenti scelti a caso"""
+        online = list(self.clients)
+        if not online:
+            return
+        for client in online:
+            client.start_receiving()
+        time.sleep(1.0)                                     # Liste utenti dei login già consegnate
+        
+        def send(message_id, client, message_type, target_user, expected):
+            with self.lock:
+                self.sent[message_id] = (time.perf_counter(), message_type, expected)
+            client.send_encrypted_message(f"messaggio di prova {self.MARKER}{message_id}", message_type, target_user)
+        
+        with ThreadPoolExecutor(max_workers=senders) as executor:
+            next_send = time.perf_counter()
+            end = next_send + duration
+            message_id = 0
+            while next_send < end:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                
+                sender = self.random.choice(online)
+                if len(online) > 1 and self.random.random() < private_share:
+                    target = self.random.choice([client for client in online if client is not sender])
+                    executor.submit(send, message_id, sender, 'private', target.username, 1)
+                else:
+                    executor.submit(send, message_id, sender, 'broadcast', None,
+                                    sum(1 for client in online if client is not sender and client.running))
+                message_id += 1
+                next_send += 1.0 / rate
+        time.sleep(drain)                                   # Consegne ancora in viaggio
+    
+    def report(self):
+        """Risultati: connessioni riuscite, consegne e percentili di latenza per tipo di messaggio"""
+        with self.lock:
+            attempted = len(self.connect_ms) + sum(self.connect_failures.values())
+            results = {
+                'connections': {
+                    'attempted': attempted,
+                    'succeeded': len(self.connect_ms),
+                    'success_rate': len(self.connect_ms) / attempted if attempted else 0.0,
+                    'failures': dict(self.connect_failures),
+                    'latency': _latency_summary(self.connect_ms),
+                },
+                'messages': {},
+            }
+            for message_type, latencies in self.latencies.items():
+                sent = [entry for entry in self.sent.values() if entry[1] == message_type]
+                expected = sum(entry[2] for entry in sent)
+                results['messages'][message_type] = {
+                    'sent': len(sent),
+                    'expected_deliveries': expected,
+                    'deliveries': len(latencies),
+                    'delivery_rate': len(latencies) / expected if expected else 0.0,
+                    'latency': _latency_summary(latencies),
+                }
+        return results
+    
+    def close(self):
+        for client in self.clients:
+            client.cleanup()
+
+
+def print_load_report(results):
+    """Stampa il riepilogo di LoadGenerator.report()"""
+    connections = results['connections']
+    latency = connections['latency']
+    print(f"\n🔗 Connessioni: {connections['succeeded']}/{connections['attempted']} riuscite "
+          f"({connections['success_rate']:.1%})")
+    if latency['count']:
+        print(f"   handshake + login: p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+              f"p99 {latency['p99_ms']:.1f} ms")
+    for reason, count in connections['failures'].items():
+        print(f"   ❌ {reason}: {count}")
+    
+    for message_type, stats in results['messages'].items():
+        latency = stats['latency']
+        print(f"📨 {message_type}: {stats['sent']} inviati, {stats['deliveries']}/{stats['expected_deliveries']} "
+              f"consegne ({stats['delivery_rate']:.1%})")
+        if latency['count']:
+            print(f"   latenza: p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+                  f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms")
+
+
+def run_load(host='localhost', port=12345, users=100, rate=10.0, duration=30.0, private_share=0.2,
+             concurrency=32, keypairs=4, bits=1024, encryption_mode='hybrid', seed=1234, local=False, output=None,
+             keys_file=None):
+    """
+    Genera carico contro un server. Con local avvia anche un server a thread in
+    questo processo (comodo per le prove, ma condivide la CPU con il generatore).
+    """
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull:
+        server = None
+        if local:
+            with contextlib.redirect_stdout(devnull):
+                server = _start_benchmark_server(directory, backlog=max(concurrency, 5))
+            port = server.port
+        
+        generator = LoadGenerator(host, port, users, keypairs, bits, encryption_mode, concurrency, seed=seed,
+                                  keys_file=keys_file)
+        print(f"🚀 Connessione di {users} utenti a {host}:{port} ({concurrency} in parallelo)...")
+        with contextlib.redirect_stdout(devnull):
+            generator.connect_users()
+        print(f"📤 Traffico: {rate:g} messaggi/s per {duration:g} s, {private_share:.0%} privati...")
+        with contextlib.redirect_stdout(devnull):
+            try:
+                generator.run_traffic(rate, duration, private_share)
+            finally:
+                generator.close()
+                if server:
+                    time.sleep(0.5)                         # Disconnessioni gestite dal server
+                    server.cleanup()
+    
+    results = generator.report()
+    print_load_report(results)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Risultati salvati in {output}")
+    return results
+
+
+def _time_calls(function, iterations):
+    """Esegue function() iterations volte e ritorna il tempo medio in millisecondi"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def _latency_summary(samples_ms):
+    """Media, percentili (nearest-rank) e massimo di una lista di latenze in millisecondi"""
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {'count': 0}
+    
+    def percentile(share):
+        return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+    
+    return {'count': len(ordered), 'mean_ms': sum(ordered) / len(ordered), 'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99), 'max_ms': ordered[-1]}
+
+
+def _start_benchmark_server(directory, **server_options):
+    """Server a thread su una porta libera di localhost, con chiave e utenti in directory"""
+    with socket.socket() as probe:
+        probe.bind(('localhost', 0))
+        port = probe.getsockname()[1]
+    server = AuthenticatedRSAServer(port=port, key_file=os.path.join(directory, "server_key.bin"),
+                                    user_db=os.path.join(directory, "users.db"), **server_options)
+    threading.Thread(target=server.start_server, daemon=True).start()
+    time.sleep(0.5)
+    return server
+
+
+def _connect_benchmark_client(port, username, keys, **client_options):
+    """Client registrato e autenticato; ritorna (client, ms dello scambio chiavi, ms del login)"""
+    client = RSAClient(port=port, username=None, key_pool=types.SimpleNamespace(acquire=lambda: keys),
+                       **client_options)
+    client.username = username
+    start = time.perf_counter()
+    client.open_connection()
+    client.exchange_public_keys()
+    exchange_ms = (time.perf_counter() - start) * 1000
+    client.send_json_message({'action': 'register', 'username': username})
+    client.receive_json_message()
+    start = time.perf_counter()
+    if not client.handle_login():
+        raise RuntimeError(f"Login di {username} non riuscito")
+    return client, exchange_ms, (time.perf_counter() - start) * 1000
+
+
+def benchmark_key_generation(prime_sizes=(256, 512, 1024), keys=3):
+    """generate_keys (ricerca seriale) per diverse dimensioni dei primi"""
+    print(f"\n⏱️ Generazione delle chiavi ({keys} coppie per dimensione, ricerca seriale)")
+    results = {}
+    for prime_bits in prime_sizes:
+        rsa = RSAKeyGenerator(prime_bits, workers=1)
+        timings = []
+        for _ in range(keys):
+            start = time.perf_counter()
+            public_key, _ = rsa.generate_keys(verbose=False)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[prime_bits] = dict(_latency_summary(timings), modulus_bits=public_key[1].bit_length(),
+                                   # Con lo stesso seed l'impronta dell'ultima chiave non cambia tra le esecuzioni
+                                   fingerprint=hashlib.sha256(str(public_key[1]).encode()).hexdigest()[:16])
+        print(f"   primi da {prime_bits:4d} bit (n da {results[prime_bits]['modulus_bits']} bit): "
+              f"media {results[prime_bits]['mean_ms']:8.1f} ms, max {results[prime_bits]['max_ms']:8.1f} ms")
+    return results
+
+
+def benchmark_parallel_key_generation(prime_bits=1024, keys=3):
+    """generate_keys con ricerca seriale e parallela su tutti i core"""
+    workers = os.cpu_count() or 1
+    print(f"\n⏱️ Generazione delle chiavi, primi da {prime_bits} bit: seriale vs {workers} processi")
+    results = {}
+    for name, rsa in (('serial', RSAKeyGenerator(prime_bits, workers=1)),
+                      ('parallel', RSAKeyGenerator(prime_bits, workers=workers))):
+        timings = []
+        for _ in range(keys):
+            start = time.perf_counter()
+            rsa.generate_keys(verbose=False)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = _latency_summary(timings)
+        print(f"   {name:<8}: media {results[name]['mean_ms']:8.1f} ms, max {results[name]['max_ms']:8.1f} ms")
+    return results
+
+
+def benchmark_crypto_throughput(bits=1024, iterations=50, text_sizes=(64, 1024, 16 * 1024)):
+    """Latenza di encrypt/decrypt su un blocco e throughput di encrypt_string/decrypt_string"""
+    rsa = RSAKeyGenerator(bits, workers=1)
+    public_key, private_key = rsa.generate_keys(verbose=False)
+    n = public_key[1]
+    numbers = [random.randrange(2, n) for _ in range(iterations)]
+    ciphertexts = [rsa.encrypt(number, public_key) for number in numbers]
+    
+    print(f"\n⏱️ Cifratura RSA, primi da {bits} bit")
+    results = {
+        'encrypt_us': _time_calls(lambda: [rsa.encrypt(number, public_key) for number in numbers], 1) * 1000 / iterations,
+        'decrypt_us': _time_calls(lambda: [rsa.decrypt(c, private_key) for c in ciphertexts], 1) * 1000 / iterations,
+    }
+    print(f"   blocco singolo: encrypt {results['encrypt_us']:.1f} µs, decrypt {results['decrypt_us']:.1f} µs")
+    
+    alphabet = string.ascii_letters + string.digits + " àèìòù.,"
+    for size in text_sizes:
+        text = ''.join(random.choices(alphabet, k=size))
+        size_kb = len(text.encode('utf-8')) / 1024
+        blocks = rsa.encrypt_string(text, public_key)
+        assert rsa.decrypt_string(blocks, private_key) == text
+        repeat = max(1, 3 * 1024 // size)                   # I testi brevi si ripetono per un tempo misurabile
+        encrypt_ms = _time_calls(lambda: rsa.encrypt_string(text, public_key), repeat)
+        decrypt_ms = _time_calls(lambda: rsa.decrypt_string(blocks, private_key), repeat)
+        results[f"string_{size}"] = {'blocks': len(blocks), 'encrypt_ms': encrypt_ms, 'decrypt_ms': decrypt_ms,
+                                     'encrypt_kb_s': size_kb / encrypt_ms * 1000,
+                                     'decrypt_kb_s': size_kb / decrypt_ms * 1000}
+        print(f"   testo da {size:6d} caratteri ({len(blocks):4d} blocchi): encrypt_string "
+              f"{results[f'string_{size}']['encrypt_kb_s']:8.1f} KB/s, decrypt_string "
+              f"{results[f'string_{size}']['decrypt_kb_s']:6.1f} KB/s")
+    return results
+
+
+def benchmark_signing(bits=1024, messages=100):
+    """Latenza di sign_message e di verify_signature (senza cache delle verifiche)"""
+    rsa = RSAKeyGenerator(bits, workers=1)
+    public_key, private_key = rsa.generate_keys(verbose=False)
+    authenticator = RSAAuthenticator(rsa, storage_file=None)
+    authenticator.signature_cache_size = 0                  # Ogni verifica fa l'operazione RSA
+    texts = [''.join(random.choices(string.ascii_letters + " ", k=random.randint(10, 200))) for _ in range(messages)]
+    
+    sign_ms, verify_ms = [], []
+    for text in texts:
+        start = time.perf_counter()
+        signature = authenticator.sign_message(text, private_key)
+        sign_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        assert authenticator.verify_signature(text, signature, public_key)
+        verify_ms.append((time.perf_counter() - start) * 1000)
+    
+    results = {'sign': _latency_summary(sign_ms), 'verify': _latency_summary(verify_ms)}
+    print(f"\n⏱️ Firme, primi da {bits} bit ({messages} messaggi)")
+    for name, summary in results.items():
+        print(f"   {name:<6} p50 {summary['p50_ms']:.3f} ms, p95 {summary['p95_ms']:.3f} ms")
+    return results
+
+
+def benchmark_handshake(clients=20, bits=1024, encryption_mode='hybrid'):
+    """Latenza di exchange_public_keys + handle_login contro un server su localhost"""
+    keys = RSAKeyGenerator(bits, workers=1).generate_keys(verbose=False)
+    print(f"\n⏱️ Handshake completo, {clients} client in sequenza, primi da {bits} bit")
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        server = _start_benchmark_server(directory, backlog=clients)
+        exchange_ms, login_ms, total_ms = [], [], []
+        for i in range(clients):
+            client, exchange, login = _connect_benchmark_client(server.port, f"utente{i}", keys,
+                                                               encryption_mode=encryption_mode)
+            exchange_ms.append(exchange)
+            login_ms.append(login)
+            total_ms.append(exchange + login)
+            client.cleanup()
+        server.cleanup()
+    
+    results = {'exchange_public_keys': _latency_summary(exchange_ms), 'handle_login': _latency_summary(login_ms),
+               'total': _latency_summary(total_ms)}
+    for name, summary in results.items():
+        print(f"   {name:<20} p50 {summary['p50_ms']:7.1f} ms, p95 {summary['p95_ms']:7.1f} ms")
+    return results
+
+
+def benchmark_fanout(client_counts=(10, 50), messages=20, bits=1024, timeout=30.0):
+    """Latenza di un broadcast fino all'ultimo dei destinatari, con N client su localhost"""
+    keys = RSAKeyGenerator(bits, workers=1).generate_keys(verbose=False)
+    print(f"\n⏱️ Fan-out dei broadcast ({messages} messaggi per configurazione, primi da {bits} bit)")
+    results = {}
+    for count in client_counts:
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            server = _start_benchmark_server(directory, backlog=count)
+            clients = [_connect_benchmark_client(server.port, f"utente{i}", keys)[0] for i in range(count)]
+            arrivals = collections.defaultdict(list)        # testo -> istanti di arrivo
+            arrived = threading.Condition()
+            
+            def receive(client):
+                while True:
+                    message_data = client.receive_json_message()
+                    if not message_data:
+                        return
+                    message = client.session_cipher.decrypt_message(message_data['payload'], client.codec)
+                    if message.get('message', '').startswith("fanout "):
+                        with arrived:
+                            arrivals[message['message']].append(time.perf_counter())
+                            arrived.notify_all()
+            
+            for client in clients[1:]:
+                threading.Thread(target=receive, args=(client,), daemon=True).start()
+            time.sleep(0.5)                                 # Liste utenti degli ultimi login già consegnate
+            
+            last_ms, receiver_ms = [], []
+            for i in range(messages):
+                text = f"fanout {i}"
+                start = time.perf_counter()
+                clients[0].send_encrypted_message(text)
+                with arrived:
+                    arrived.wait_for(lambda: len(arrivals[text]) >= count - 1, timeout)
+                    delays = [(moment - start) * 1000 for moment in arrivals[text]]
+                if len(delays) == count - 1:
+                    last_ms.append(max(delays))
+                receiver_ms.extend(delays)
+            
+            for client in clients:
+                client.cleanup()
+            server.cleanup()
+        
+        results[count] = {'last_receiver': _latency_summary(last_ms), 'per_receiver': _latency_summary(receiver_ms),
+                          'complete': len(last_ms)}
+        summary = results[count]['last_receiver']
+        print(f"   {count:4d} client: ultimo destinatario p50 {summary.get('p50_ms', float('nan')):7.1f} ms, "
+              f"p95 {summary.get('p95_ms', float('nan')):7.1f} ms ({len(last_ms)}/{messages} completi)")
+    return results
+
+
+def benchmark_modular_exponentiation(bits=1024, iterations=20):
+    """Micro-benchmark: ciclo bit a bit vs contesto a finestre vs pow() built-in"""
+    rsa = RSAKeyGenerator(bits, workers=1)
+    public_key, private_key = rsa.generate_keys()
+    d, n = private_key[0], private_key[1]
+    message = random.randrange(2, n)
+    _, _, p, q, dP, dQ, qInv = private_key
+    
+    def crt(power):
+        """Ricombinazione CRT con la funzione di esponenziazione indicata"""
+        m1 = power(message % p, dP, p)
+        m2 = power(message % q, dQ, q)
+        return m2 + ((qInv * (m1 - m2)) % p) * q
+    
+    cases = {
+        'pubblica (e, n)': (public_key,
+                            lambda: rsa.modular_exponentiation(message, public_key[0], n),
+                            lambda: pow(message, public_key[0], n)),
+        'privata (d, n)': ((d, n),
+                           lambda: rsa.modular_exponentiation(message, d, n),
+                           lambda: pow(message, d, n)),
+        'privata CRT': (private_key,
+                        lambda: crt(rsa.modular_exponentiation),
+                        lambda: crt(pow)),
+    }
+    
+    print(f"\n⏱️ Esponenziazione modulare, primi da {bits} bit ({iterations} iterazioni, ms/op)")
+    results = {}
+    for name, (key, loop_call, pow_call) in cases.items():
+        context = rsa.get_key_context(key)
+        timings = {
+            'loop': _time_calls(loop_call, iterations),
+            'context': _time_calls(lambda: context.apply(message), iterations),
+            'pow': _time_calls(pow_call, iterations),
+        }
+        results[name] = timings
+        print(f"   {name:<16} loop={timings['loop']:.3f}  contesto={timings['context']:.3f}  "
+              f"pow={timings['pow']:.3f}  speedup={timings['loop'] / timings['context']:.1f}x")
+    
+    return results
+
+
+def benchmark_prime_generation(key_sizes=(1024, 2048, 3072), primes=4):
+    """Confronta la ricerca casuale dei primi con quella incrementale a crivello"""
+    print(f"\n⏱️ Generazione primi: ricerca casuale vs crivello ({primes} primi per dimensione)")
+    results = {}
+    for key_size in key_sizes:
+        prime_bits = key_size // 2                          # n = p * q: due primi da metà dimensione
+        results[key_size] = {}
+        for mode, window in (('random', 0), ('sieve', 4096)):
+            rsa = RSAKeyGenerator(prime_bits, workers=1, sieve_window=window)
+            start = time.perf_counter()
+            for _ in range(primes):
+                rsa.generate_prime()
+            elapsed_ms = (time.perf_counter() - start) * 1000 / primes
+            
+            summary = rsa.prime_search_summary()
+            summary['ms_per_prime'] = elapsed_ms
+            results[key_size][mode] = summary
+            print(f"   chiave {key_size} bit, {mode:<6}: {elapsed_ms:8.1f} ms/primo, "
+                  f"{summary['candidates_per_prime']:7.1f} candidati/primo, "
+                  f"{summary['primality_tests_per_prime']:6.1f} test completi/primo")
+    
+    return results
+
+
+def benchmark_wire_formats(bits=1024, message_size=1024, iterations=200):
+    """Byte sul filo e tempi di codifica/decodifica: JSON vs formato binario"""
+    rsa = RSAKeyGenerator(bits, workers=1)
+    public_key, private_key = rsa.generate_keys()
+    text = ("Messaggio di prova con caratteri accentati: àèìòù. " * 50)[:message_size]
+    authenticator = RSAAuthenticator(rsa, storage_file=None)  # Solo per firmare: niente archivio utenti
+    cipher = SessionCipher(random.randbytes(SessionCipher.KEY_SIZE), SessionCipher.CLIENT)
+    
+    frames = {
+        'chiave': {'e': public_key[0], 'n': public_key[1], 'modes': ['hybrid', 'rsa'],
+                   'wire_formats': list(WIRE_CODECS)},
+        'chat RSA': {'blocks': rsa.encrypt_string(text, public_key),
+                     'signature': authenticator.sign_message(text, private_key),
+                     'sender': 'alice', 'signature_valid': True, 'type': 'broadcast'},
+        'chat ibrida': {'payload': cipher.encrypt_message({'message': text, 'sender': 'alice',
+                                                           'signature_valid': True, 'type': 'broadcast'})},
+    }
+    
+    print(f"\n⏱️ Formati dei messaggi, primi da {bits} bit, testo di {message_size} byte ({iterations} iterazioni)")
+    results = {}
+    for frame_name, frame in frames.items():
+        results[frame_name] = {}
+        for codec in WIRE_CODECS.values():
+            encoded = codec.encode(frame)
+            assert codec.decode(encoded) == frame
+            timings = {
+                'bytes': len(encoded),
+                'encode_us': _time_calls(lambda: codec.encode(frame), iterations) * 1000,
+                'decode_us': _time_calls(lambda: codec.decode(encoded), iterations) * 1000,
+            }
+            results[frame_name][codec.name] = timings
+            print(f"   {frame_name:<12} {codec.name:<8} {timings['bytes']:6d} byte  "
+                  f"codifica={timings['encode_us']:7.1f} µs  decodifica={timings['decode_us']:7.1f} µs")
+    
+    return results
+
+
+def benchmark_user_store(users=100_000, bits=1024, batch_size=1000):
+    """Registrazione di massa: users.pkl riscritto a ogni utente vs archivio SQLite"""
+    names = [f"utente{i:06d}" for i in range(users)]
+    keys = [(65537, random.getrandbits(bits) | (1 << (bits - 1)) | 1) for _ in range(users)]
+    print(f"\n⏱️ Registrazione di {users} utenti (chiavi da {bits} bit)")
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # Vecchio formato: ogni registrazione riscrive l'intero dizionario
+        legacy = dict(zip(names, keys))
+        legacy_file = os.path.join(directory, "users.pkl")
+        
+        def rewrite_pickle():
+            with open(legacy_file, 'wb') as f:
+                pickle.dump(legacy, f)
+        
+        rewrite_ms = _time_calls(rewrite_pickle, 3)
+        results['pickle_rewrite_ms_at_size'] = rewrite_ms
+        results['pickle_total_s_estimate'] = rewrite_ms * users / 2 / 1000  # Costo medio: metà dimensione
+        print(f"   users.pkl: {rewrite_ms:.1f} ms per registrazione con {users} utenti "
+              f"(~{results['pickle_total_s_estimate']:.0f} s per registrarli uno alla volta)")
+        
+        store = UserStore(os.path.join(directory, "single.db"), legacy_file=None)
+        start = time.perf_counter()
+        for name, key in zip(names, keys):
+            store.add(name, key)
+        elapsed = time.perf_counter() - start
+        results['sqlite_single_us'] = elapsed * 1e6 / users
+        results['sqlite_single_total_s'] = elapsed
+        print(f"   SQLite, una transazione per utente: {results['sqlite_single_us']:.1f} µs/utente ({elapsed:.1f} s)")
+        
+        batch_store = UserStore(os.path.join(directory, "batch.db"), legacy_file=None)
+        start = time.perf_counter()
+        for offset in range(0, users, batch_size):
+            batch_store.add_many(zip(names[offset:offset + batch_size], keys[offset:offset + batch_size]))
+        elapsed = time.perf_counter() - start
+        results['sqlite_batch_us'] = elapsed * 1e6 / users
+        print(f"   SQLite, lotti da {batch_size}: {results['sqlite_batch_us']:.1f} µs/utente ({elapsed:.1f} s)")
+        
+        store.cache.clear()
+        lookups = random.sample(names, min(users, 10_000))
+        results['sqlite_lookup_us'] = _time_calls(lambda: store.get(random.choice(lookups)), len(lookups)) * 1000
+        print(f"   Ricerca di una chiave: {results['sqlite_lookup_us']:.1f} µs")
+        
+        # Migrazione dal vecchio formato e avvio: nessun caricamento completo in memoria
+        start = time.perf_counter()
+        migrated = UserStore(os.path.join(directory, "migrated.db"), legacy_file=legacy_file)
+        results['migration_s'] = time.perf_counter() - start
+        start = time.perf_counter()
+        UserStore(os.path.join(directory, "migrated.db"), legacy_file=None).get(names[-1])
+        results['reopen_ms'] = (time.perf_counter() - start) * 1000
+        print(f"   Migrazione da users.pkl: {results['migration_s']:.1f} s, "
+              f"riapertura + prima ricerca: {results['reopen_ms']:.1f} ms")
+        for opened in (store, batch_store, migrated):
+            opened.close()
+    
+    return results
+
+
+def benchmark_session_expiry(session_counts=(1_000, 10_000, 100_000), sweep_interval=5.0, sweeps=20):
+    """Costo di una sweep periodica con il min-heap rispetto a una scansione completa delle sessioni"""
+    print(f"\n⏱️ Scadenza delle sessioni: {sweeps} sweep ogni {sweep_interval:.0f} s")
+    results = {}
+    for count in session_counts:
+        authenticator = RSAAuthenticator(None, storage_file=None)
+        timeout = authenticator.session_timeout
+        start = time.perf_counter()
+        for i in range(count):
+            authenticator.verify_challenge_response(f"utente{i}", i, i)
+        insert_us = (time.perf_counter() - start) * 1e6 / count
+        
+        # Stato a regime: ultime attività distribuite uniformemente nell'ultima ora
+        now = time.time()
+        authenticator.authenticated_users = {f"utente{i}": now - timeout * i / count for i in range(count)}
+        authenticator.scheduled_deadlines = {username: last_seen + timeout
+                                             for username, last_seen in authenticator.authenticated_users.items()}
+        authenticator.expiry_heap = sorted(
+            (deadline, username) for username, deadline in authenticator.scheduled_deadlines.items()
+        )                                                   # Una lista ordinata è già un min-heap
+        
+        sweep_ms = []
+        expired = 0
+        for sweep in range(1, sweeps + 1):
+            expired += len(authenticator.expire_sessions(now + sweep * sweep_interval))
+            sweep_ms.append(authenticator.expiry_stats['last_sweep_ms'])
+        scan_ms = _time_calls(lambda: [username for username, last_seen in authenticator.authenticated_users.items()
+                                       if last_seen + timeout <= now], 5)
+        
+        results[count] = {'insert_us': insert_us, 'sweep_ms': sum(sweep_ms) / sweeps, 'max_sweep_ms': max(sweep_ms),
+                          'expired_per_sweep': expired / sweeps, 'full_scan_ms': scan_ms}
+        print(f"   {count:>7} sessioni: inserimento {insert_us:.2f} µs, sweep {results[count]['sweep_ms']:.3f} ms "
+              f"({results[count]['expired_per_sweep']:.0f} scadute), scansione completa {scan_ms:.2f} ms")
+    return results
+
+
+def benchmark_reconnect_storm(clients=50, bits=1024):
+    """Tutti i client si riconnettono insieme: login completo vs ripresa con ticket"""
+    keys = RSAKeyGenerator(bits, workers=1).generate_keys(verbose=False)  # Stessa coppia per tutti i client
+    print(f"\n⏱️ Tempesta di riconnessioni: {clients} client, primi da {bits} bit")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        server = _start_benchmark_server(directory, backlog=clients)
+        users = [_connect_benchmark_client(server.port, f"utente{i}", keys)[0] for i in range(clients)]
+        
+        def storm(reconnect):
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                start = time.perf_counter()
+                succeeded = sum(executor.map(lambda client: bool(reconnect(client)), users))
+                return succeeded, time.perf_counter() - start
+        
+        def full_login(client):
+            client.resume_ticket = None
+            return client.reconnect()
+        
+        for name, reconnect in (('login', full_login), ('ripresa', RSAClient.reconnect)):
+            succeeded, elapsed = storm(reconnect)
+            results[name] = {'succeeded': succeeded, 'seconds': elapsed, 'per_second': succeeded / elapsed}
+        results['tickets'] = server.tickets.get_stats()
+        
+        for client in users:
+            client.cleanup()
+        server.cleanup()
+    
+    for name in ('login', 'ripresa'):
+        print(f"   {name:<8} {results[name]['succeeded']}/{clients} riconnessi in {results[name]['seconds']:.2f} s "
+              f"({results[name]['per_second']:.0f} riconnessioni/s)")
+    return results
+
+
+def benchmark_signature_cache(bits=1024, messages=200, batch_size=16):
+    """Verifica delle firme: senza cache, con messaggi ripetuti in cache, a lotti"""
+    rsa = RSAKeyGenerator(bits, workers=1)
+    public_key, private_key = rsa.generate_keys(verbose=False)
+    signer = RSAAuthenticator(rsa, storage_file=None)
+    signed = [(text, signer.sign_message(text, private_key), public_key)
+              for text in (f"stato del bot numero {i}" for i in range(messages))]
+    
+    print(f"\n⏱️ Verifica delle firme, primi da {bits} bit ({messages} messaggi, µs/firma)")
+    results = {}
+    cold = RSAAuthenticator(rsa, storage_file=None)
+    cold.signature_cache_size = 0                           # Nessuna voce trattenuta: sempre miss
+    results['uncached_us'] = _time_calls(lambda: [cold.verify_signature(*item) for item in signed], 3) * 1000 / messages
+    
+    warm = RSAAuthenticator(rsa, storage_file=None)
+    warm.verify_signatures(signed)
+    results['cached_us'] = _time_calls(lambda: [warm.verify_signature(*item) for item in signed], 3) * 1000 / messages
+    
+    batches = [signed[i:i + batch_size] for i in range(0, messages, batch_size)]
+    results['batch_cached_us'] = _time_calls(lambda: [warm.verify_signatures(batch) for batch in batches], 3) * 1000 / messages
+    results['stats'] = warm.get_signature_stats()
+    print(f"   senza cache {results['uncached_us']:.1f}  in cache {results['cached_us']:.1f}  "
+          f"in cache a lotti da {batch_size} {results['batch_cached_us']:.1f}")
+    return results
+
+
+def _chat_corpora():
+    """Testi di prova tipici di una chat: righe brevi, log incollati, JSON, testo ripetuto"""
+    log_lines = [
+        f"2024-05-{day:02d} 12:{minute:02d}:07 INFO server: client 127.0.0.1:{50000 + minute} autenticato, "
+        f"latenza {minute * 3 % 97} ms"
+        for day in range(1, 4) for minute in range(0, 60, 3)
+    ]
+    json_snippet = json.dumps([
+        {'id': i, 'utente': f"utente{i}", 'stato': 'online' if i % 3 else 'assente', 'messaggi': i * 7}
+        for i in range(40)
+    ], indent=2)
+    return {
+        'riga breve': "Ciao a tutti, ci vediamo alle 18 per la riunione?",
+        'paragrafo': ("Ho controllato la configurazione del server e sembra tutto a posto: le chiavi vengono "
+                      "caricate all'avvio, i client si riconnettono senza problemi e i log non mostrano errori. "
+                      "Domani provo con più utenti contemporaneamente per vedere come si comporta sotto carico."),
+        'log incollato': "\n".join(log_lines),
+        'JSON': json_snippet,
+        'testo ripetuto': "ok! " * 300,
+    }
+
+
+def benchmark_compression(bits=1024):
+    """Blocchi RSA e tempo di cifratura + decifratura con e senza compressione"""
+    rsa = RSAKeyGenerator(bits, workers=1)
+    public_key, private_key = rsa.generate_keys(verbose=False)
+    print(f"\n⏱️ Compressione prima della cifratura, primi da {bits} bit")
+    corpora = _chat_corpora()
+    results = {}
+    for name, text in corpora.items():
+        plain_blocks = rsa.encrypt_string(text, public_key)
+        blocks, compressed = rsa.encrypt_text(text, public_key)
+        assert rsa.decrypt_string(blocks, private_key, compressed) == text
+        results[name] = {'bytes': len(text.encode('utf-8')), 'blocks_plain': len(plain_blocks),
+                         'blocks_compressed': len(blocks), 'compressed': compressed}
+    summary = rsa.compression_summary()                     # Una cifratura per testo, prima delle misure
+
+    def round_trip(text):
+        blocks, compressed = rsa.encrypt_text(text, public_key)
+        return rsa.decrypt_string(blocks, private_key, compressed)
+
+    for name, text in corpora.items():
+        result = results[name]
+        result['plain_ms'] = _time_calls(lambda: rsa.decrypt_string(rsa.encrypt_string(text, public_key), private_key), 3)
+        result['compressed_ms'] = _time_calls(lambda: round_trip(text), 3)
+        print(f"   {name:<15} {result['bytes']:6d} byte: {result['blocks_plain']:3d} -> {result['blocks_compressed']:3d} "
+              f"blocchi, {result['plain_ms']:7.1f} -> {result['compressed_ms']:7.1f} ms")
+    results['summary'] = summary
+    print(f"   Blocchi risparmiati per messaggio: {results['summary']['blocks_saved_per_message']:.1f}")
+    return results
+
+
+def benchmark_streaming(bits=1024, size_mb=0.25, memory_mb=4.0):
+    """
+    Cifratura e decifratura di un file in streaming (MB/s) e picco di memoria
+    della cifratura di memory_mb MB su file rispetto alla lista dei blocchi
+    """
+    rsa = RSAKeyGenerator(bits, workers=1)
+    public_key, private_key = rsa.generate_keys(verbose=False)
+    print(f"\n⏱️ Cifratura in streaming, primi da {bits} bit")
+    
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        plain_path = os.path.join(directory, "dati")
+        cipher_path = os.path.join(directory, "dati.rsa")
+        output_path = os.path.join(directory, "dati.out")
+        with open(plain_path, 'wb') as f:
+            f.write(random.randbytes(int(size_mb * 1024 * 1024)))
+        
+        start = time.perf_counter()
+        with open(plain_path, 'rb') as source, open(cipher_path, 'wb') as destination:
+            rsa.encrypt_file(source, destination, public_key)
+        encrypt_s = time.perf_counter() - start
+        start = time.perf_counter()
+        with open(cipher_path, 'rb') as source, open(output_path, 'wb') as destination:
+            rsa.decrypt_file(source, destination, private_key)
+        decrypt_s = time.perf_counter() - start
+        with open(plain_path, 'rb') as original, open(output_path, 'rb') as decrypted:
+            assert original.read() == decrypted.read()
+        results['encrypt_mb_s'] = size_mb / encrypt_s
+        results['decrypt_mb_s'] = size_mb / decrypt_s
+        print(f"   {size_mb:g} MB: cifratura {results['encrypt_mb_s']:.2f} MB/s, "
+              f"decifratura {results['decrypt_mb_s']:.3f} MB/s")
+        
+        # Memoria: la cifratura su file resta piatta, la lista cresce con il payload
+        with open(plain_path, 'wb') as f:
+            f.write(random.randbytes(int(memory_mb * 1024 * 1024)))
+        tracemalloc.start()
+        with open(plain_path, 'rb') as source, open(cipher_path, 'wb') as destination:
+            rsa.encrypt_file(source, destination, public_key)
+        results['stream_peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.reset_peak()
+        with open(plain_path, 'rb') as source:
+            blocks = list(rsa.encrypt_stream(source, public_key))
+        results['list_peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+        del blocks
+    
+    print(f"   {memory_mb:g} MB: picco di memoria {results['stream_peak_kb']:.0f} KB su file, "
+          f"{results['list_peak_kb']:.0f} KB in lista")
+    return results
+
+
+def benchmark_file_transfer(size_mb=16, chunk_sizes=(16 * 1024, 32 * 1024, 64 * 1024), bits=1024,
+                            encryption_mode='hybrid'):
+    """Throughput di /sendfile tra due client su localhost, attraverso il relay del server"""
+    keys = RSAKeyGenerator(bits, workers=1).generate_keys(verbose=False)  # Stessa coppia per i due client
+    print(f"\n⏱️ Trasferimento di un file da {size_mb} MB, modalità {encryption_mode}, primi da {bits} bit")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        server = _start_benchmark_server(directory)
+        clients = [
+            _connect_benchmark_client(server.port, username, keys, encryption_mode=encryption_mode,
+                                      download_dir=os.path.join(directory, "download"), accept_files=True,
+                                      max_file_size=size_mb * 1024 * 1024)[0]
+            for username in ("mittente", "destinatario")
+        ]
+        for client in clients:
+            threading.Thread(target=client.receive_messages, daemon=True).start()
+        sender, _ = clients
+        
+        path = os.path.join(directory, "dati.bin")
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(random.randbytes(1024 * 1024))
+        
+        for chunk_size in chunk_sizes:
+            start = time.perf_counter()
+            succeeded = sender.send_file("destinatario", path, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - start
+            results[chunk_size] = {'succeeded': succeeded, 'seconds': elapsed, 'mb_s': size_mb / elapsed}
+        results['relay'] = server.file_relay.get_stats()
         
+        for client in clients:
+            client.cleanup()
+        server.cleanup()
+    
+    for chunk_size in chunk_sizes:
+        result = results[chunk_size]
+        print(f"   chunk da {chunk_size // 1024:3d} KB: {result['mb_s']:6.2f} MB/s"
+              f"{'' if result['succeeded'] else ' (non riuscito)'}")
+    return results
+
+
+BENCHMARKS = {
+    'modexp': benchmark_modular_exponentiation,
+    'primes': benchmark_prime_generation,
+    'wire': benchmark_wire_formats,
+    'users': benchmark_user_store,
+    'sessions': benchmark_session_expiry,
+    'reconnect': benchmark_reconnect_storm,
+    'signatures': benchmark_signature_cache,
+    'compression': benchmark_compression,
+    'stream': benchmark_streaming,
+    'files': benchmark_file_transfer,
+    'keygen': benchmark_key_generation,
+    'keygen-parallel': benchmark_parallel_key_generation,
+    'crypto': benchmark_crypto_throughput,
+    'signing': benchmark_signing,
+    'handshake': benchmark_handshake,
+    'fanout': benchmark_fanout,
+}
+
+
+def run_benchmarks(names=None, seed=None, output=None, compare=None):
+    """
+    Esegue i benchmark richiesti (tutti se names è vuoto). Con seed il generatore
+    casuale viene reinizializzato prima di ogni benchmark, così chiavi (ricerca
+    seriale) e dati di prova sono gli stessi a ogni esecuzione, in qualunque
+    ordine. output: file JSON dei risultati; compare: risultati JSON precedenti
+    con cui confrontare questa esecuzione.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f"❌ Benchmark sconosciuto: {name} (disponibili: {', '.join(BENCHMARKS)})")
+            continue
+        if seed is not None:
+            random.seed(f"{seed}:{name}")
+        results[name] = BENCHMARKS[name]()
+    
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'seed': seed,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    # Passaggio per JSON: chiavi intere come stringhe, come nel file salvato
+    report = json.loads(json.dumps(report, default=str))
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Risultati salvati in {output}")
+    if compare:
+        with open(compare, encoding='utf-8') as f:
+            print_benchmark_comparison(json.load(f), report)
+    return report
+
+
+def _numeric_leaves(data, prefix=""):
+    """Valori numerici di risultati annidati, indicizzati per percorso (es. 'crypto.encrypt_us')"""
+    leaves = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            leaves.update(_numeric_leaves(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            leaves[path] = value
+    return leaves
+
+
+def compare_benchmark_results(baseline, current) -> dict:
+    """Variazione percentuale di ogni valore presente in entrambi i report: percorso -> (prima, dopo, %)"""
+    before = _numeric_leaves(baseline.get('results', {}))
+    after = _numeric_leaves(current.get('results', {}))
+    return {
+        path: (before[path], after[path], (after[path] - before[path]) / before[path] * 100 if before[path] else None)
+        for path in before.keys() & after.keys()
+    }
+
+
+def print_benchmark_comparison(baseline, current):
+    """Stampa le differenze tra due report di benchmark"""
+    changes = compare_benchmark_results(baseline, current)
+    print(f"\n📊 Confronto con i risultati del {baseline.get('meta', {}).get('timestamp', '?')} "
+          f"({len(changes)} valori in comune)")
+    for path in sorted(changes):
+        before, after, change = changes[path]
+        change_text = "   n/d" if change is None else f"{change:+6.1f}%"
+        print(f"   {path:<60} {before:>12.4g} -> {after:>12.4g}  {change_text}")
+
+
+def build_argument_parser():
+    """Parser della riga di comando (senza argomenti si usa il menu interattivo)"""
+    parser = argparse.ArgumentParser(description="Sistema chat RSA multi-client")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    server_parser = commands.add_parser('server', help="Avvia il server")
+    server_parser.add_argument('--host', default='localhost')
+    server_parser.add_argument('--port', type=int, default=12345)
+    server_parser.add_argument('--async', dest='async_mode', action='store_true',
+                               help="Usa il server asyncio invece di un thread per client")
+    server_parser.add_argument('--backlog', type=int, default=5, help="Connessioni in coda per listen()")
+    server_parser.add_argument('--queue-size', type=int, default=256,
+                               help="Messaggi massimi per corsia nella coda di uscita di ogni client")
+    server_parser.add_argument('--queue-policy', choices=OutboundQueue.POLICIES, default='drop_oldest',
+                               help="Comportamento quando la coda di uscita di un client è piena")
+    server_parser.add_argument('--metrics-port', type=int, default=None,
+                               help="Porta dell'endpoint delle metriche su 127.0.0.1 (disattivato se omessa)")
+    server_parser.add_argument('--admin', action='append', default=[], dest='admins',
+                               help="Utente che può usare /stats (ripetibile)")
+    server_parser.add_argument('--profile', nargs='?', const='all', default=None,
+                               help="Profilazione: cpu, memory, trace separati da virgole o all "
+                                    f"(senza opzione si usa {ServerProfiler.ENV_VAR})")
+    server_parser.add_argument('--profile-dir', default=None, help="Directory dei risultati della profilazione")
+    server_parser.add_argument('--keygen-workers', type=int, default=1,
+                               help="Processi per la ricerca dei primi della chiave generata all'avvio (0 = tutti i core)")
+
+    client_parser = commands.add_parser('client', help="Avvia il client")
+    client_parser.add_argument('--host', default='localhost')
+    client_parser.add_argument('--port', type=int, default=12345)
+    client_parser.add_argument('--username', default=None)
+    client_parser.add_argument('--accept-files', action='store_true',
+                               help="Accetta i file in arrivo (attivabile anche con /files on)")
+    client_parser.add_argument('--max-file-size', type=int, default=RSAClient.MAX_FILE_SIZE // (1024 * 1024),
+                               help="Dimensione massima in MB di un file ricevuto")
+    client_parser.add_argument('--keygen-workers', type=int, default=1,
+                               help="Processi per la ricerca dei primi delle nuove chiavi (0 = tutti i core)")
+    client_parser.add_argument('--key-pool', nargs='?', const=RSAKeyPool.DEFAULT_POOL_FILE, default=None,
+                               help="Prende le nuove chiavi da un pool pregenerato in background "
+                                    f"(file predefinito: {RSAKeyPool.DEFAULT_POOL_FILE})")
+    
+    load_parser = commands.add_parser('load', help="Genera carico con utenti sintetici")
+    load_parser.add_argument('--host', default='localhost')
+    load_parser.add_argument('--port', type=int, default=12345)
+    load_parser.add_argument('--users', type=int, default=100, help="Utenti sintetici da connettere")
+    load_parser.add_argument('--rate', type=float, default=10.0, help="Messaggi al secondo (in totale)")
+    load_parser.add_argument('--duration', type=float, default=30.0, help="Durata del traffico in secondi")
+    load_parser.add_argument('--private', type=float, default=0.2, dest='private_share',
+                             help="Quota di messaggi privati (0-1)")
+    load_parser.add_argument('--concurrency', type=int, default=32, help="Connessioni aperte in parallelo")
+    load_parser.add_argument('--keypairs', type=int, default=4, help="Coppie di chiavi condivise dagli utenti")
+    load_parser.add_argument('--mode', choices=('hybrid', 'rsa'), default='hybrid', dest='encryption_mode')
+    load_parser.add_argument('--seed', type=int, default=1234, help="Seed della scelta di mittenti e destinatari")
+    load_parser.add_argument('--keys-file', default=None,
+                             help="File delle chiavi degli utenti sintetici (predefinito carico_keys.pkl)")
+    load_parser.add_argument('--local', action='store_true', help="Avvia un server locale nello stesso processo")
+    load_parser.add_argument('--output', default=None, help="File JSON in cui salvare i risultati")
+    
+    bench_parser = commands.add_parser('bench', help="Esegue i benchmark")
+    bench_parser.add_argument('names', nargs='*', help=f"Benchmark da eseguire ({', '.join(BENCHMARKS)})")
+    bench_parser.add_argument('--seed', type=int, default=1234, help="Seed del generatore casuale (riproducibilità)")
+    bench_parser.add_argument('--output', default=None, help="File JSON in cui salvare i risultati")
+    bench_parser.add_argument('--compare', default=None, help="File JSON di una esecuzione precedente da confrontare")
+    
+    return parser
+
+
+def run_command_line(argv):
+    """Esegue il comando indicato sulla riga di comando"""
+    args = build_argument_parser().parse_args(argv)
+    
+    if args.command == 'server':
+        run_server(args.async_mode, host=args.host, port=args.port, backlog=args.backlog,
+                   outbound_queue_size=args.queue_size, outbound_policy=args.queue_policy,
+                   metrics_port=args.metrics_port, admins=args.admins, profile=args.profile,
+                   profile_dir=args.profile_dir, keygen_workers=args.keygen_workers or None)
+    elif args.command == 'client':
+        keygen_workers = args.keygen_workers or None
+        key_pool = None
+        if args.key_pool:
+            key_pool = RSAKeyPool(pool_file=args.key_pool,
+                                  startup_generator=RSAKeyGenerator(workers=keygen_workers))
+        run_client(host=args.host, port=args.port, username=args.username, accept_files=args.accept_files,
+                   max_file_size=args.max_file_size * 1024 * 1024, keygen_workers=keygen_workers,
+                   key_pool=key_pool)
+    elif args.command == 'load':
+        run_load(args.host, args.port, args.users, args.rate, args.duration, args.private_share, args.concurrency,
+                 args.keypairs, encryption_mode=args.encryption_mode, seed=args.seed, local=args.local,
+                 output=args.output, keys_file=args.keys_file)
+    elif args.command == 'bench':
+        run_benchmarks(args.names, seed=args.seed, output=args.output, compare=args.compare)
+
+
 if __name__ == "__main__":
+    # Uso non interattivo: python client-serverRSA.py {server,client,bench} ...
+    if len(sys.argv) > 1:
+        run_command_line(sys.argv[1:])
+        sys.exit(0)
+    
     print("🚀 === SISTEMA CHAT RSA MULTI-CLIENT ===")
     print("1. Avvia Server")
     print("2. Avvia Client")